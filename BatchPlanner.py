@@ -0,0 +1,296 @@
+"""
+This file holds the batch planner, which plans paths on many classroom images at once, for example every room of a
+building. Each image is one job: its hull detection, triangulation and routing run in a worker process of a
+ProcessPoolExecutor, and only NumPy arrays come back to the main process, never Shapely or networkx objects.
+
+A job that raises is reported as failed with its error and the batch goes on. A worker that dies, for example on a
+crash inside GEOS, breaks the whole pool, so the jobs caught in it are run again and a job that breaks the pool
+twice is run on its own, where it can only take itself down.
+
+The results are written to a JSON lines file, one line per image, or a .npz archive the arrays of each image are
+added to as soon as it is done:
+
+    python BatchPlanner.py sample_classrooms --pair 10 10 500 300 --output results.jsonl
+    python BatchPlanner.py --manifest building.jsonl --workers 8 --output results.npz
+
+A manifest is a JSON lines file with one image per line, {"image": "room.png", "pairs": [[sx, sy, gx, gy], ...]}.
+"""
+
+import json
+import os
+import sys
+import time
+import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from ConvexHullObstacles import IMAGE_EXTENSIONS
+
+
+def jobsFromDirectory(directory, pairs=None, randomPairs=0, seed=0):
+    """
+    Makes a job for every image in a folder, in name order.
+
+    Parameters:
+    directory: str
+    This is the folder of classroom images.
+
+    pairs: numpy.ndarray, optional
+    This is a (k,4) array of (sx, sy, gx, gy) start and goal points planned on every image.
+
+    randomPairs: int
+    This is a number of random start and goal points drawn inside each image, planned as well as pairs.
+
+    seed: int
+    This is the seed of the random points, each image gets its own stream from it.
+
+    Returns:
+    list[dict]
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [{"image": os.path.join(directory, name), "pairs": pairs, "randomPairs": randomPairs, "seed": seed + i}
+            for i, name in enumerate(names)]
+
+
+def jobsFromManifest(path):
+    """
+    Reads the jobs of a JSON lines manifest, one {"image": ..., "pairs": [[sx, sy, gx, gy], ...]} per line.
+    A line may also hold "randomPairs" and "seed", see jobsFromDirectory(). Relative image paths are relative to
+    the folder of the manifest.
+
+    Returns:
+    list[dict]
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            jobs.append({"image": os.path.join(base, entry["image"]), "pairs": entry.get("pairs"),
+                         "randomPairs": entry.get("randomPairs", 0), "seed": entry.get("seed", len(jobs))})
+    return jobs
+
+
+def planImage(job, params=None, method="astar", cacheDir=None):
+    """
+    Runs one job: detects the hulls of the image, builds its navigation mesh and plans every start and goal pair.
+    This is what the worker processes run, and it never raises, a failure is returned as the "error" of the result.
+
+    Parameters:
+    job: dict
+    This is a job from jobsFromDirectory() or jobsFromManifest().
+
+    params: dict, optional
+    These are obstacle detection parameters overriding ConvexHullObstacles.DETECTION_PARAMS.
+
+    method: str
+    This is the search method of the Planner, see Planner.SEARCH_METHODS.
+
+    cacheDir: str, optional
+    This is the folder of a MeshCache shared by the workers.
+
+    Returns:
+    dict
+    This holds the "image" path, "ok", the "error" message of a failed job, the number of "hulls" and
+    "triangles", the "seconds" the job took, and the arrays of the paths: "pairs" (k,4) of the planned points,
+    "coords" (n,2) of the waypoints of all paths one after the other, "offsets" (k+1,) where path i is
+    coords[offsets[i]:offsets[i+1]], and "costs" (k,) of the path lengths, NaN where the goal can't be reached.
+    """
+    begin = time.perf_counter()
+    result = {"image": job["image"], "ok": False, "error": None, "hulls": 0, "triangles": 0}
+    try:
+        import networkx as nx
+        from MeshCache import MeshCache
+        from Planner import Environment, Planner
+
+        env = Environment(job["image"], params=params, cache=MeshCache(cacheDir) if cacheDir else None)
+        planner = Planner(env, method)
+        pairs = np.asarray(job.get("pairs") if job.get("pairs") is not None else np.zeros((0, 4)),
+                           dtype=float).reshape(-1, 4)
+        if job.get("randomPairs"):
+            rng = np.random.default_rng(job.get("seed", 0))
+            drawn = rng.uniform(0, 1, (job["randomPairs"], 4)) * [env.width, env.height, env.width, env.height]
+            pairs = np.concatenate([pairs, drawn])
+
+        mesh = env.navMesh
+        starts = planner.snapMany(pairs[:, :2])
+        goals = planner.snapMany(pairs[:, 2:])
+        paths = []
+        costs = np.full(len(pairs), np.nan)
+        for i, (startCent, endCent) in enumerate(zip(starts.tolist(), goals.tolist())):
+            try:
+                nodes = planner.searchNodes(startCent, endCent)
+            except nx.NetworkXNoPath:
+                paths.append(np.zeros((0, 2)))
+                continue
+            coords = mesh.centroids[nodes]
+            paths.append(coords)
+            costs[i] = np.hypot(*np.diff(coords, axis=0).T).sum()
+
+        result.update(ok=True, hulls=len(env.hulls), triangles=len(mesh), pairs=pairs, costs=costs,
+                      coords=np.concatenate(paths) if paths else np.zeros((0, 2)),
+                      offsets=np.concatenate([[0], np.cumsum([len(path) for path in paths])]).astype(np.int64))
+    except Exception as e:
+        result["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+    result["seconds"] = time.perf_counter() - begin
+    return result
+
+
+def _failed(job, error):
+    return {"image": job["image"], "ok": False, "error": error, "hulls": 0, "triangles": 0, "seconds": 0.0}
+
+
+def runBatch(jobs, workers=None, params=None, method="astar", cacheDir=None):
+    """
+    Runs the jobs across a pool of worker processes.
+
+    Parameters:
+    jobs: list[dict]
+    These are the jobs, from jobsFromDirectory() or jobsFromManifest().
+
+    workers: int, optional
+    This is the number of worker processes, by default the number of CPUs.
+
+    params, method, cacheDir:
+    These are passed on to planImage().
+
+    Returns:
+    generator of tuple[int, dict]
+    This yields the index of each job and its result from planImage(), in the order the jobs finish.
+    """
+    strikes = [0] * len(jobs)
+    queue = list(range(len(jobs)))
+    while queue:
+        # a job that broke the pool twice is run alone, in its own pool, so it can't take other jobs down with it
+        alone = [i for i in queue if strikes[i] >= 2]
+        shared = [i for i in queue if strikes[i] < 2]
+        rounds = ([shared] if shared else []) + [[i] for i in alone]
+        queue = []
+        for group in rounds:
+            with ProcessPoolExecutor(max_workers=1 if len(group) == 1 else workers) as pool:
+                futures = {pool.submit(planImage, jobs[i], params, method, cacheDir): i for i in group}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        yield i, future.result()
+                    except BrokenProcessPool:
+                        strikes[i] += 1
+                        if strikes[i] > 2:
+                            yield i, _failed(jobs[i], "worker process died while planning this image")
+                        else:
+                            queue.append(i)
+
+
+class ResultWriter:
+    """
+    Streams the results of a batch to a file as they come in.
+
+    Parameters:
+    path: str
+    This is the output file. A path ending in .npz is written as a NumPy archive, in which the arrays of job i
+    are named "<i>/coords", "<i>/offsets", "<i>/costs" and "<i>/pairs", and the "images", "ok", "errors",
+    "hulls", "triangles" and "seconds" of all the jobs are added when the writer is closed. Any other path is
+    written as JSON lines, one line per job with its paths as lists of [x, y] waypoints.
+    """
+
+    ARRAY_NAMES = ("coords", "offsets", "costs", "pairs")
+
+    def __init__(self, path):
+        self.path = path
+        self.npz = path.endswith(".npz")
+        self.summary = {}
+        if self.npz:
+            self._zip = zipfile.ZipFile(path, "w", allowZip64=True)
+        else:
+            self._file = open(path, "w")
+
+    def write(self, index, result):
+        self.summary[index] = result
+        if self.npz:
+            for name in self.ARRAY_NAMES:
+                if name in result:
+                    self._writeArray(str(index) + "/" + name, result[name])
+            return
+        record = {key: value for key, value in result.items() if key not in self.ARRAY_NAMES}
+        record["index"] = index
+        if result["ok"]:
+            bounds = result["offsets"].tolist()
+            record["pairs"] = result["pairs"].tolist()
+            record["costs"] = [None if np.isnan(cost) else cost for cost in result["costs"].tolist()]
+            record["paths"] = [result["coords"][lo:hi].tolist() for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def _writeArray(self, name, arr):
+        with self._zip.open(name + ".npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(arr), allow_pickle=False)
+
+    def close(self):
+        if self.npz:
+            order = sorted(self.summary)
+            results = [self.summary[i] for i in order]
+            self._writeArray("index", np.asarray(order, dtype=np.int64))
+            self._writeArray("images", np.asarray([r["image"] for r in results], dtype=str))
+            self._writeArray("ok", np.asarray([r["ok"] for r in results], dtype=bool))
+            self._writeArray("errors", np.asarray([r["error"] or "" for r in results], dtype=str))
+            for name in ("hulls", "triangles", "seconds"):
+                self._writeArray(name, np.asarray([r[name] for r in results]))
+            self._zip.close()
+        else:
+            self._file.close()
+
+
+def main(argv=None):
+    import argparse
+
+    from Planner import Planner
+
+    parser = argparse.ArgumentParser(description="Plans paths on many classroom images in parallel.")
+    parser.add_argument("directory", nargs="?", help="folder of classroom images")
+    parser.add_argument("--manifest", help="JSON lines file of images and their start/goal pairs")
+    parser.add_argument("--pair", type=float, nargs=4, action="append", metavar=("SX", "SY", "GX", "GY"),
+                        help="start and goal point planned on every image of the folder, can be repeated")
+    parser.add_argument("--random-pairs", type=int, default=0, help="random start/goal pairs planned on every image")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="number of worker processes, by default the number of CPUs")
+    parser.add_argument("--method", default="astar", choices=Planner.SEARCH_METHODS)
+    parser.add_argument("--cache", help="folder of a mesh cache shared by the workers")
+    parser.add_argument("--output", default="results.jsonl", help="results file, .jsonl or .npz")
+    args = parser.parse_args(argv)
+    if (args.directory is None) == (args.manifest is None):
+        parser.error("give either a folder of images or --manifest")
+
+    if args.manifest:
+        jobs = jobsFromManifest(args.manifest)
+    else:
+        jobs = jobsFromDirectory(args.directory, args.pair, args.random_pairs, args.seed)
+
+    writer = ResultWriter(args.output)
+    begin = time.perf_counter()
+    done = failed = queries = 0
+    try:
+        for index, result in runBatch(jobs, args.workers, method=args.method, cacheDir=args.cache):
+            writer.write(index, result)
+            done += 1
+            failed += not result["ok"]
+            queries += len(result.get("costs", ()))
+            elapsed = time.perf_counter() - begin
+            status = "ok" if result["ok"] else "FAILED: " + str(result["error"])
+            print("[%d/%d] %s %s (%.2fs) | %.2f images/s, %.1f queries/s" % (
+                done, len(jobs), result["image"], status, result["seconds"], done / elapsed, queries / elapsed),
+                file=sys.stderr)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - begin
+    print("%d images (%d failed), %d queries in %.2fs: %.2f images/s, %.1f queries/s" % (
+        done, failed, queries, elapsed, done / elapsed if elapsed else 0, queries / elapsed if elapsed else 0))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+This file benchmarks every stage of the path planning pipeline on procedurally generated classrooms, so we can see
+how each stage scales with the size of the room and catch regressions against a saved baseline.
+
+Three kinds of rooms are generated, each at several image sizes:
+- random: N random non-overlapping convex obstacles
+- grid: rows and columns of rectangular desks
+- circle: chairs seated in rings around the middle of the room, like sample_classrooms/circle_classroom.png
+
+Each room is drawn onto an image (dark obstacles on a light floor) so the OpenCV detection can be timed, and its
+exact obstacle polygons are kept so the triangulation, graph and queries are timed on a valid environment.
+Nothing is displayed, so the benchmark runs headless. Peak memory is measured with tracemalloc, which only sees
+memory allocated through Python, so the memory used inside GEOS (the CDT) and OpenCV is not counted.
+
+Usage:
+    python Benchmark.py --sizes 500 1000 2000 --save bench_baseline.json
+    python Benchmark.py --sizes 500 1000 2000 --compare bench_baseline.json
+"""
+
+import argparse
+import json
+import math
+import platform
+import time
+
+import numpy as np
+import shapely
+
+import CDTPath
+import ConvexHullObstacles as imgConv
+import HullCleanup
+from DistanceTable import DistanceTable
+from Instrumentation import Recorder
+from NavMesh import NavMesh
+from ObstacleIndex import ObstacleIndex
+from Planner import Environment, Planner
+from PointLocator import PointLocator
+
+ROOM_KINDS = ("random", "grid", "circle")
+
+
+def _drawRoom(size, hulls):
+    # draws the obstacle hulls in dark gray onto a light floor, as a BGR image like cv2.imread gives
+    import cv2
+    img = np.full((size, size, 3), 235, dtype=np.uint8)
+    for hull in hulls:
+        cv2.fillConvexPoly(img, np.round(hull).astype(np.int32), (60, 60, 60))
+    return img
+
+
+def randomRoom(size, count=None, seed=0):
+    """
+    Generates a square room with random non-overlapping convex obstacles.
+
+    Parameters:
+    size: int
+    This is the width and height of the room image in pixels.
+
+    count: int, optional
+    This is the number of obstacles. By default it grows with the area of the room.
+
+    seed: int
+    This is the seed of the random generator, the same seed always gives the same room.
+
+    Returns:
+    tuple[numpy.ndarray, list[numpy.ndarray]]
+    This is the room image and the list of (n,2) obstacle hull coordinates.
+    """
+    rng = np.random.default_rng(seed)
+    if count is None:
+        count = int(size * size / 6000)
+    # each obstacle is put in its own cell of a grid over the room, at a random spot inside the cell, which keeps
+    # the obstacles apart without checking them against each other
+    cols = int(math.ceil(math.sqrt(count * 1.5)))
+    cell = size / (cols + 1)
+    cells = rng.choice(cols * cols, size=count, replace=False)
+    hulls = []
+    for c in cells:
+        radius = rng.uniform(cell * 0.12, cell * 0.35)
+        center = (np.array([c % cols, c // cols]) + 1) * cell + rng.uniform(-1, 1, 2) * (cell * 0.45 - radius)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, rng.integers(4, 9)))
+        pts = center + radius * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        hull = shapely.convex_hull(shapely.multipoints(pts))
+        if hull.geom_type == "Polygon":
+            hulls.append(np.asarray(hull.exterior.coords)[:-1])
+    return _drawRoom(size, hulls), hulls
+
+
+def gridRoom(size, rows=None, cols=None):
+    """
+    Generates a square room with a grid of rectangular desks.
+
+    Parameters:
+    size: int
+    This is the width and height of the room image in pixels.
+
+    rows, cols: int, optional
+    This is the number of rows and columns of desks. By default they grow with the size of the room.
+
+    Returns:
+    tuple[numpy.ndarray, list[numpy.ndarray]]
+    This is the room image and the list of (4,2) desk coordinates.
+    """
+    rows = rows or max(2, size // 60)
+    cols = cols or max(2, size // 80)
+    cellW, cellH = size / (cols + 1), size / (rows + 1)
+    hulls = []
+    for r in range(rows):
+        for c in range(cols):
+            x, y = (c + 1) * cellW, (r + 1) * cellH
+            w, h = cellW * 0.3, cellH * 0.2
+            hulls.append(np.array([(x - w, y - h), (x + w, y - h), (x + w, y + h), (x - w, y + h)]))
+    return _drawRoom(size, hulls), hulls
+
+
+def circleRoom(size, rings=None):
+    """
+    Generates a square room with chairs seated in concentric rings, like the circle classroom sample.
+
+    Parameters:
+    size: int
+    This is the width and height of the room image in pixels.
+
+    rings: int, optional
+    This is the number of rings of chairs. By default it grows with the size of the room.
+
+    Returns:
+    tuple[numpy.ndarray, list[numpy.ndarray]]
+    This is the room image and the list of chair hull coordinates.
+    """
+    rings = rings or max(1, size // 250)
+    center = np.array([size / 2, size / 2])
+    chair = size / 80
+    hulls = []
+    for ring in range(rings):
+        radius = size * (0.15 + 0.33 * ring / max(1, rings))
+        seats = int(2 * math.pi * radius / (chair * 3.5))
+        for k in range(seats):
+            angle = 2 * math.pi * (k + 0.5 * (ring % 2)) / seats
+            c = center + radius * np.array([math.cos(angle), math.sin(angle)])
+            corners = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)]) * chair
+            rot = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+            hulls.append(c + corners @ rot.T)
+    return _drawRoom(size, hulls), hulls
+
+
+def makeRoom(kind, size, seed=0):
+    if kind == "random":
+        return randomRoom(size, seed=seed)
+    if kind == "grid":
+        return gridRoom(size)
+    if kind == "circle":
+        return circleRoom(size)
+    raise ValueError("unknown room kind: " + str(kind))
+
+
+def benchmarkRoom(kind, size, queries=1000, legacyQueries=100, seed=0, measureMemory=True):
+    """
+    Times every pipeline stage on one generated room.
+
+    Parameters:
+    kind: str
+    This is the kind of room, one of ROOM_KINDS.
+
+    size: int
+    This is the width and height of the room image in pixels.
+
+    queries: int
+    This is the number of random start/goal pairs used for the snapping and search stages.
+
+    legacyQueries: int
+    This is the number of queries for the slow per call functions (closestCent, lineIntersectsPoly), which are
+    only run on a sample and reported as a rate.
+
+    seed: int
+    This is the seed for the room and the queries.
+
+    measureMemory: bool
+    If True every stage is run a second time under tracemalloc to measure its peak memory. The timed run is
+    never traced, since tracemalloc slows down allocation heavy Python code many times over.
+
+    Returns:
+    list[dict]
+    This is one result per stage with its wall time, peak traced memory, item count and throughput.
+    """
+    rng = np.random.default_rng(seed + 1)
+    img, hulls = makeRoom(kind, size, seed)
+    hullVertices = sum(len(h) for h in hulls)
+    timer = Recorder()
+    results = []
+
+    def run(stage, items, unit, fn):
+        with timer.stage(stage):
+            out = fn()
+        seconds = timer.records[-1]["wallTime"]
+        peak = None
+        if measureMemory:
+            # a recorder of its own, so tracemalloc is stopped again before the next timed run
+            tracer = Recorder(traceMemory=True)
+            with tracer.stage(stage):
+                fn()
+            tracer.close()
+            peak = tracer.records[-1]["peakTracedBytes"]
+        results.append({"room": kind, "size": size, "obstacles": len(hulls), "hullVertices": hullVertices,
+                        "stage": stage, "seconds": seconds, "peakTracedBytes": peak, "items": items, "unit": unit,
+                        "throughput": items / seconds if seconds > 0 else None})
+        return out
+
+    contours, hierarchy = run("prepImage", size * size, "pixels", lambda: imgConv.prepImage(img))
+    detected = run("makeConvexHulls", len(contours), "contours", lambda: imgConv.makeConvexHulls(contours, hierarchy, img))
+    run("cleanHulls", len(detected), "hulls", lambda: HullCleanup.cleanHulls(detected))
+
+    env = Environment(hulls=[h.tolist() for h in hulls], shape=(size, size))
+    polygon = env.polygon
+    triangles = run("cdt", 0, "triangles", lambda: shapely.constrained_delaunay_triangles(polygon).normalize())
+    env.triangles = triangles
+    results[-1]["items"] = len(triangles.geoms)
+    results[-1]["throughput"] = len(triangles.geoms) / results[-1]["seconds"]
+
+    index = run("obstacleIndex", len(hulls), "hulls", lambda: ObstacleIndex(env.hulls))
+    env.obstacleIndex = index
+    mesh = run("navMesh", len(triangles.geoms), "triangles", lambda: NavMesh.fromTriangles(triangles, obstacleIndex=index))
+    env.navMesh = mesh
+    run("toNetworkx", mesh.numEdges, "edges", mesh.to_networkx)
+
+    starts = mesh.centroids[mesh.pairs[:, 0]]
+    ends = mesh.centroids[mesh.pairs[:, 1]]
+    run("segmentsIntersect", len(starts), "segments", lambda: index.segmentsIntersect(starts, ends))
+    sample = min(legacyQueries, len(starts))
+    run("lineIntersectsPoly", sample, "segments", lambda: [
+        CDTPath.lineIntersectsPoly(shapely.LineString([starts[i], ends[i]]), env.hulls) for i in range(sample)])
+
+    env.pointLocator = run("pointLocator", len(mesh), "triangles", lambda: PointLocator(mesh))
+    points = rng.uniform(0, size, (queries * 2, 2))
+    planner = Planner(env)
+    snapped = run("snapMany", len(points), "points", lambda: planner.snapMany(points))
+    centroids = env.centroids
+    run("closestCent", legacyQueries, "points", lambda: [CDTPath.closestCent(centroids, p) for p in points[:legacyQueries]])
+
+    # the queries are kept to the largest connected part of the centroid graph, so every one of them has a path
+    import networkx as nx
+    reachable = np.zeros(len(mesh), dtype=bool)
+    reachable[list(max(nx.connected_components(env.graph), key=len))] = True
+    keep = reachable[snapped[:queries]] & reachable[snapped[queries:]]
+    points = np.concatenate([points[:queries][keep], points[queries:][keep]])
+    snapped = np.concatenate([snapped[:queries][keep], snapped[queries:][keep]])
+    queries = int(keep.sum())
+    pairs = list(zip(snapped[:queries].tolist(), snapped[queries:].tolist()))
+    env.distanceTable = run("distanceTable", len(mesh), "triangles", lambda: DistanceTable.build(mesh))
+    for method in Planner.SEARCH_METHODS:
+        planner = Planner(env, method)
+        if method == "dijkstra":
+            env.graph # built outside the timed stage, like the NavMesh adjacency lists below
+        else:
+            mesh.adjacencyLists()
+        run("search:" + method, len(pairs), "queries", lambda: [planner.searchNodes(s, g) for s, g in pairs])
+        if planner.stats.searches:
+            results[-1]["nodesExpanded"] = planner.stats.nodesExpanded // planner.stats.searches * len(pairs)
+
+    # ten start points shared by all the goals, so the shortest path trees are reused
+    manyPairs = [(tuple(points[i % 10]), tuple(points[queries + i])) for i in range(queries)]
+    run("plan_many", len(manyPairs), "queries", lambda: Planner(env).plan_many(manyPairs))
+
+    # ten start points, each measured to the same fifty goals
+    goals = points[queries:queries + 50]
+    run("plan_costs", 10 * len(goals), "costs", lambda: [Planner(env).plan_costs(points[i], goals) for i in range(10)])
+    return results
+
+
+def printResults(results, baseline=None):
+    """
+    Prints the results as a table, with the time relative to the baseline when one is given.
+    """
+    base = {}
+    for r in baseline or []:
+        base[(r["room"], r["size"], r["stage"])] = r["seconds"]
+    header = "%-7s %6s %6s %-26s %11s %10s %14s" % ("room", "size", "obst", "stage", "seconds", "peak MB", "throughput")
+    if base:
+        header += " %9s" % "vs base"
+    print(header)
+    for r in results:
+        rate = "%.3g %s/s" % (r["throughput"], r["unit"]) if r["throughput"] else "-"
+        peak = "%10.2f" % (r["peakTracedBytes"] / 2**20) if r["peakTracedBytes"] is not None else "%10s" % "-"
+        line = "%-7s %6d %6d %-26s %11.5f %s %14s" % (r["room"], r["size"], r["obstacles"], r["stage"],
+                                                     r["seconds"], peak, rate)
+        old = base.get((r["room"], r["size"], r["stage"]))
+        if old:
+            line += " %8.2fx" % (r["seconds"] / old)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks every stage of the path planning pipeline on generated classrooms.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000], help="room image sizes in pixels")
+    parser.add_argument("--rooms", nargs="+", default=list(ROOM_KINDS), choices=ROOM_KINDS, help="kinds of rooms to generate")
+    parser.add_argument("--queries", type=int, default=1000, help="start/goal pairs per room")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc run of each stage")
+    parser.add_argument("--save", help="save the results as a baseline JSON file")
+    parser.add_argument("--compare", help="compare the results against a saved baseline JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for kind in args.rooms:
+        for size in args.sizes:
+            results.extend(benchmarkRoom(kind, size, args.queries, seed=args.seed, measureMemory=args.memory))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    printResults(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                       "shapely": shapely.__version__, "numpy": np.__version__, "results": results}, f, indent=1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+This file holds the planner of a whole building made of many classrooms and corridors. Triangulating the building
+as one polygon with every hull as a hole, and searching its single centroid graph, gets slow as the building grows,
+and any change means building it all again. Instead every room keeps its own Environment, with its own image,
+triangulation and navigation mesh, and the rooms are joined by declared doorways.
+
+Planning is hierarchical:
+
+- inside each room the route lengths between every pair of its doorways are precomputed, with one
+  Planner.plan_costs search per doorway. These are the edges of a small abstract graph whose nodes are the doorways.
+- a query adds the start and the goal to the abstract graph, connected to the doorways of their rooms, and searches
+  it for the sequence of doorways to go through.
+- only the rooms on that route are then planned in, one leg from doorway to doorway in each.
+
+Each room's doorway costs are kept with the navigation mesh they were measured on. Rebuilding a room, or moving an
+obstacle in it, only measures that room's doorways again, and the other rooms keep their meshes and costs.
+
+    building = Building()
+    building.add_room("101", Environment("room101.png"))
+    building.add_room("hall", Environment("hall.png"), origin=(607, 0))
+    building.add_doorway("101", "hall", (607, 200), width=40)
+    path = building.plan((100, 100), (900, 50))
+"""
+
+import json
+import math
+
+import networkx as nx
+import numpy as np
+
+import Instrumentation
+from Planner import Environment, Planner
+
+
+class Room:
+    """
+    One room of a building.
+
+    Parameters:
+    name: str
+    This is the name the room is referred to by.
+
+    environment: Environment
+    This is the room, planned in its own pixel coordinates.
+
+    origin: tuple[float,float]
+    This is where the top left corner of the room's image is in building coordinates.
+
+    method: str
+    This is the search method of the room's Planner.
+    """
+
+    def __init__(self, name, environment, origin=(0.0, 0.0), method="astar"):
+        self.name = name
+        self.environment = environment
+        self.origin = np.asarray(origin, dtype=float)
+        self.planner = Planner(environment, method)
+
+    def contains(self, point):
+        """True if a building point lies within the bounds of the room's image."""
+        x, y = np.asarray(point, dtype=float) - self.origin
+        return 0 <= x <= self.environment.width and 0 <= y <= self.environment.height
+
+    def toLocal(self, points):
+        """Moves building points into the room's pixel coordinates."""
+        return np.asarray(points, dtype=float).reshape(-1, 2) - self.origin
+
+    def toBuilding(self, points):
+        """Moves points of the room's pixel coordinates into building coordinates."""
+        return np.asarray(points, dtype=float).reshape(-1, 2) + self.origin
+
+
+class Doorway:
+    """
+    A doorway joining two rooms, which both rooms can reach at the same building point.
+
+    Parameters:
+    rooms: tuple[str,str]
+    These are the names of the two rooms.
+
+    point: tuple[float,float]
+    This is the middle of the doorway in building coordinates, on the wall the two rooms share.
+
+    width: float
+    This is the width of the doorway. Robots with a radius of more than half of it can't go through.
+    """
+
+    def __init__(self, rooms, point, width=math.inf):
+        self.rooms = tuple(rooms)
+        self.point = tuple(map(float, point))
+        self.width = width
+
+
+class Building:
+    """
+    Rooms joined by doorways, with the hierarchical planner described at the top of this file.
+
+    Parameters:
+    method: str
+    This is the search method of the Planner of each room, one of Planner.SEARCH_METHODS.
+    """
+
+    def __init__(self, method="astar"):
+        self.method = method
+        self.rooms = {}
+        self.doorways = []
+        # for each room, the mesh its doorway costs were measured on and the costs per robot radius
+        self._costs = {}
+
+    @classmethod
+    def load(cls, path, method="astar", cache=None):
+        """
+        Makes a building from a JSON file of the form
+        {"rooms": [{"name": "101", "image": "room101.png", "origin": [0, 0]}, ...],
+         "doorways": [{"rooms": ["101", "hall"], "point": [607, 200], "width": 40}, ...]}.
+
+        Parameters:
+        path: str
+        This is the path of the JSON file.
+
+        method: str
+        This is the search method of the rooms' Planners.
+
+        cache: MeshCache, optional
+        This is the on disk mesh cache shared by the rooms' Environments.
+
+        Returns:
+        Building
+        """
+        with open(path) as f:
+            layout = json.load(f)
+        building = cls(method)
+        for room in layout["rooms"]:
+            building.add_room(room["name"], Environment(room["image"], cache=cache), room.get("origin", (0, 0)))
+        for door in layout.get("doorways", []):
+            building.add_doorway(*door["rooms"], door["point"], door.get("width", math.inf))
+        return building
+
+    def add_room(self, name, environment, origin=(0.0, 0.0)):
+        """
+        Adds a room to the building. Nothing is triangulated until the room is first planned in.
+
+        Parameters:
+        name: str
+        This is the name of the room, which must not be taken.
+
+        environment: Environment
+        This is the room.
+
+        origin: tuple[float,float]
+        This is where the top left corner of the room is in building coordinates.
+
+        Returns:
+        Room
+        """
+        if name in self.rooms:
+            raise ValueError("there is already a room named " + str(name))
+        room = Room(name, environment, origin, self.method)
+        self.rooms[name] = room
+        return room
+
+    def rebuild_room(self, name, environment):
+        """
+        Puts a new environment in place of a room, for example after it was refurnished. Only this room's doorway
+        costs are measured again, on the next query.
+
+        Parameters:
+        name: str
+        This is the name of the room.
+
+        environment: Environment
+        This is the new room, with the same origin as the old one.
+
+        Returns:
+        Room
+        """
+        old = self.rooms[name]
+        room = Room(name, environment, old.origin, self.method)
+        # checked before the swap, so a rejected room leaves the old one and its costs in place
+        for door in self.doorways:
+            if name in door.rooms and not room.contains(door.point):
+                raise ValueError("the rebuilt room no longer reaches the doorway at " + str(door.point))
+        self.rooms[name] = room
+        self._costs.pop(name, None)
+        return room
+
+    def add_doorway(self, roomA, roomB, point, width=math.inf):
+        """
+        Joins two rooms by a doorway.
+
+        Parameters:
+        roomA, roomB: str
+        These are the names of the two rooms.
+
+        point: tuple[float,float]
+        This is the middle of the doorway in building coordinates. It must be within the bounds of both rooms.
+
+        width: float
+        This is the width of the doorway.
+
+        Returns:
+        Doorway
+        """
+        for name in (roomA, roomB):
+            if not self.rooms[name].contains(point):
+                raise ValueError("the doorway at " + str(tuple(point)) + " is not in room " + str(name))
+        door = Doorway((roomA, roomB), point, width)
+        self.doorways.append(door)
+        for name in (roomA, roomB):
+            self._costs.pop(name, None)
+        return door
+
+    def roomAt(self, point):
+        """
+        Finds the room a building point is in. A point on a wall shared by two rooms, such as a doorway, belongs to
+        the first room whose mesh has a triangle there.
+
+        Returns:
+        str: the name of the room.
+        """
+        rooms = [room for room in self.rooms.values() if room.contains(point)]
+        if not rooms:
+            raise ValueError("the point " + str(tuple(point)) + " is not in any room")
+        for room in rooms:
+            if room.environment.pointLocator.locate(room.toLocal(point))[0] >= 0:
+                return room.name
+        return rooms[0].name
+
+    def _routeCosts(self, room, points, targets, radius):
+        # the cost from each point to each target inside a room: the route length between the triangles they snap
+        # to, plus the straight line from each point to its triangle's centroid
+        planner = room.planner
+        points, targets = room.toLocal(points), room.toLocal(targets)
+        centroids = room.environment.navMesh.centroids
+
+        def offsets(pts):
+            gap = pts - centroids[planner.snapMany(pts)]
+            return np.hypot(gap[:, 0], gap[:, 1])
+
+        costs = np.array([planner.plan_costs(p, targets, radius) for p in points]).reshape(len(points), len(targets))
+        return costs + offsets(points)[:, None] + offsets(targets)[None, :]
+
+    def doorCosts(self, name, radius=0.0):
+        """
+        Returns the precomputed costs between the doorways of a room, measuring them first if the room's mesh
+        changed since they were.
+
+        Parameters:
+        name: str
+        This is the name of the room.
+
+        radius: float
+        This is the radius of the robot, see Planner.plan().
+
+        Returns:
+        tuple[list[int], numpy.ndarray]
+        These are the indices into self.doorways of the room's doorways wide enough for the robot, and the (k,k)
+        array of the route lengths between them inside the room, inf where one can't be reached from the other.
+        """
+        room = self.rooms[name]
+        mesh = room.environment.navMesh
+        entry = self._costs.get(name)
+        if entry is None or entry[0] is not mesh:
+            entry = (mesh, {})
+            self._costs[name] = entry
+        if radius not in entry[1]:
+            doors = [i for i, door in enumerate(self.doorways) if name in door.rooms and door.width >= 2 * radius]
+            with Instrumentation.stage("doorCosts", room=name, doors=len(doors)):
+                points = [self.doorways[i].point for i in doors]
+                costs = self._routeCosts(room, points, points, radius) if doors else np.zeros((0, 0))
+            entry[1][radius] = (doors, costs)
+        return entry[1][radius]
+
+    def abstractGraph(self, radius=0.0):
+        """
+        Puts together the abstract graph of the building from the doorway costs of every room.
+
+        Parameters:
+        radius: float
+        This is the radius of the robot.
+
+        Returns:
+        networkx.Graph
+        Its nodes are indices into self.doorways, and an edge joins two doorways of the same room, with the route
+        length between them as its "weight" and the room as its "room". When two rooms join the same doorways the
+        shorter route is kept.
+        """
+        graph = nx.Graph()
+        for name in self.rooms:
+            doors, costs = self.doorCosts(name, radius)
+            graph.add_nodes_from(doors)
+            for a in range(len(doors)):
+                for b in range(a + 1, len(doors)):
+                    cost = costs[a, b]
+                    u, v = doors[a], doors[b]
+                    if np.isfinite(cost) and (not graph.has_edge(u, v) or graph.edges[u, v]["weight"] > cost):
+                        graph.add_edge(u, v, weight=float(cost), room=name)
+        return graph
+
+    def route(self, start, goal, radius=0.0, startRoom=None, goalRoom=None):
+        """
+        Searches the abstract graph for the doorways to go through from start to goal.
+
+        Parameters:
+        start, goal: tuple[float,float]
+        These are the (x,y) building coordinates of the endpoints.
+
+        radius: float
+        This is the radius of the robot.
+
+        startRoom, goalRoom: str, optional
+        These are the rooms of the endpoints, found with roomAt() if not given.
+
+        Returns:
+        tuple[list[tuple[str, tuple[float,float], tuple[float,float]]], float]
+        These are the legs of the route, each a room and the building points it is crossed between, and the
+        length of the route.
+        """
+        startRoom = startRoom if startRoom is not None else self.roomAt(start)
+        goalRoom = goalRoom if goalRoom is not None else self.roomAt(goal)
+        graph = self.abstractGraph(radius)
+        points = {"start": tuple(map(float, start)), "goal": tuple(map(float, goal))}
+        points.update((i, door.point) for i, door in enumerate(self.doorways))
+
+        # the endpoints join the graph through the doorways of their rooms, and each other if in the same room
+        for node, name in (("start", startRoom), ("goal", goalRoom)):
+            doors, _ = self.doorCosts(name, radius)
+            targets = doors + (["goal"] if node == "start" and startRoom == goalRoom else [])
+            if not targets:
+                continue
+            costs = self._routeCosts(self.rooms[name], [points[node]], [points[t] for t in targets], radius)[0]
+            graph.add_weighted_edges_from(((node, t, c) for t, c in zip(targets, costs.tolist()) if math.isfinite(c)),
+                                          room=name)
+        if "start" not in graph or "goal" not in graph:
+            raise nx.NetworkXNoPath("no doorway route from room %s to room %s" % (startRoom, goalRoom))
+        with Instrumentation.stage("abstractSearch", nodes=graph.number_of_nodes()):
+            length, nodes = nx.single_source_dijkstra(graph, "start", "goal")
+        legs = [(graph.edges[u, v]["room"], points[u], points[v]) for u, v in zip(nodes[:-1], nodes[1:])]
+        return legs, length
+
+    def plan(self, start, goal, radius=0.0, smooth=True):
+        """
+        Computes a path through the building: the route of doorways from route(), refined with the Planner of
+        each room it goes through.
+
+        Parameters:
+        start, goal: tuple[float,float]
+        These are the (x,y) building coordinates of the endpoints.
+
+        radius: float
+        This is the radius of the robot, see Planner.plan().
+
+        smooth: bool
+        If True each leg is pulled taut with Planner.plan_smooth(), otherwise it is the centroid path of
+        Planner.plan() between the leg's endpoints.
+
+        Returns:
+        list[tuple[float,float]]
+        This is the path in building coordinates, going through the middle of each doorway on the route.
+        """
+        legs, _ = self.route(start, goal, radius)
+        path = []
+        for name, a, b in legs:
+            room = self.rooms[name]
+            localA, localB = (tuple(p) for p in room.toLocal([a, b]).tolist())
+            if smooth:
+                leg = room.planner.plan_smooth(localA, localB, radius)[0]
+            else:
+                leg = [localA] + room.planner.plan(localA, localB, radius) + [localB]
+            leg = [tuple(p) for p in room.toBuilding(leg).tolist()]
+            path.extend(leg[1:] if path and np.allclose(path[-1], leg[0]) else leg)
+        return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plans a path through a building of rooms joined by doorways.")
+    parser.add_argument("layout", help="JSON file listing the rooms, with their image and origin, and the doorways")
+    parser.add_argument("--start", nargs=2, type=float, required=True, metavar=("X", "Y"), help="start point in building coordinates")
+    parser.add_argument("--goal", nargs=2, type=float, required=True, metavar=("X", "Y"), help="goal point in building coordinates")
+    parser.add_argument("--radius", type=float, default=0.0, help="robot radius in pixels")
+    args = parser.parse_args()
+    building = Building.load(args.layout)
+    legs, length = building.route(args.start, args.goal, args.radius)
+    print("rooms:", " -> ".join(name for name, _, _ in legs), "length %.1f" % length)
+    print("path:", [(round(x, 1), round(y, 1)) for x, y in building.plan(args.start, args.goal, args.radius)])
@@ -3,24 +3,41 @@ Authors: Keshawn Boughton & Nadezhda Dominguez Salinas
 
 This file takes in an image of a classroom environment, detects the obstacle polygons within it, constructs the 
 constrained Delaunay triangulation of area excluding obstacles, constructs the centroid graph, and 
-finds the shortest path between two points (centroids) avoiding obstacles, using Dijkstra's.
+finds the shortest path between two points (centroids) avoiding obstacles, using A* search.
 It utilizes the convex hulls made in the ConvexHullObstacles.py file, for the obstacle polygons.
 
 Code documentation used for triangulation used from: https://shapely.readthedocs.io/en/2.1.2/reference/shapely.constrained_delaunay_triangles.html
 Code documentation for parts of the visualization used from https://stackoverflow.com/questions/8919719/how-to-plot-a-complex-polygon
 """
 
-import matplotlib.pyplot as plt
-from matplotlib.patches import PathPatch
-from matplotlib.path import Path
+from functools import lru_cache
+
+import numpy as np
 import shapely
-import ConvexHullObstacles as imgConv
-import networkx as nx
+import Instrumentation
+from ObstacleIndex import ObstacleIndex
+from NavMesh import NavMesh, sharedEdges, triangleCoords
+
+# Matplotlib and OpenCV are only imported by the functions that draw or read images, so importing this module
+# does not triangulate, render or open any windows. The full pipeline runs from main().
+
+def makeClassroomPolygon(hullPts, img):
+    """
+    Builds the polygon of the classroom environment, a rectangle the size of the image with the obstacle
+    hulls as holes.
+
+    Parameters:
+    hullPts: list[list[tuple[float,float]]]
+    The list of obstacle hull polygons represented as coordinate tuples.
+
+    img: numpy.ndarray
+    This is the image array that is used for the classroom environment dimensions 
 
-newImage = imgConv.getImage()
-img_contours, img_hier = imgConv.prepImage(newImage)
-hulls = imgConv.makeConvexHulls(img_contours, img_hier, newImage)
-# print(newImage.shape)
+    Returns:
+    shapely.geometry.Polygon
+    This is the classroom polygon with the obstacle hulls as holes.
+    """
+    return shapely.Polygon([(0, 0), (0, img.shape[0]), (img.shape[1], img.shape[0]), (img.shape[1], 0)], holes=hullPts)
 
 def formatPolyPts(polyTri):
     """
@@ -35,13 +52,7 @@ def formatPolyPts(polyTri):
     A list in which each element is a list of (x,y) coordinate typles which represent the exterior
     vertices of a triangle. 
     """
-    polyPts = []
-    for i in range(len(polyTri.geoms)):
-        polyPts.append([])
-        x, y = polyTri.geoms[i].exterior.xy
-        for j in range(len(x)-1):
-            polyPts[i].append((x[j], y[j]))
-    return polyPts
+    return [[tuple(pt) for pt in tri] for tri in triangleCoords(polyTri).tolist()]
 
 def makePathFriendly(extPts, interPts):
     """
@@ -61,6 +72,8 @@ def makePathFriendly(extPts, interPts):
     tuple[list[tuple[float,float]], list[int]]
     This is a tuple which contains a list of vertices, and a list of Path action format to use for plotting.
     """
+    from matplotlib.path import Path
+
     ptList = extPts.copy()
     actList = []
     for i in range(len(extPts)):
@@ -81,11 +94,31 @@ def makePathFriendly(extPts, interPts):
         ptList.append((0, 0))
     return ptList, actList
 
-def createCentroidGraph(triangles, hullPts):
+def buildTriangleAdjacency(triangles):
+    """
+    Finds the pairs of CDT triangles that share an edge. The triangle vertices are deduplicated into an index
+    array and every triangle edge is keyed by its two vertex indices, so the two triangles on either side of a
+    shared edge get the same key. Triangles that only touch at a single vertex are not neighbors.
+
+    Parameters:
+    triangles: shapely.geomtry.GeomtryCollection
+    This is a collection of triangles from the contrained Delaunay triangulation of the free space in class.
+
+    Returns:
+    list[tuple[int,int]]
+    This is a list of (i,j) index pairs with i < j, one for every edge shared by triangles i and j.
+    """
+    coords = triangleCoords(triangles)
+    _, inverse = np.unique(coords.reshape(-1, 2), axis=0, return_inverse=True)
+    pairs, _ = sharedEdges(inverse.reshape(-1, 3))
+    return [tuple(pair) for pair in pairs.tolist()]
+
+def createCentroidGraph(triangles, hullPts, obstacleIndex=None):
     """
     Builds a centroid navigation graph from the CDT. In which each triangle centroid is a node in a networkx graph.
-    Then, edges are constructed between the centroids of adjacent triangles if the connection between nodes 
-    does not interest any of the obstacle boundaries.
+    Then, edges are constructed between the centroids of triangles sharing an edge if the connection between nodes 
+    does not interest any of the obstacle boundaries. The graph is built on the array backed NavMesh and then
+    exported to networkx.
 
     Parameters:
     triangles: shapely.geomtry.GeomtryCollection
@@ -94,33 +127,14 @@ def createCentroidGraph(triangles, hullPts):
     hullPts: list[list[tuple[float,float]]]
     This is a list of obstacles hulls, in which each hull is represented a as a list of (x,y) coordinate tuples.
 
+    obstacleIndex: ObstacleIndex, optional
+    This is a prebuilt obstacle index for the hulls. One is built from hullPts if it is not given.
+
     Returns:
     A networkx.Graph which is an undirected weighed graph in which the nodes are triangle centroids of CDT and
     the edge weights are the Euclidean distances in between the centroids.
     """
-    centGraph = nx.Graph()
-    
-    # Adding the centroids of the CDT as nodes in the graph
-    for i, tri in enumerate(triangles.geoms):
-        c = shapely.centroid(tri)
-        centGraph.add_node(i, pos = (c.x, c.y))
-
-    # Adding the edges between centroids of adjacent triangles
-    for i in range(len(triangles.geoms)):
-        for j in range(i+1, len(triangles.geoms)):
-            firstTri = triangles.geoms[i]
-            secondTri = triangles.geoms[j]
-
-            # For adjacent triangles add an edge
-            if firstTri.intersects(secondTri) and firstTri.boundary.intersects(secondTri.boundary):
-                firstTriCentroid = firstTri.centroid
-                secondTriCentroid = secondTri.centroid
-                centroidLine = shapely.LineString([(firstTriCentroid.x, firstTriCentroid.y), (secondTriCentroid.x, secondTriCentroid.y)])
-                if not lineIntersectsPoly(centroidLine, hullPts):
-                    distCentroids = firstTriCentroid.distance(secondTriCentroid)
-                    centGraph.add_edge(i,j, weight = distCentroids)
-    
-    return centGraph
+    return NavMesh.fromTriangles(triangles, hullPts, obstacleIndex).to_networkx()
 
 def makeCentroids(triPts):
     """
@@ -134,11 +148,7 @@ def makeCentroids(triPts):
     list[tuple[float,float]]
     This is a list of (x,y) coordinate tuples which are the centroids of each triangle from the CDT
     """
-    centroidsCDT = []
-    for tri in triPts.geoms:
-        cent = shapely.centroid(tri)
-        centroidsCDT.append((cent.x, cent.y))
-    return centroidsCDT
+    return [tuple(cent) for cent in triangleCoords(triPts).mean(axis=1).tolist()]
 
 def lineIntersectsPoly(line, polyCoords):
     """
@@ -148,12 +158,16 @@ def lineIntersectsPoly(line, polyCoords):
     line: shapely.geomtry.LineString
     This is the line segment that will be checked to see if intersection occured.
 
-    polyCoords: list[list[tuple[float,float]]]
+    polyCoords: list[list[tuple[float,float]]] or ObstacleIndex
     This is the list of obstacle polygons, where each is represented as a list of (x,y) coordinate tuples.
+    A prebuilt ObstacleIndex may be passed instead to avoid rebuilding the hull polygons on every call.
 
     Returns:
     boolean, where True indicates the line intersected a obstacle boundary, otherwise it returns False.
     """
+    if isinstance(polyCoords, ObstacleIndex):
+        return polyCoords.lineIntersects(line)
+    # building a whole index costs more than it saves for a single line, so raw hulls are checked one by one
     for hull in polyCoords:
         hulPoly = shapely.Polygon(hull)
         if hulPoly.boundary.intersects(line):
@@ -185,12 +199,20 @@ def closestCent(centroids, point):
             bestCent = i
     return bestCent
 
-def getShortestPathCoords(hullPts, img):
+@lru_cache(maxsize=8)
+def _cachedPlanner(shape, hullKey):
+    # Keeps the built navigation mesh of the last few environments, so repeated calls to getShortestPathCoords
+    # on the same classroom don't redo the triangulation and the centroid graph
+    from Planner import Environment, Planner
+    return Planner(Environment(hulls=[list(hull) for hull in hullKey], shape=shape))
+
+def getShortestPathCoords(hullPts, img, startPoint=None, endPoint=None):
     """
     Computes the shortest path throughout the environment avoiding obstacle polygons.
     This functions first constructs the constrained Delaunay triangulation of the classroom environmet. 
-    Then it builds the centroid graph, and uses Dijkstra's algorithm to compute the shortest path from the
-    start point (centroid) to the goal point (centroid).
+    Then it builds the centroid graph, and uses A* search (the Planner's default method) to compute the shortest
+    path from the start point (centroid) to the goal point (centroid). The triangulation and centroid graph are
+    cached, so later calls with the same hulls and image size only run the search.
 
     Parameters:
     hullPts: list[list[tuple[float,float]]]
@@ -199,90 +221,70 @@ def getShortestPathCoords(hullPts, img):
     img: numpy.ndarray
     This is the image array that is used for the classroom environment dimensions 
 
+    startPoint: tuple[float,float], optional
+    The (x,y) coordinate of the start point. Defaults to the top left corner (0,0) of the image.
+
+    endPoint: tuple[float,float], optional
+    The (x,y) coordinate of the goal point. Defaults to the bottom right corner of the image.
+
     Returns:
     list[tuple[float,float]]
     This is the ordered list of centroid coordinates from the shortest path of the two points.
     """
-    points = shapely.Polygon([(0, 0), (0, newImage.shape[0]), (newImage.shape[1], newImage.shape[0]), (newImage.shape[1], 0)], holes=hulls)
-    triPoints = shapely.constrained_delaunay_triangles(points).normalize() # the triangulation!
-    centGraph = createCentroidGraph(triPoints, hullPts)
+    if startPoint is None:
+        startPoint = (0,0)
+    if endPoint is None:
+        endPoint = (img.shape[1], img.shape[0])
+    hullKey = tuple(tuple(tuple(pt) for pt in hull) for hull in hullPts)
+    planner = _cachedPlanner(tuple(img.shape[:2]), hullKey)
+    return planner.plan(startPoint, endPoint)
+
+def main(stages=None, backend="matplotlib"):
+    """
+    Runs the whole pipeline on the default classroom image and prints the shortest path. The figures of each step
+    are only drawn when asked for, after the path is found, see Rendering.py.
+
+    Parameters:
+    stages: list[str], optional
+    These are the figures to save into the path_progression folder, from Rendering.STAGES, an empty list for all
+    of them. Nothing is drawn if it is None.
+
+    backend: str
+    This is the Rendering backend the figures are drawn with, "matplotlib" or "opencv".
+    """
+    import Rendering
+    from Planner import Environment, Planner
+
+    env = Environment()
+    newImage = env.image
+
+    # Finding the closest centroid to the starting and end point for the robot
     startPoint = (0,0)
-    endPoint = (img.shape[1], img.shape[0])
-    startCent = closestCent(centroids, startPoint)
-    endCent = closestCent(centroids, endPoint)
-
-    # Use Djikstras Algorithm on our Networkx Centroid Graph
-    shortestPath = nx.dijkstra_path(centGraph, startCent, endCent, weight = 'weight')
-    shortPathCoords = [centroids[n] for n in shortestPath]
-    return shortPathCoords
-
-# This part displays the classroom polygon with holes and saves it as "img_hole.png"
-axes = plt.gca()
-ext = [(0, 0), (0, newImage.shape[0]), (newImage.shape[1], newImage.shape[0]), (newImage.shape[1], 0)]
-inter = hulls
-points, actions = makePathFriendly(ext, inter)
-path = Path(points, actions)
-patch = PathPatch(path)
-axes.set_xlim(0,newImage.shape[1])
-axes.set_ylim(0,newImage.shape[0])
-axes.add_patch(patch)
-plt.savefig("path_progression/classroom_setup.png")
-
-# makes polygon of classroom with hulls as holes
-points = shapely.Polygon([(0, 0), (0, newImage.shape[0]), (newImage.shape[1], newImage.shape[0]), (newImage.shape[1], 0)], holes=hulls)
-triPoints = shapely.constrained_delaunay_triangles(points).normalize() # the triangulation!
-triPtsList = formatPolyPts(triPoints)
-
-# This part displays the TRIANGULATION of the classroom polygon with holes and saves it as "img_triangulation.png"
-for coords in triPtsList: # iterates through triangles in triangulation
-    pathCoords = coords.copy()
-    pathCoords.append((0, 0))
-    path = Path(pathCoords, [Path.MOVETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY])
-    patch = PathPatch(path)
-    axes.add_patch(patch)
-axes.set_xlim(0,newImage.shape[1])
-axes.set_ylim(0,newImage.shape[0])
-
-plt.savefig("path_progression/constrained_delaunay_triangulation.png")
-
-# This part adds the centroids to the triangulated classroom
-centroids = makeCentroids(triPoints)
-
-xs = [c[0] for c in centroids]
-ys = [c[1] for c in centroids]
-axes.scatter(xs,ys, color = 'pink', s=10)
-axes.set_xlim(0,newImage.shape[1])
-axes.set_ylim(0,newImage.shape[0])
-plt.savefig("path_progression/centroids_CDT.png")
-
-centroid_Graph = createCentroidGraph(triPoints, hulls)
-centroids = makeCentroids(triPoints)
-
-for node in centroid_Graph:
-    x1,y1 = centroids[node]
-    for neighbor, i in centroid_Graph[node].items():
-        x2,y2 = centroids[neighbor]
-        axes.plot([x1,x2],[y1,y2], color = 'lightgray')
-
-axes.set_xlim(0,newImage.shape[1])
-axes.set_ylim(0,newImage.shape[0])
-plt.savefig("path_progression/centroid_graph.png")
-
-# Finding the closest centroid to the starting and end point for the robot
-startPoint = (0,0)
-endPoint = (newImage.shape[1], newImage.shape[0])
-
-startCent = closestCent(centroids, startPoint)
-endCent = closestCent(centroids, endPoint)
-
-# Use Djikstras Algorithm on our Networkx Centroid Graph
-shortestPath = nx.dijkstra_path(centroid_Graph, startCent, endCent, weight = 'weight')
-
-shortPathCoords = [centroids[n] for n in shortestPath]
-shortPathX = [p[0] for p in shortPathCoords]
-shortPathY = [p[1] for p in shortPathCoords]
-
-axes.plot(shortPathX, shortPathY, color = 'red')
-axes.scatter(shortPathX, shortPathY, color ='red', s=10)
-plt.savefig("path_progression/shortest_path_graph.png")
-plt.close("all")
\ No newline at end of file
+    endPoint = (newImage.shape[1], newImage.shape[0])
+
+    # Search the centroid graph with the Planner's default A* search
+    shortPathCoords = Planner(env).plan(startPoint, endPoint)
+    print("shortest path:", [(round(x, 1), round(y, 1)) for x, y in shortPathCoords])
+
+    if stages is not None:
+        saved = Rendering.renderAsync(env, shortPathCoords, stages or None, backend=backend)
+        for path in saved.result():
+            print("saved", path)
+
+if __name__ == "__main__":
+    import argparse
+
+    import Rendering
+
+    parser = argparse.ArgumentParser(description="Plans a path through the default classroom image, optionally saving each step into path_progression.")
+    parser.add_argument("--render", nargs="*", choices=Rendering.STAGES, metavar="STAGE", help="save the figures of these steps into path_progression, all of them if none are named: " + ", ".join(Rendering.STAGES))
+    parser.add_argument("--backend", default="matplotlib", choices=Rendering.BACKENDS, help="draw the figures as matplotlib plots or with OpenCV onto the image")
+    parser.add_argument("--timings", help="write the wall time, memory and counters of each pipeline stage to this JSON lines file")
+    parser.add_argument("--profile", action="store_true", help="also run the stages under cProfile and tracemalloc and print the profile")
+    args = parser.parse_args()
+    if args.timings or args.profile:
+        Instrumentation.enable(args.timings, profile=args.profile, traceMemory=args.profile)
+    main(args.render, args.backend)
+    recorder = Instrumentation.disable()
+    if recorder is not None and args.profile:
+        recorder.printProfile()
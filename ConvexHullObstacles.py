@@ -1,126 +1,178 @@
-"""This module tries making Convex Hulls around images using the Canny Edge Detection technique:
-basically turning an image into a binary one by making pixels with dratic color change one color and every other pixel another.
-Code was used from https://learnopencv.com/edge-detection-using-opencv/"""
-
-import cv2
-import matplotlib.pyplot as plt
-
-# Initializes variables
-img = cv2.imread("sample_classrooms/circle_classroom.png")
-
-# Given a contour in the form of a hierarchy array and the list of hierarchy arrays,
-# it determines the hierarchy of the contour
-def getHierarchy(contour, hierarchy):
-    hier = 1
-    nextParent = contour[3]
-    while nextParent != -1:
-        nextParent = hierarchy[0][nextParent][3]
-        hier += 1
-    return hier
-
-# makes a hashmap (as Python calls it, a dictionary) where the keys are the possible hierarchies
-# of Convex Hulls and the values are the indices of the Hull points which are in that hierarchy.
-# Returns the hashmap
-def makeHierMap(hullIndices, hierarchy):
-    hierMap = {}
-    for i in range(len(hullIndices)):
-        hier = getHierarchy(hierarchy[0][hullIndices[i]], hierarchy)
-        if hierMap.keys().__contains__(hier):
-            hierMap[hier].append(i)
-        else:
-            hierMap[hier] = []
-            hierMap[hier].append(i)
-    return hierMap
-
-# Returns the Hull Points formatted as a dictionary whose
-# keys are the indices of Convex Hulls and the
-# values are the corresponding coordinates
-def reformatHullPoints(hullPts):
-    reformatHulls = []
-    for i in range(len(hullPts)):
-        reformatHulls.append([])
-        # ptsFile.write("Hull #" + str(i) + ": \n")
-        for bracketedCoords in hullPts[i]:
-            for actualCoords in bracketedCoords:
-                reformatHulls[i].append((int(actualCoords[0]), int(actualCoords[1])))
-                # ptsFile.write(str(actualCoords[0]) + "," + str(actualCoords[1]) + "\n")
-        # ptsFile.write("\n")
-    return reformatHulls
-
-def getImage():
-    return img
-
-def prepImage(img):
-    # hullFile.write("Image coordinates:\n")
-    # hullFile.write("0,0\n" + str(img.shape[1]) + ",0\n" + str(img.shape[0]) + "," + str(img.shape[1]) + "\n0," + str(img.shape[0]) + "\n\n")
-
-    img_invert = cv2.bitwise_not(img) # turns every pixel of image into its negative. More likely to darken image, which makes edges more apparent
-    img_blur = cv2.blur(img_invert, (int(25/1111 * img.shape[0]), int(25/1500 * img.shape[1]))) # blurs the image. Done to make detected edges surround more obvious features of image
-
-    img_edges = cv2.Canny(image=img_blur, threshold1=20, threshold2=40) # Canny Edge Detection. Works SHOCKINGLY well with detecting objects
-    img_blur_edges = cv2.blur(img_edges, (int(15/1111 * img.shape[0]), int(15/1500 * img.shape[1]))) # blurs the image AGAIN so Convex Hulls surround most obvious objects
-
-    contours, hierarchy = cv2.findContours(img_blur_edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE) # makes coordinates of Convex Hulls in the form of an array of array of coordinates
-    # NOTE: "hierarchy" is a list of arrays that correspond to the indices of Convex Hull points such that for each index i in contours list:
-    # - hierarchy[0][i][0] presents contour directly NEXT to contours[i]
-    # - hierarchy[0][i][1] presents contour directly PREVIOUS to contours[i]
-    # - hierarchy[0][i][2] presents first child of contour[i], i.e. first contour inside contour[i]
-    # - hierarchy[0][i][3] presents parent of contour[i], i.e. immediate contour surrounding contour[i]
-    
-    return contours, hierarchy
-
-# actually draws the convex hulls onto the given image
-def drawContoursOntoImage(img, hullPts): 
-    # draw contours and hull points
-    for i in range(len(hullPts)):
-        color = (255, 0, 0) # red - color for convex hull
-        # draw ith convex hull object
-        cv2.drawContours(img, hullPts, i, color, 2, 8)
-
-# Given an image, contours from the image's edges and an empty list, 
-# polygons approximately cover significant objects on the image.
-# Returns that edited image
-def makeConvexHulls(contours, hierarchy, img, reformat=True):
-    imgArea = img.shape[0] * img.shape[1] # area of original image
-    hullIndices = []
-    hullPoints = []
-    for i in range(len(contours)):
-        # creating convex hull object for each contour
-        if cv2.contourArea(contours[i])/imgArea < 0.05: # hulls must be smaller than 5% of the image
-            hullIndices.append(i) # keeps track of indices of legal Convex Hulls in contours
-            hullPoints.append(cv2.convexHull(contours[i], False))
-
-    hierMap = makeHierMap(hullIndices, hierarchy)
-    hullLenDict = {}
-    for hier in hierMap.keys():
-        hullLenDict[len(hierMap[hier])] = hier
-    
-    hullPoints = [hullPoints[ind] for ind in hierMap[hullLenDict[min(hullLenDict.keys())]]] # captures all Convex Hull points from the hierarchy tier with the least # of hulls
-    if reformat:
-        hullPoints = reformatHullPoints(hullPoints)
-    
-    return hullPoints
-
-img_contours, img_hier = prepImage(img)
-hulls = makeConvexHulls(img_contours, img_hier, img, reformat=False)
-drawContoursOntoImage(img, hulls)
-
-plt.figure(figsize=(12, 5))
-
-plt.subplot(1, 2, 1)
-plt.imshow(img)
-plt.title("Original Image")
-plt.axis("off")
-
-# plt.subplot(1, 2, 2)
-# plt.imshow(img_blur_edges)
-# plt.title("Canny Edge Image")
-# plt.axis("off")
-
-# plt.subplot(1, 2, 2)
-# plt.imshow(img_hull)
-# plt.title("Hulled Image")
-# plt.axis("off")
-
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+"""This module tries making Convex Hulls around images using the Canny Edge Detection technique:
+basically turning an image into a binary one by making pixels with dratic color change one color and every other pixel another.
+Code was used from https://learnopencv.com/edge-detection-using-opencv/"""
+
+import numpy as np
+
+import Instrumentation
+
+# OpenCV and Matplotlib are only imported inside the functions that use them, so importing this module is cheap
+# and has no side effects. The default classroom image is only read when getImage() is called.
+DEFAULT_IMAGE_PATH = "sample_classrooms/circle_classroom.png"
+
+# The file extensions of the images read from a folder, by Streaming.py and BatchPlanner.py
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+# The parameters of the obstacle detection. The blur kernel sizes are given for a 1500x1111 reference image and
+# scaled to the size of the actual image, the area threshold is the largest fraction of the image a hull may cover.
+# The simplify tolerance (in pixels) and the smallest hull area (in square pixels) are those of HullCleanup.cleanHulls
+DETECTION_PARAMS = {"blur": 25, "edgeBlur": 15, "cannyLow": 20, "cannyHigh": 40, "areaThreshold": 0.05,
+                    "simplifyTolerance": 1.0, "minHullArea": 16.0}
+
+# Computes the hierarchy of every contour at once from the list of hierarchy arrays: 1 for outermost contours,
+# 2 for the contours directly inside them, and so on. Instead of walking the parent chain of each contour on its own,
+# all the parent pointers are followed together one level per pass. Returns a NumPy array indexed like contours
+def getHierarchies(hierarchy):
+    parents = np.asarray(hierarchy[0])[:, 3]
+    hiers = np.ones(len(parents), dtype=np.int64)
+    current = parents.copy()
+    inside = current != -1
+    while inside.any():
+        hiers[inside] += 1
+        current[inside] = parents[current[inside]]
+        inside = current != -1
+    return hiers
+
+# makes a hashmap (as Python calls it, a dictionary) where the keys are the possible hierarchies
+# of Convex Hulls and the values are the indices of the Hull points which are in that hierarchy.
+# Returns the hashmap
+def makeHierMap(hullIndices, hierarchy):
+    hierMap = {}
+    hiers = getHierarchies(hierarchy)[np.asarray(hullIndices, dtype=np.int64)]
+    for i, hier in enumerate(hiers.tolist()):
+        hierMap.setdefault(hier, []).append(i)
+    return hierMap
+
+# Computes the area of every contour at once with the shoelace formula, giving the same values as
+# cv2.contourArea. Returns a NumPy array indexed like contours
+def contourAreas(contours):
+    if len(contours) == 0:
+        return np.zeros(0)
+    lengths = np.array([len(contour) for contour in contours])
+    pts = np.concatenate([np.asarray(contour).reshape(-1, 2) for contour in contours]).astype(np.float64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    nextIdx = np.arange(len(pts)) + 1
+    nextIdx[starts + lengths - 1] = starts # the last point of each contour wraps around to its first
+    cross = pts[:, 0] * pts[nextIdx, 1] - pts[nextIdx, 0] * pts[:, 1]
+    return np.abs(np.add.reduceat(cross, starts)) / 2
+
+# Returns the Hull Points as a list, indexed like the Convex Hulls,
+# of (n,2) NumPy arrays of the corresponding coordinates
+def reformatHullPoints(hullPts):
+    return [np.asarray(hull).reshape(-1, 2) for hull in hullPts]
+
+# Reads the classroom image at the given path. Raises FileNotFoundError if OpenCV can't read it
+def getImage(path=DEFAULT_IMAGE_PATH):
+    import cv2
+    img = cv2.imread(path)
+    if img is None:
+        raise FileNotFoundError("could not read classroom image: " + str(path))
+    return img
+
+def prepImage(img, blur=25, edgeBlur=15, cannyLow=20, cannyHigh=40):
+    # hullFile.write("Image coordinates:\n")
+    # hullFile.write("0,0\n" + str(img.shape[1]) + ",0\n" + str(img.shape[0]) + "," + str(img.shape[1]) + "\n0," + str(img.shape[0]) + "\n\n")
+
+    with Instrumentation.stage("prepImage", pixels=lambda: img.shape[0] * img.shape[1]) as st:
+        contours, hierarchy = _findObstacleContours(img, blur, edgeBlur, cannyLow, cannyHigh)
+        st.count(contours=len(contours))
+    return contours, hierarchy
+
+# The blur kernel of the given size for a 1500x1111 reference image, scaled to an image of the given (height, width)
+def blurKernel(size, shape):
+    return (int(size/1111 * shape[0]), int(size/1500 * shape[1]))
+
+def _findObstacleContours(img, blur, edgeBlur, cannyLow, cannyHigh):
+    import cv2
+    img_invert = cv2.bitwise_not(img) # turns every pixel of image into its negative. More likely to darken image, which makes edges more apparent
+    img_blur = cv2.blur(img_invert, blurKernel(blur, img.shape)) # blurs the image. Done to make detected edges surround more obvious features of image
+
+    img_edges = cv2.Canny(image=img_blur, threshold1=cannyLow, threshold2=cannyHigh) # Canny Edge Detection. Works SHOCKINGLY well with detecting objects
+    img_blur_edges = cv2.blur(img_edges, blurKernel(edgeBlur, img.shape)) # blurs the image AGAIN so Convex Hulls surround most obvious objects
+
+    contours, hierarchy = cv2.findContours(img_blur_edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE) # makes coordinates of Convex Hulls in the form of an array of array of coordinates
+    # NOTE: "hierarchy" is a list of arrays that correspond to the indices of Convex Hull points such that for each index i in contours list:
+    # - hierarchy[0][i][0] presents contour directly NEXT to contours[i]
+    # - hierarchy[0][i][1] presents contour directly PREVIOUS to contours[i]
+    # - hierarchy[0][i][2] presents first child of contour[i], i.e. first contour inside contour[i]
+    # - hierarchy[0][i][3] presents parent of contour[i], i.e. immediate contour surrounding contour[i]
+    
+    return contours, hierarchy
+
+# actually draws the convex hulls onto the given image
+def drawContoursOntoImage(img, hullPts): 
+    import cv2
+    # draw contours and hull points
+    for i in range(len(hullPts)):
+        color = (255, 0, 0) # red - color for convex hull
+        # draw ith convex hull object
+        cv2.drawContours(img, hullPts, i, color, 2, 8)
+
+# Given an image, contours from the image's edges and an empty list, 
+# polygons approximately cover significant objects on the image.
+# Returns that edited image
+def makeConvexHulls(contours, hierarchy, img, reformat=True, areaThreshold=0.05):
+    import cv2
+    with Instrumentation.stage("makeConvexHulls", contours=len(contours)) as st:
+        imgArea = img.shape[0] * img.shape[1] # area of original image
+        # keeps track of indices of legal Convex Hulls in contours, hulls must be smaller than 5% of the image by default
+        hullIndices = np.flatnonzero(contourAreas(contours)/imgArea < areaThreshold)
+        if len(hullIndices) == 0:
+            return []
+
+        hierMap = makeHierMap(hullIndices, hierarchy)
+        hullLenDict = {}
+        for hier in hierMap.keys():
+            hullLenDict[len(hierMap[hier])] = hier
+
+        # creating convex hull object only for the contours in the hierarchy tier with the least # of hulls
+        hullPoints = [cv2.convexHull(contours[hullIndices[ind]], False) for ind in hierMap[hullLenDict[min(hullLenDict.keys())]]]
+        if reformat:
+            hullPoints = reformatHullPoints(hullPoints)
+        st.count(hulls=len(hullPoints), hullVertices=lambda: sum(len(hull) for hull in hullPoints))
+    
+    return hullPoints
+
+# Runs prepImage, makeConvexHulls and the hull cleanup on an image with the given detection parameters,
+# any parameter not given is taken from DETECTION_PARAMS. Returns the reformatted, cleaned up hulls
+def detectHulls(img, **params):
+    import HullCleanup
+    params = dict(DETECTION_PARAMS, **params)
+    areaThreshold = params.pop("areaThreshold")
+    tolerance = params.pop("simplifyTolerance")
+    minArea = params.pop("minHullArea")
+    img_contours, img_hier = prepImage(img, **params)
+    hulls = makeConvexHulls(img_contours, img_hier, img, areaThreshold=areaThreshold)
+    return HullCleanup.cleanHulls(hulls, tolerance, minArea)
+
+# Runs the hull detection on the default classroom image and shows the result
+def main():
+    import matplotlib.pyplot as plt
+
+    img = getImage()
+    img_contours, img_hier = prepImage(img)
+    hulls = makeConvexHulls(img_contours, img_hier, img, reformat=False)
+    drawContoursOntoImage(img, hulls)
+
+    plt.figure(figsize=(12, 5))
+
+    plt.subplot(1, 2, 1)
+    plt.imshow(img)
+    plt.title("Original Image")
+    plt.axis("off")
+
+    # plt.subplot(1, 2, 2)
+    # plt.imshow(img_blur_edges)
+    # plt.title("Canny Edge Image")
+    # plt.axis("off")
+
+    # plt.subplot(1, 2, 2)
+    # plt.imshow(img_hull)
+    # plt.title("Hulled Image")
+    # plt.axis("off")
+
+    plt.tight_layout()
+    plt.show()
+
+if __name__ == "__main__":
+    main()
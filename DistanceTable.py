@@ -0,0 +1,254 @@
+"""
+This file holds the precomputed distance tables of a navigation mesh, for the questions that only need the length
+of a route and not the route itself, such as how far a robot is from each of a list of destinations.
+
+A DistanceTable holds the exact shortest path distance from a set of source triangles to every triangle, one row
+per source, as a NumPy array kept next to the mesh (and in the MeshCache). Which sources are used depends on the
+size of the room:
+
+- small rooms get a row for every triangle, the all-pairs table, and every distance is a lookup
+- larger rooms get a row for a few landmarks spread out over the room, plus the destinations the caller asks for.
+  Distances from those are lookups, and since the graph is undirected so are the distances to them.
+
+For any other pair the landmarks give the ALT lower bound (A*, landmarks and the triangle inequality):
+d(u,v) >= |d(L,v) - d(L,u)| for every landmark L. It is admissible and consistent like the straight line
+distance, but follows the obstacles, so A* with it expands far fewer triangles.
+
+The tables hold the distances of the full centroid graph. Restricting the edges to a robot radius only makes paths
+longer, so the lower bounds stay valid for any radius, but the lookups don't.
+"""
+
+import math
+
+import networkx as nx
+import numpy as np
+
+import Instrumentation
+import PathSearch
+
+
+def distanceRows(navMesh, sources):
+    """
+    Computes the shortest path distance from each source triangle to every triangle of a mesh.
+
+    Parameters:
+    navMesh: NavMesh
+    This is the mesh whose centroid graph is searched.
+
+    sources: iterable of int
+    These are the triangle indices the distances are measured from.
+
+    Returns:
+    numpy.ndarray
+    This is a (k,n) float array, inf where a triangle can't be reached from the source.
+    """
+    sources = np.asarray(sources, dtype=np.intp).reshape(-1)
+    rows = np.full((len(sources), len(navMesh)), np.inf)
+    adj = navMesh.adjacencyLists()
+    for row, source in zip(rows, sources.tolist()):
+        dist = PathSearch.distances(navMesh, source, adj=adj)
+        row[np.fromiter(dist.keys(), dtype=np.intp, count=len(dist))] = np.fromiter(dist.values(), dtype=float,
+                                                                                   count=len(dist))
+    return rows
+
+
+def farthestLandmarks(navMesh, count, seeds=()):
+    """
+    Picks landmarks spread out over a mesh by farthest point selection: each landmark is the triangle farthest by
+    path from the landmarks picked before it. Triangles that can't be reached from any of them count as the
+    farthest, so every part of a split room gets a landmark before any part gets a second one.
+
+    Parameters:
+    navMesh: NavMesh
+    This is the mesh to pick landmarks on.
+
+    count: int
+    This is the number of landmarks picked, on top of the seeds.
+
+    seeds: iterable of int
+    These are triangles whose rows are wanted anyway, such as destinations, which count as already picked.
+
+    Returns:
+    tuple[numpy.ndarray, numpy.ndarray]
+    These are the indices of the seeds followed by the landmarks, and their rows of distances from distanceRows().
+    """
+    n = len(navMesh)
+    sources = list(dict.fromkeys(int(s) for s in seeds))
+    rows = list(distanceRows(navMesh, sources))
+    seeded = bool(rows)
+    picked = np.zeros(n, dtype=bool)
+    picked[sources] = True
+    # the distance from every triangle to its nearest pick, without seeds the first landmark is the triangle
+    # farthest from an arbitrary one, which lies on the edge of the room
+    nearest = np.min(rows, axis=0) if rows else distanceRows(navMesh, [0])[0]
+    for i in range(count):
+        if picked.all():
+            break
+        pick = int(np.argmax(np.where(picked, -1.0, nearest)))
+        row = distanceRows(navMesh, [pick])[0]
+        nearest = row if i == 0 and not seeded else np.minimum(nearest, row)
+        sources.append(pick)
+        rows.append(row)
+        picked[pick] = True
+    return np.asarray(sources, dtype=np.intp), np.asarray(rows).reshape(-1, n)
+
+
+class DistanceTable:
+    """
+    Exact shortest path distances from a set of source triangles to every triangle of a mesh, see the top of this
+    file. Make one with build().
+
+    Parameters:
+    navMesh: NavMesh
+    This is the mesh the distances are measured on.
+
+    sources: numpy.ndarray
+    These are the (k,) triangle indices with a row in the table.
+
+    distances: numpy.ndarray
+    This is the (k,n) array of the distances from each source to every triangle, inf where it can't be reached.
+    """
+
+    # names of the arrays of the table, as saved into the MeshCache next to the mesh
+    ARRAY_NAMES = ("distanceSources", "distances")
+
+    def __init__(self, navMesh, sources, distances):
+        self.navMesh = navMesh
+        self.sources = np.asarray(sources, dtype=np.intp)
+        self.distances = distances
+        self.rowOf = np.full(len(navMesh), -1, dtype=np.intp)
+        self.rowOf[self.sources] = np.arange(len(self.sources))
+        self._bounds = {}
+
+    @classmethod
+    def build(cls, navMesh, landmarks=16, destinations=(), allPairsLimit=1000):
+        """
+        Precomputes the distance table of a mesh.
+
+        Parameters:
+        navMesh: NavMesh
+        This is the mesh to measure.
+
+        landmarks: int
+        This is the number of landmarks picked by farthestLandmarks() in a room too large for the all-pairs table.
+
+        destinations: iterable of int
+        These are triangles that get a row of their own, so every distance to them is a lookup.
+
+        allPairsLimit: int
+        This is the largest number of triangles for which every triangle gets a row. The table takes n*n*8 bytes
+        and n single source searches to build, about 8 MB and a few seconds at the default.
+
+        Returns:
+        DistanceTable
+        """
+        n = len(navMesh)
+        with Instrumentation.stage("distanceTable", triangles=n) as st:
+            if n <= allPairsLimit:
+                sources = np.arange(n)
+                distances = distanceRows(navMesh, sources)
+            else:
+                sources, distances = farthestLandmarks(navMesh, landmarks, destinations)
+            st.count(rows=len(sources))
+        return cls(navMesh, sources, distances)
+
+    @property
+    def allPairs(self):
+        """True if every triangle has a row, so every distance is a lookup."""
+        return len(self.sources) == len(self.navMesh)
+
+    def toArrays(self):
+        """
+        Returns the arrays of the table in a dict keyed by ARRAY_NAMES, for saving it to disk.
+        """
+        return {"distanceSources": self.sources, "distances": self.distances}
+
+    @classmethod
+    def fromArrays(cls, navMesh, arrays):
+        """
+        Makes a table back from the arrays of toArrays, for the mesh it was built on.
+        """
+        return cls(navMesh, arrays["distanceSources"], arrays["distances"])
+
+    def distance(self, u, v):
+        """
+        Returns the shortest path distance between two triangles, inf if one can't be reached from the other. This
+        is a lookup if either of them has a row, otherwise an A* search using the landmark heuristic.
+        """
+        if self.rowOf[u] >= 0:
+            return float(self.distances[self.rowOf[u], v])
+        if self.rowOf[v] >= 0:
+            return float(self.distances[self.rowOf[v], u])
+        try:
+            return PathSearch.astar(self.navMesh, u, v, self.heuristic())[1]
+        except nx.NetworkXNoPath:
+            return math.inf
+
+    def costs(self, source, targets, stats=None):
+        """
+        Returns the shortest path distances from one triangle to many.
+
+        Parameters:
+        source: int
+        This is the triangle the distances are measured from.
+
+        targets: iterable of int
+        These are the triangles the distances are measured to.
+
+        stats: SearchStats, optional
+        This is the counter object the work of a search is added to, when the distances can't be looked up.
+
+        Returns:
+        numpy.ndarray
+        This is the float array of the distance to each target, inf where it can't be reached. It is one row of
+        the table if the source has a row or every target does, otherwise the result of a single Dijkstra search
+        from the source that stops once every target is reached.
+        """
+        targets = np.asarray(targets, dtype=np.intp).reshape(-1)
+        if self.rowOf[source] >= 0:
+            return self.distances[self.rowOf[source], targets].astype(float)
+        rows = self.rowOf[targets]
+        if (rows >= 0).all():
+            return self.distances[rows, source].astype(float)
+        dist = PathSearch.distances(self.navMesh, source, targets.tolist(), stats, adj=self.navMesh.adjacencyLists())
+        return np.array([dist.get(t, math.inf) for t in targets.tolist()])
+
+    def lowerBounds(self, target):
+        """
+        Returns the lower bound on the distance from every triangle to a target: its exact distance if the target
+        has a row, otherwise the larger of the straight line distance between the centroids and the landmark bound.
+        Triangles that can't reach the target get 0, since no search from them finds it anyway.
+        """
+        mesh = self.navMesh
+        if self.rowOf[target] >= 0:
+            bounds = np.array(self.distances[self.rowOf[target]], dtype=float)
+        else:
+            offset = mesh.centroids - mesh.centroids[target]
+            bounds = np.hypot(offset[:, 0], offset[:, 1])
+            if len(self.sources):
+                toTarget = self.distances[:, target][:, None]
+                with np.errstate(invalid="ignore"):
+                    landmark = np.abs(self.distances - toTarget)
+                # a landmark that reaches only one of the two proves nothing here, only that there is no path
+                landmark[~(np.isfinite(self.distances) & np.isfinite(toTarget))] = 0.0
+                bounds = np.maximum(bounds, landmark.max(axis=0))
+        bounds[~np.isfinite(bounds)] = 0.0
+        return bounds
+
+    def heuristic(self):
+        """
+        Makes the landmark heuristic for PathSearch.astar and PathSearch.bidirectional. The bounds towards the last
+        few targets it was asked about are kept as lists, so each call is a lookup.
+
+        Returns:
+        function(u, v) -> float, a lower bound on the distance from triangle u to triangle v.
+        """
+        bounds = self._bounds
+
+        def heuristic(u, v):
+            if v not in bounds:
+                if len(bounds) >= 4:
+                    bounds.pop(next(iter(bounds)))
+                bounds[v] = self.lowerBounds(v).tolist()
+            return bounds[v][u]
+        return heuristic
@@ -0,0 +1,138 @@
+"""
+This file holds the path smoothing of the planner. The shortest path through the centroid graph goes from triangle
+centroid to triangle centroid, so it zig-zags through every triangle of the corridor and is longer than the
+shortest path through the free space. The simple stupid funnel algorithm (string pulling) pulls it taut: walking
+along the portals, the edges shared by consecutive triangles of the corridor, it keeps the funnel of directions
+that see through every portal so far, and adds a waypoint at a portal corner whenever the funnel closes.
+
+The result is the shortest path inside the corridor, with a waypoint only at the obstacle corners it bends around.
+
+Algorithm from: http://digestingduck.blogspot.com/2010/03/simple-stupid-funnel-algorithm.html
+"""
+
+import numpy as np
+
+
+def corridorPortals(navMesh, nodes):
+    """
+    Finds the portal edge between each pair of consecutive triangles of a corridor, with its endpoints ordered as
+    seen walking through it.
+
+    Parameters:
+    navMesh: NavMesh
+    This is the navigation mesh the corridor is in.
+
+    nodes: list[int]
+    These are the triangle indices of the corridor, as found by the search.
+
+    Returns:
+    tuple[numpy.ndarray, numpy.ndarray]
+    These are the (k,2) arrays of the left and right endpoints of the k = len(nodes)-1 portals, where the left
+    endpoint is on the side of a positive cross product with the walking direction.
+    """
+    edgeIds = []
+    for a, b in zip(nodes[:-1], nodes[1:]):
+        lo, hi = navMesh.indptr[a], navMesh.indptr[a + 1]
+        at = np.searchsorted(navMesh.indices[lo:hi], b) # the neighbors of each triangle are sorted
+        edgeIds.append(navMesh.edgeIds[lo + at])
+    edgeIds = np.asarray(edgeIds, dtype=np.intp)
+    portals = navMesh.portals[edgeIds]
+    u = navMesh.vertices[portals[:, 0]]
+    v = navMesh.vertices[portals[:, 1]]
+
+    # the vertex of the triangle left behind that is not on the portal tells which side is which: facing away
+    # from it, v is on the left of the portal when it is on the left of u->v
+    behind = navMesh.triangles[np.asarray(nodes[:-1], dtype=np.intp)]
+    onPortal = (behind == portals[:, :1]) | (behind == portals[:, 1:])
+    w = navMesh.vertices[behind[~onPortal]]
+    vLeft = _cross(u, v, w) > 0
+    left = np.where(vLeft[:, None], v, u)
+    right = np.where(vLeft[:, None], u, v)
+    return left, right
+
+
+def _cross(o, a, b):
+    # the z component of (a - o) x (b - o), for arrays of points
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+
+def stringPull(start, goal, left, right):
+    """
+    Runs the funnel algorithm through a sequence of portals.
+
+    Parameters:
+    start, goal: tuple[float,float]
+    These are the (x,y) endpoints of the path.
+
+    left, right: numpy.ndarray
+    These are the (k,2) arrays of the left and right endpoints of the portals between them, from corridorPortals().
+
+    Returns:
+    list[tuple[float,float]]
+    This is the taut path from start to goal, bending only at portal endpoints.
+    """
+    start = tuple(map(float, start))
+    goal = tuple(map(float, goal))
+    portals = [(start, start)] + list(zip(map(tuple, left.tolist()), map(tuple, right.tolist()))) + [(goal, goal)]
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    path = [start]
+    apex = portalLeft = portalRight = start
+    apexIndex = leftIndex = rightIndex = 0
+    i = 1
+    while i < len(portals):
+        newLeft, newRight = portals[i]
+
+        # tightens the right side of the funnel, unless that would cross over the left side, in which case the
+        # left corner becomes a waypoint and the funnel restarts from it
+        if cross(apex, portalRight, newRight) >= 0:
+            if apex == portalRight or cross(apex, portalLeft, newRight) < 0:
+                portalRight, rightIndex = newRight, i
+            else:
+                path.append(portalLeft)
+                apex, apexIndex = portalLeft, leftIndex
+                portalLeft = portalRight = apex
+                leftIndex = rightIndex = apexIndex
+                i = apexIndex + 1
+                continue
+
+        # the same for the left side
+        if cross(apex, portalLeft, newLeft) <= 0:
+            if apex == portalLeft or cross(apex, portalRight, newLeft) > 0:
+                portalLeft, leftIndex = newLeft, i
+            else:
+                path.append(portalRight)
+                apex, apexIndex = portalRight, rightIndex
+                portalLeft = portalRight = apex
+                leftIndex = rightIndex = apexIndex
+                i = apexIndex + 1
+                continue
+        i += 1
+
+    if path[-1] != goal:
+        path.append(goal)
+    return path
+
+
+def smoothPath(navMesh, nodes, start, goal):
+    """
+    Pulls the path through a triangle corridor taut.
+
+    Parameters:
+    navMesh: NavMesh
+    This is the navigation mesh the corridor is in.
+
+    nodes: list[int]
+    These are the triangle indices of the corridor, from the start triangle to the goal triangle.
+
+    start, goal: tuple[float,float]
+    These are the (x,y) endpoints of the path, inside the first and last triangles of the corridor.
+
+    Returns:
+    list[tuple[float,float]]
+    This is the smoothed path from start to goal.
+    """
+    left, right = corridorPortals(navMesh, nodes)
+    return stringPull(start, goal, left, right)
@@ -0,0 +1,133 @@
+"""
+This file holds the cleanup stage run on the obstacle hulls between makeConvexHulls and the classroom polygon.
+The raw cv2.convexHull output is not a good set of holes for the triangulation:
+
+- curved desks give hulls with dozens of nearly collinear vertices, each of which becomes a CDT vertex
+- hulls that overlap or touch make the classroom polygon invalid
+- tiny slivers left over from the edge detection add triangles without blocking anything
+
+So every hull is simplified within a pixel tolerance, overlapping and touching hulls are merged into one, and what
+is left below an area threshold is dropped. compareHulls() triangulates the classroom with the raw and the cleaned
+hulls, to see how much accuracy a tolerance trades for how many triangles.
+"""
+
+import numpy as np
+import shapely
+
+import Instrumentation
+from ObstacleIndex import geometryArray
+
+
+def _hullArray(ring):
+    coords = shapely.get_coordinates(ring)[:-1]
+    # the hulls stay integer pixel coordinates unless merging made new corners between pixels
+    if np.array_equal(coords, np.round(coords)):
+        return coords.astype(np.int32)
+    return coords
+
+
+def _polygonParts(geoms):
+    # the non empty polygons among the parts of the geometries
+    parts = shapely.get_parts(geoms)
+    return parts[(shapely.get_type_id(parts) == 3) & (shapely.area(parts) > 0)]
+
+
+def cleanHulls(hulls, tolerance=1.0, minArea=16.0):
+    """
+    Simplifies, merges and filters the obstacle hulls.
+
+    Parameters:
+    hulls: list[numpy.ndarray]
+    These are the obstacle hulls as (n,2) arrays of (x,y) coordinates, as made by makeConvexHulls.
+
+    tolerance: float
+    This is the largest distance in pixels a simplified hull boundary may move away from the original one. A
+    convex hull stays convex, since the simplification only drops vertices. 0 keeps every vertex.
+
+    minArea: float
+    This is the area in square pixels below which a hull is dropped, after merging.
+
+    Returns:
+    list[numpy.ndarray]
+    These are the cleaned hulls as (n,2) arrays. Merged hulls are no longer convex, and free space enclosed by a
+    ring of merged hulls is filled in, since it can't be reached anyway.
+    """
+    with Instrumentation.stage("cleanHulls", hullsBefore=len(hulls),
+                               hullVerticesBefore=lambda: sum(len(hull) for hull in hulls)) as st:
+        polys = geometryArray(shapely.Polygon(np.asarray(hull).reshape(-1, 2)) for hull in hulls if len(hull) >= 3)
+        # degenerate hulls, such as ones whose points are all on a line, are fixed up or dropped
+        polys = _polygonParts(shapely.make_valid(polys))
+        if tolerance > 0:
+            polys = shapely.simplify(polys, tolerance, preserve_topology=True)
+
+        # only the hulls overlapping or touching another one go through the union, which keeps the rest as they are
+        if len(polys):
+            tree = shapely.STRtree(polys)
+            left, right = tree.query(polys, predicate="intersects")
+            overlapping = np.zeros(len(polys), dtype=bool)
+            overlapping[left[left != right]] = True
+            merged = _polygonParts(shapely.union_all(polys[overlapping])) if overlapping.any() else []
+            polys = np.concatenate([polys[~overlapping], merged])
+            polys = shapely.polygons(shapely.get_exterior_ring(polys))
+
+        cleaned = [_hullArray(ring) for ring in shapely.get_exterior_ring(polys[shapely.area(polys) >= minArea])]
+        st.count(hulls=len(cleaned), hullVertices=lambda: sum(len(hull) for hull in cleaned))
+    return cleaned
+
+
+def compareHulls(hulls, shape, tolerance=1.0, minArea=16.0):
+    """
+    Triangulates the classroom once with the raw hulls and once with the cleaned ones.
+
+    Parameters:
+    hulls: list[numpy.ndarray]
+    These are the raw obstacle hulls.
+
+    shape: tuple[int,int]
+    This is the (height, width) of the classroom.
+
+    tolerance, minArea:
+    These are passed on to cleanHulls().
+
+    Returns:
+    dict
+    This holds the number of "hulls", "vertices" and "triangles" "before" and "after" the cleanup. The triangle
+    count before is None if the raw hulls can't be triangulated, for example because two of them overlap.
+    """
+    cleaned = cleanHulls(hulls, tolerance, minArea)
+    report = {}
+    for label, hullSet in (("before", hulls), ("after", cleaned)):
+        room = shapely.Polygon([(0, 0), (0, shape[0]), (shape[1], shape[0]), (shape[1], 0)],
+                               holes=[np.asarray(hull).reshape(-1, 2) for hull in hullSet])
+        try:
+            triangles = len(shapely.constrained_delaunay_triangles(room).geoms)
+        except shapely.errors.GEOSException:
+            triangles = None
+        report[label] = {"hulls": len(hullSet), "vertices": sum(len(hull) for hull in hullSet),
+                         "triangles": triangles}
+    return report
+
+
+def main(argv=None):
+    import argparse
+
+    import ConvexHullObstacles as imgConv
+
+    parser = argparse.ArgumentParser(description="Prints the hull, vertex and triangle counts of a classroom image before and after the hull cleanup.")
+    parser.add_argument("image", nargs="?", default=imgConv.DEFAULT_IMAGE_PATH)
+    parser.add_argument("--tolerance", type=float, default=imgConv.DETECTION_PARAMS["simplifyTolerance"], help="simplify tolerance in pixels")
+    parser.add_argument("--min-area", type=float, default=imgConv.DETECTION_PARAMS["minHullArea"], help="smallest hull area kept, in square pixels")
+    args = parser.parse_args(argv)
+
+    img = imgConv.getImage(args.image)
+    contours, hierarchy = imgConv.prepImage(img)
+    hulls = imgConv.makeConvexHulls(contours, hierarchy, img, areaThreshold=imgConv.DETECTION_PARAMS["areaThreshold"])
+    report = compareHulls(hulls, img.shape[:2], args.tolerance, args.min_area)
+    for label in ("before", "after"):
+        counts = report[label]
+        triangles = "invalid polygon" if counts["triangles"] is None else "%6d triangles" % counts["triangles"]
+        print("%-7s %4d hulls %6d vertices %s" % (label, counts["hulls"], counts["vertices"], triangles))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+This file holds the local update of a navigation mesh when a single obstacle is added, removed or moved. Instead
+of running the constrained Delaunay triangulation on the whole classroom polygon again, only the triangles around
+the changed hull are taken out: the triangles touching its old or new footprint, plus one ring of the triangles
+sharing a vertex with those. The hole they leave is triangulated on its own with the new hull as a hole, and the
+new triangles are spliced into the arrays of the mesh.
+
+The boundary of the region is made of edges of the triangles that are kept, so the new triangles meet them edge
+to edge and the result is a valid triangulation of the same free space a full rebuild would triangulate. The region
+triangulated on its own is generally not Delaunay in the whole classroom though, so the edges inside and around it
+are then flipped (Lawson's algorithm) until every edge that isn't on an obstacle or wall is locally Delaunay. That
+makes it the constrained Delaunay triangulation of the classroom, which is the one a full rebuild makes: the same
+triangles, centroid edges and clearances, only at other indices. The one exception is four vertices on one circle,
+where either diagonal is Delaunay and the two may pick different ones.
+The triangles outside the region keep their index, apart from the few flipped ones and a few taken from the end of
+the arrays to fill freed slots when the region ends up with fewer triangles than before.
+
+The vertices of a removed or moved hull are no longer used by any triangle after the update. They are left in the
+vertex array, so the indices of the other vertices stay put, until more than COMPACT_SLACK of the array is unused,
+at which point the array is compacted. The memory of a long stream of updates therefore stays bounded.
+"""
+
+import numpy as np
+import shapely
+
+from NavMesh import NavMesh, portalClearance, sharedEdges, triangleCoords, triangleNeighbors
+
+# the fraction of the vertex array that may be left unused by updates before it is compacted
+COMPACT_SLACK = 0.25
+
+
+class MeshPatch:
+    """
+    The result of replaceObstacle().
+
+    Attributes:
+    navMesh: NavMesh
+    This is the updated navigation mesh.
+
+    changed: numpy.ndarray
+    These are the indices of the triangles of the new mesh whose triangle is new or was moved to another index.
+
+    removed: numpy.ndarray
+    These are the indices of the old mesh past the end of the new one, whose nodes no longer exist.
+
+    retriangulated: int
+    This is the number of triangles of the old mesh that were taken out and triangulated again, or flipped.
+
+    recleared: numpy.ndarray
+    These are the indices into navMesh.pairs of the edges between unchanged triangles whose clearance was computed
+    again, since the hull changed near them.
+    """
+
+    def __init__(self, navMesh, changed, removed, retriangulated, recleared):
+        self.navMesh = navMesh
+        self.changed = changed
+        self.removed = removed
+        self.retriangulated = retriangulated
+        self.recleared = recleared
+
+
+def _affectedTriangles(locator, oldPoly, newPoly):
+    # the triangles touching the old or new footprint of the hull, plus every triangle sharing a vertex with them
+    footprints = [poly for poly in (oldPoly, newPoly) if poly is not None]
+    hit = np.unique(np.concatenate([locator.tree.query(poly, predicate="intersects") for poly in footprints]))
+    if len(hit) == 0:
+        return hit
+    core = shapely.coverage_union_all(locator.polygons[hit])
+    return np.unique(locator.tree.query(core, predicate="intersects"))
+
+
+def _fillSlots(triangles, removed, newTriangles):
+    # puts the new triangles into the slots of the removed ones, appending the extra ones or, when there are fewer,
+    # moving triangles from the end of the array into the slots left over
+    n = len(triangles)
+    k = len(newTriangles)
+    triangles = np.array(triangles, dtype=np.int32) # copied, the old mesh may be memory mapped from the cache
+    if k >= len(removed):
+        triangles[removed] = newTriangles[:len(removed)]
+        triangles = np.concatenate([triangles, newTriangles[len(removed):]])
+        newSlots = np.concatenate([removed, np.arange(n, n + k - len(removed))])
+        relabel = np.arange(n)
+        relabel[removed] = -1
+        return triangles, newSlots, relabel, np.zeros(0, dtype=np.intp)
+
+    triangles[removed[:k]] = newTriangles
+    free = removed[k:]
+    newN = n - len(free)
+    holes = free[free < newN]
+    isFree = np.zeros(n, dtype=bool)
+    isFree[free] = True
+    tail = np.arange(newN, n)
+    movers = tail[~isFree[newN:]]
+    triangles[holes] = triangles[movers]
+
+    # relabel maps every old index to its new one, -1 for triangles that are gone
+    relabel = np.arange(n)
+    relabel[removed] = -1
+    relabel[movers] = holes
+    return triangles[:newN], removed[:k], relabel, holes
+
+
+def _inCircle(a, b, c, d):
+    # positive when d is strictly inside the circle through a, b and c, whatever the orientation of a, b, c. Values
+    # within the rounding error of the determinant count as on the circle, so nearly cocircular points are not
+    # flipped back and forth
+    adx, ady = a[0] - d[0], a[1] - d[1]
+    bdx, bdy = b[0] - d[0], b[1] - d[1]
+    cdx, cdy = c[0] - d[0], c[1] - d[1]
+    alift, blift, clift = adx * adx + ady * ady, bdx * bdx + bdy * bdy, cdx * cdx + cdy * cdy
+    det = alift * (bdx * cdy - bdy * cdx) + blift * (cdx * ady - cdy * adx) + clift * (adx * bdy - ady * bdx)
+    permanent = (alift * (abs(bdx * cdy) + abs(bdy * cdx)) + blift * (abs(cdx * ady) + abs(cdy * adx))
+                 + clift * (abs(adx * bdy) + abs(ady * bdx)))
+    if abs(det) <= 1e-12 * permanent:
+        return 0.0
+    orient = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return det if orient > 0 else -det
+
+
+def _restoreDelaunay(vertices, triangles, seeds):
+    # Lawson's edge flips: every unconstrained edge of the seed triangles, and every edge around a flipped pair, is
+    # checked, and flipped while the vertex across it is inside the circumcircle of the triangle on this side. The
+    # edges on obstacles and walls have no triangle across them and are never flipped. Changes triangles in place
+    # and returns the slots whose triangle was flipped
+    neighbors = triangleNeighbors(triangles).tolist()
+    tris = triangles.tolist()
+    pts = vertices.tolist()
+
+    def across(t, p, q):
+        # the index k of edge {p,q} in triangle t, or -1 if it isn't one of its edges
+        tri = tris[t]
+        for k in range(3):
+            if {tri[k], tri[(k + 1) % 3]} == {p, q}:
+                return k
+        return -1
+
+    stack = [(t, tris[t][k], tris[t][(k + 1) % 3]) for t in seeds.tolist() for k in range(3)]
+    flipped = set()
+    while stack:
+        t, a, b = stack.pop()
+        k = across(t, a, b)
+        if k < 0:
+            continue
+        u = neighbors[t][k]
+        if u < 0:
+            continue
+        a, b, c = tris[t][k], tris[t][(k + 1) % 3], tris[t][(k + 2) % 3]
+        d = [v for v in tris[u] if v != a and v != b][0]
+        if _inCircle(pts[a], pts[b], pts[c], pts[d]) <= 0:
+            continue
+
+        # t = (a,b,c) and u = (b,a,d) become (c,a,d) and (c,d,b), keeping the orientation of t
+        nbBC, nbCA = neighbors[t][(k + 1) % 3], neighbors[t][(k + 2) % 3]
+        nbAD, nbDB = neighbors[u][across(u, a, d)], neighbors[u][across(u, d, b)]
+        tris[t], tris[u] = [c, a, d], [c, d, b]
+        neighbors[t], neighbors[u] = [nbCA, nbAD, u], [t, nbDB, nbBC]
+        if nbAD >= 0:
+            neighbors[nbAD][neighbors[nbAD].index(u)] = t
+        if nbBC >= 0:
+            neighbors[nbBC][neighbors[nbBC].index(t)] = u
+        flipped.update((t, u))
+        stack.extend([(t, c, a), (t, a, d), (u, d, b), (u, b, c)])
+
+    flipped = np.fromiter(sorted(flipped), dtype=np.intp, count=len(flipped))
+    triangles[flipped] = np.asarray([tris[t] for t in flipped.tolist()], dtype=triangles.dtype).reshape(-1, 3)
+    return flipped
+
+
+def _compactVertices(vertices, triangles, portals):
+    # drops the vertices no triangle uses any more once there are too many of them, renumbering the rest in order
+    used = np.zeros(len(vertices), dtype=bool)
+    used[triangles] = True
+    unused = len(vertices) - int(used.sum())
+    if unused <= COMPACT_SLACK * len(vertices):
+        return vertices, triangles, portals
+    relabel = np.cumsum(used) - 1
+    return vertices[used], relabel[triangles], relabel[portals]
+
+
+def _nearRegion(vertices, triangles, pairs, clearance, bounds):
+    # the edges whose two triangles, grown by twice the clearance, overlap the (x0,y0,x1,y1) bounding box
+    coords = vertices[triangles[pairs]].reshape(len(pairs), 6, 2)
+    lo = coords.min(axis=1) - 2 * clearance[:, None]
+    hi = coords.max(axis=1) + 2 * clearance[:, None]
+    x0, y0, x1, y1 = bounds
+    return (lo[:, 0] <= x1) & (hi[:, 0] >= x0) & (lo[:, 1] <= y1) & (hi[:, 1] >= y0)
+
+
+def replaceObstacle(navMesh, locator, obstacleIndex, oldHull=None, newHull=None):
+    """
+    Updates a navigation mesh for one obstacle that is added (oldHull is None), removed (newHull is None) or
+    replaced by another one, such as the same obstacle moved.
+
+    Parameters:
+    navMesh: NavMesh
+    This is the mesh to update. It is not changed.
+
+    locator: PointLocator
+    This is the point locator of navMesh, whose STRtree finds the triangles around the hull.
+
+    obstacleIndex: ObstacleIndex
+    This is the obstacle index of the hulls after the change, used to check the new centroid edges.
+
+    oldHull: list[tuple[float,float]], optional
+    This is the hull taken out of the classroom.
+
+    newHull: list[tuple[float,float]], optional
+    This is the hull put into the classroom. It must lie inside the free space of the mesh.
+
+    Returns:
+    MeshPatch or None
+    This is None if the change can't be made locally, for example when the region around the hull is not a single
+    polygon, in which case the mesh has to be rebuilt from scratch.
+    """
+    oldPoly = shapely.Polygon(oldHull) if oldHull is not None else None
+    newPoly = shapely.Polygon(newHull) if newHull is not None else None
+    removed = _affectedTriangles(locator, oldPoly, newPoly)
+    if len(removed) == 0:
+        return None
+
+    pieces = list(locator.polygons[removed]) + ([oldPoly] if oldPoly is not None else [])
+    region = shapely.coverage_union_all(pieces)
+    if region.geom_type != "Polygon" or not region.is_valid:
+        return None
+    holes = list(region.interiors)
+    if newPoly is not None:
+        if not region.contains_properly(newPoly):
+            return None
+        holes.append(newPoly.exterior)
+    free = shapely.Polygon(region.exterior, holes)
+    newCoords = triangleCoords(shapely.constrained_delaunay_triangles(free).normalize())
+
+    # the vertices of the new triangles are vertices of the removed triangles or of the new hull, so only those
+    # are looked up and the vertices of the new hull appended
+    oldIdx = navMesh.triangles[removed].ravel()
+    lookup = {tuple(pt): i for i, pt in zip(oldIdx.tolist(), navMesh.vertices[oldIdx].tolist())}
+    vertices = navMesh.vertices
+    added = []
+    newIdx = []
+    for pt in newCoords.reshape(-1, 2).tolist():
+        pt = tuple(pt)
+        if pt not in lookup:
+            lookup[pt] = len(vertices) + len(added)
+            added.append(pt)
+        newIdx.append(lookup[pt])
+    if added:
+        vertices = np.concatenate([vertices, np.asarray(added, dtype=np.float64)])
+    newTriangles = np.asarray(newIdx, dtype=np.int32).reshape(-1, 3)
+
+    triangles, newSlots, relabel, moved = _fillSlots(navMesh.triangles, removed, newTriangles)
+
+    # the region was triangulated on its own, so the edges along its boundary and inside it need not be Delaunay
+    # in the whole classroom. Flipping them, and the edges the flips spread to, gives the triangulation a full
+    # rebuild would make
+    flipped = np.setdiff1d(_restoreDelaunay(vertices, triangles, newSlots), newSlots)
+    newSlots = np.union1d(newSlots, flipped)
+    isNew = np.zeros(len(triangles), dtype=bool)
+    isNew[newSlots] = True
+
+    # edges between two kept triangles stay as they were, apart from the relabelling of moved triangles
+    kept = relabel[navMesh.pairs]
+    keep = (kept >= 0).all(axis=1)
+    keep[keep] = ~isNew[kept[keep]].any(axis=1)
+    keptPairs = np.sort(kept[keep], axis=1)
+    keptPortals = navMesh.portals[keep]
+
+    # the new triangles are paired among themselves and with the kept triangles sharing a vertex with them
+    onNew = np.zeros(len(vertices), dtype=bool)
+    onNew[triangles[newSlots]] = True
+    local = np.flatnonzero(onNew[triangles].any(axis=1))
+    localPairs, localPortals = sharedEdges(triangles[local])
+    localPairs = local[localPairs]
+    touching = isNew[localPairs].any(axis=1)
+    localPairs, localPortals = localPairs[touching], localPortals[touching]
+    centroids = vertices[triangles[localPairs]].mean(axis=2)
+    blocked = obstacleIndex.segmentsIntersect(centroids[:, 0], centroids[:, 1])
+
+    localPairs, localPortals = localPairs[~blocked], localPortals[~blocked]
+
+    pairs = np.concatenate([keptPairs, localPairs])
+    portals = np.concatenate([keptPortals, localPortals])
+
+    # the clearance of a kept edge is worked out from the triangles within its width of the edge, so it only
+    # changes when the retriangulated region is that close
+    clearance = np.empty(len(pairs))
+    clearance[:len(keptPairs)] = navMesh.edgeClearance[keep]
+    newCorners = vertices[triangles[newSlots]].reshape(-1, 2)
+    bounds = (*newCorners.min(axis=0), *newCorners.max(axis=0))
+    near = _nearRegion(vertices, triangles, keptPairs, clearance[:len(keptPairs)], bounds)
+    recompute = np.concatenate([np.flatnonzero(near), np.arange(len(keptPairs), len(pairs))])
+    clearance[recompute] = portalClearance(vertices, triangles, pairs, portals, recompute)
+    vertices, triangles, portals = _compactVertices(vertices, triangles, portals)
+    mesh = NavMesh(vertices, triangles, pairs, portals, clearance)
+
+    changed = np.union1d(newSlots, moved)
+    gone = np.arange(len(triangles), len(navMesh.triangles))
+    return MeshPatch(mesh, changed, gone, len(removed) + len(flipped), np.flatnonzero(near))
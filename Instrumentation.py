@@ -0,0 +1,261 @@
+"""
+This file holds the timing and profiling instrumentation of the planning pipeline. Each stage of the pipeline
+(image preprocessing, hull extraction, triangulation, centroid graph, search and rendering) is wrapped in a
+stage() block, which records its wall time, peak memory and counters such as the number of triangles, edges, hull
+vertices or nodes expanded.
+
+Instrumentation is off by default, and stage() then hands back one shared do nothing object, so the wrapped code
+pays for a single function call and nothing else. Counters that take more work than a len() are passed as functions,
+which are only called while it is on. Turning it on:
+
+    import Instrumentation
+    Instrumentation.enable("timings.jsonl")               # one JSON line per finished stage
+    Instrumentation.enable(profile=True, traceMemory=True) # adds cProfile and tracemalloc
+    ...
+    recorder = Instrumentation.disable()
+    print(recorder.summary())
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+class _NullStage:
+    # stands in for a Stage while instrumentation is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, **counters):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """
+    One timed run of a pipeline stage, made by Recorder.stage().
+    """
+
+    def __init__(self, recorder, name, counters):
+        self.recorder = recorder
+        self.name = name
+        self.counters = {}
+        self.count(**counters)
+
+    def count(self, **counters):
+        """
+        Adds counters to the record of this stage, such as triangles=len(tris). A counter that takes more work
+        than that is given as a function returning it, such as vertices=lambda: sum(map(len, hulls)), which is
+        only called here, so it costs nothing while instrumentation is off.
+        """
+        self.counters.update((key, value() if callable(value) else value) for key, value in counters.items())
+
+    def __enter__(self):
+        self.recorder._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wallTime = time.perf_counter() - self.start
+        self.recorder._exit(self, failed=exc[0] is not None)
+        return False
+
+
+class Recorder:
+    """
+    Collects the records of the pipeline stages.
+
+    Parameters:
+    output: str or file, optional
+    This is a path or an open text file each finished stage is written to as one JSON line.
+
+    profile: bool
+    If True every stage also runs under cProfile, see printProfile() and dumpProfile(). A profiler follows one
+    thread, so only the stages of the thread that made the recorder are profiled.
+
+    traceMemory: bool
+    If True the peak Python memory allocated by each stage is measured with tracemalloc. Otherwise only the peak
+    resident size of the whole process is recorded, which is much cheaper. tracemalloc has one peak for the whole
+    process, so the peak of a stage includes what other threads allocated while it ran.
+
+    Stages may be recorded from several threads, such as the figures Rendering.renderAsync saves on its worker
+    thread. Each thread nests its own stages.
+    """
+
+    def __init__(self, output=None, profile=False, traceMemory=False):
+        self.records = []
+        self._ownsOutput = isinstance(output, str)
+        self.output = open(output, "a") if self._ownsOutput else output
+        self.profiler = cProfile.Profile() if profile else None
+        self.traceMemory = traceMemory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profiledThread = threading.get_ident()
+        self._startedTracing = traceMemory and not tracemalloc.is_tracing()
+        if self._startedTracing:
+            tracemalloc.start()
+
+    def stage(self, name, **counters):
+        return Stage(self, name, counters)
+
+    def _openStages(self):
+        # the stages open on the calling thread, innermost last
+        if not hasattr(self._local, "stages"):
+            self._local.stages = []
+        return self._local.stages
+
+    def _profiling(self, opened):
+        # the profiler is turned on and off around the outermost stages of the thread that made the recorder
+        return self.profiler is not None and not opened and threading.get_ident() == self._profiledThread
+
+    def _enter(self, stage):
+        opened = self._openStages()
+        if self._profiling(opened):
+            self.profiler.enable()
+        if self.traceMemory:
+            # tracemalloc has a single peak, so the peak the enclosing stage reached so far is kept on it before
+            # the peak is reset for the new stage
+            if opened:
+                opened[-1].peak = max(opened[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            stage.tracedAtStart = tracemalloc.get_traced_memory()[0]
+        stage.peak = 0
+        opened.append(stage)
+
+    def _exit(self, stage, failed):
+        opened = self._openStages()
+        opened.pop()
+        if self._profiling(opened):
+            self.profiler.disable()
+        record = {"stage": stage.name, "wallTime": stage.wallTime}
+        if failed:
+            record["failed"] = True
+        if self.traceMemory:
+            peak = max(stage.peak, tracemalloc.get_traced_memory()[1])
+            # reported as the growth over what was already allocated when the stage started
+            record["peakTracedBytes"] = peak - stage.tracedAtStart
+            if opened:
+                opened[-1].peak = max(opened[-1].peak, peak)
+        if resource is not None:
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            record["peakRssBytes"] = maxrss if sys.platform == "darwin" else maxrss * 1024
+        record.update(stage.counters)
+        with self._lock:
+            self.records.append(record)
+            if self.output is not None:
+                self.output.write(json.dumps(record) + "\n")
+                self.output.flush()
+
+    def summary(self):
+        """
+        Sums up the records by stage.
+
+        Returns:
+        dict[str, dict]
+        This maps each stage name to its number of calls, total and largest wall time, and the sum of each
+        numeric counter over all calls.
+        """
+        totals = {}
+        for record in self.records:
+            entry = totals.setdefault(record["stage"], {"calls": 0, "wallTime": 0.0, "maxWallTime": 0.0})
+            entry["calls"] += 1
+            entry["wallTime"] += record["wallTime"]
+            entry["maxWallTime"] = max(entry["maxWallTime"], record["wallTime"])
+            for key, value in record.items():
+                if key in ("stage", "wallTime", "failed") or not isinstance(value, (int, float)):
+                    continue
+                if key.startswith("peak"):
+                    entry[key] = max(entry.get(key, 0), value)
+                else:
+                    entry[key] = entry.get(key, 0) + value
+        return totals
+
+    def printProfile(self, sortBy="cumulative", limit=30):
+        if self.profiler is not None:
+            pstats.Stats(self.profiler).sort_stats(sortBy).print_stats(limit)
+
+    def dumpProfile(self, path):
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+    def close(self):
+        if self._ownsOutput and self.output is not None:
+            self.output.close()
+        self.output = None
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+
+_recorder = None
+
+
+def enable(output=None, profile=False, traceMemory=False):
+    """
+    Turns instrumentation on with a new Recorder, see Recorder for the parameters.
+
+    Returns:
+    Recorder: the recorder the stages are now recorded into.
+    """
+    global _recorder
+    disable()
+    _recorder = Recorder(output, profile, traceMemory)
+    return _recorder
+
+
+def disable():
+    """
+    Turns instrumentation off.
+
+    Returns:
+    Recorder or None: the recorder that was in use, holding the records made while it was on.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+
+def recorder():
+    """
+    Returns the Recorder in use, or None if instrumentation is off.
+    """
+    return _recorder
+
+
+def enabled():
+    """
+    True if instrumentation is on, for work that is only done to be recorded.
+    """
+    return _recorder is not None
+
+
+def stage(name, **counters):
+    """
+    Wraps one run of a pipeline stage in a with block:
+
+        with Instrumentation.stage("cdt") as st:
+            tris = ...
+            st.count(triangles=len(tris))
+
+    Returns:
+    Stage, or a shared do nothing object while instrumentation is off.
+    """
+    if _recorder is None:
+        return _NULL_STAGE
+    return _recorder.stage(name, **counters)
@@ -0,0 +1,308 @@
+"""
+This file holds the obstacle detection for large, high resolution floor plans, such as scanned building plans of
+tens of megapixels, which prepImage would blur and run Canny on whole and in memory.
+
+The detection parameters are tuned on a 1500x1111 reference image, and on a much larger image the blurs, whose
+kernels grow with the image, spread every edge so thin that the 8 bit blurred image no longer has the gradients
+Canny looks for. So the obstacles are detected on one level of an image pyramid instead: the image is shrunk by a
+whole factor to about the size of the reference, strip by strip, and prepImage and makeConvexHulls run on that.
+
+The hulls are then refined back to full resolution. makeConvexHulls takes the convex hull of the Canny edges after
+the edge blur, and the blur only grows the edges by its kernel, so that hull is the convex hull of the edge pixels
+grown by the kernel's box. The full resolution image is cut into tiles, which are run in parallel threads (OpenCV
+lets go of the GIL) and read one at a time, so the image may be a memory mapped raw file much larger than RAM.
+Each tile is padded by the blur kernel, so its edges match those of the whole image, and the edge pixels inside
+each coarse hull are collected from every tile the hull touches. The refined hull is the convex hull of all of them
+grown by the edge blur box, which stitches the hulls across tile seams without any matching.
+
+    img = LargeImage.openRaw("floor.raw", (40000, 30000, 3))
+    hulls = LargeImage.detectLargeHulls(img, workers=8)
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import shapely
+
+import ConvexHullObstacles as imgConv
+import Instrumentation
+from ObstacleIndex import geometryArray
+
+# the number of pixels of the reference image the detection parameters are tuned on
+REFERENCE_PIXELS = 1500 * 1111
+
+# the most memory the tile buffers of refineHulls take together when the number of workers is not given, and the
+# bytes each pixel of a padded tile takes at the peak: the 3 color bytes, then 15 for the 16 bit blur, gradients
+# and gradient magnitude of one channel next to the strongest gradients found so far
+TILE_MEMORY_BUDGET = 2 * 1024 ** 3
+TILE_BYTES_PER_PIXEL = 18
+
+
+def openRaw(path, shape, dtype=np.uint8, offset=0):
+    """
+    Memory maps a raw image file, so only the parts of it that are used are read.
+
+    Parameters:
+    path: str
+    This is the path of the file, holding the pixels row by row with no header, BGR for color images.
+
+    shape: tuple[int,...]
+    This is the (height, width) or (height, width, channels) of the image.
+
+    dtype: numpy.dtype
+    This is the type of each pixel value.
+
+    offset: int
+    This is the number of bytes before the first pixel.
+
+    Returns:
+    numpy.memmap, read only.
+    """
+    return np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape), offset=offset)
+
+
+def pyramidFactor(shape, maxPixels=REFERENCE_PIXELS):
+    """
+    Returns the smallest whole factor that shrinks an image of the given (height, width) to at most maxPixels.
+    """
+    return max(1, math.ceil(math.sqrt(shape[0] * shape[1] / maxPixels)))
+
+
+def downsample(img, factor, stripRows=2048):
+    """
+    Shrinks an image by a whole factor, each pixel of the result being the mean of a factor x factor block. The
+    image is read a strip of rows at a time, so a memory mapped image is never loaded whole. The last rows and
+    columns that don't fill a block are dropped.
+
+    Parameters:
+    img: numpy.ndarray
+    This is the image to shrink.
+
+    factor: int
+    This is the factor the width and height are divided by.
+
+    stripRows: int
+    This is roughly the number of rows of the image read at once.
+
+    Returns:
+    numpy.ndarray, the shrunk image.
+    """
+    import cv2
+    if factor == 1:
+        return np.asarray(img)
+    height, width = img.shape[0] // factor, img.shape[1] // factor
+    rows = max(1, stripRows // factor) * factor
+    small = np.empty((height, width) + img.shape[2:], dtype=img.dtype)
+    with Instrumentation.stage("downsample", factor=factor, pixels=lambda: img.shape[0] * img.shape[1]):
+        for y in range(0, height * factor, rows):
+            strip = np.ascontiguousarray(img[y:min(y + rows, height * factor), :width * factor])
+            small[y // factor:y // factor + len(strip) // factor] = cv2.resize(
+                strip, (width, len(strip) // factor), interpolation=cv2.INTER_AREA)
+    return small
+
+
+def _tiles(shape, tileSize):
+    # the (y0, x0, y1, x1) bounds of the tiles covering an image, without overlap
+    height, width = shape[:2]
+    return [(y, x, min(y + tileSize, height), min(x + tileSize, width))
+            for y in range(0, height, tileSize) for x in range(0, width, tileSize)]
+
+
+def refineHulls(img, hulls, factor, blur=25, edgeBlur=15, cannyLow=20, cannyHigh=40, tileSize=4096, workers=None):
+    """
+    Refines hulls found on an image shrunk by a factor back to the full resolution image, see the top of this file.
+
+    Parameters:
+    img: numpy.ndarray
+    This is the full resolution image, which may be memory mapped.
+
+    hulls: list[numpy.ndarray]
+    These are the hulls found on the shrunk image, already scaled up to full resolution coordinates.
+
+    factor: int
+    This is the factor the image was shrunk by.
+
+    blur, edgeBlur, cannyLow, cannyHigh:
+    These are the prepImage parameters the hulls were found with.
+
+    tileSize: int
+    This is the width and height of the tiles the image is read in.
+
+    workers: int, optional
+    This is the number of threads the tiles are run on. By default it is the number of CPUs, but no more than fit
+    their tiles into TILE_MEMORY_BUDGET.
+
+    Returns:
+    list[numpy.ndarray]
+    These are the refined hulls as (n,2) int32 arrays, in the same order. A hull with no edge inside it at full
+    resolution is kept as it was.
+
+    Each worker holds one tile padded by the blur kernel on every side, at about TILE_BYTES_PER_PIXEL bytes a
+    pixel, so the peak memory is about workers * TILE_BYTES_PER_PIXEL * (tileSize + 2 * pad)**2 bytes, where the
+    pad is the blur kernel in full resolution pixels, about blur / 1111 times the image height. For 4096 pixel
+    tiles of an image shrunk by 20 that is about 470 MB a worker.
+    """
+    import cv2
+    height, width = img.shape[:2]
+    small = (height // factor, width // factor)
+    # the blurs of the shrunk image, measured in full resolution pixels
+    kernel = tuple(int(k) * factor for k in imgConv.blurKernel(blur, small))
+    edgeKernel = np.array(imgConv.blurKernel(edgeBlur, small)) * factor
+    pad = max(kernel) + 2
+    # the edges of a coarse hull are inside it shrunk by the edge blur, give or take the shrink factor, and only
+    # those are looked for, or the edges of whatever is next to the obstacle would grow it again
+    polys = geometryArray(shapely.Polygon(hull) for hull in hulls)
+    polys = shapely.buffer(polys, 2 * factor - edgeKernel.min() / 2, join_style="mitre")
+    shapely.prepare(polys)
+    boxes = np.floor(shapely.bounds(polys)).astype(np.int64) if len(polys) else np.zeros((0, 4), dtype=np.int64)
+
+    def tileEdges(tile):
+        # the full resolution edge pixels of the tile inside each hull overlapping it
+        y0, x0, y1, x1 = tile
+        near = np.flatnonzero((boxes[:, 0] < x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] < y1) & (boxes[:, 3] >= y0))
+        if len(near) == 0:
+            return {}
+        py0, px0, py1, px1 = max(0, y0 - pad), max(0, x0 - pad), min(height, y1 + pad), min(width, x1 + pad)
+        # the blur is factor times wider than on the shrunk image, so the gradients are factor times flatter and
+        # would round away in 8 bits. Each color channel is blurred on its own in 16 bits, with 7 more bits below
+        # the 8 of a pixel, and its gradients are scaled back up by the factor. Like Canny does with a color image,
+        # every pixel keeps the gradient of the channel where it is strongest, and Canny is given them directly, so
+        # it finds the edges the shrunk image has, only at full resolution
+        window = np.ascontiguousarray(img[py0:py1, px0:px1])
+        dx = dy = strongest = None
+        for c in range(window.shape[2] if window.ndim == 3 else 1):
+            plane = window[:, :, c] if window.ndim == 3 else window
+            blurred = cv2.blur((255 - plane).astype(np.int16) * 128, kernel)
+            cdx = cv2.Sobel(blurred, -1, 1, 0, ksize=3, scale=factor / 128)
+            cdy = cv2.Sobel(blurred, -1, 0, 1, ksize=3, scale=factor / 128)
+            del blurred
+            magnitude = np.abs(cdx) + np.abs(cdy)
+            if strongest is None:
+                dx, dy, strongest = cdx, cdy, magnitude
+                continue
+            stronger = magnitude > strongest
+            np.copyto(dx, cdx, where=stronger)
+            np.copyto(dy, cdy, where=stronger)
+            np.copyto(strongest, magnitude, where=stronger)
+        del window, strongest
+        edges = cv2.Canny(dx, dy, cannyLow, cannyHigh)[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+        found = {}
+        for i in near.tolist():
+            bx0, by0 = max(boxes[i, 0], x0), max(boxes[i, 1], y0)
+            bx1, by1 = min(boxes[i, 2] + 1, x1), min(boxes[i, 3] + 1, y1)
+            ys, xs = np.nonzero(edges[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0])
+            xs, ys = xs + bx0, ys + by0
+            inside = shapely.intersects_xy(polys[i], xs, ys)
+            if inside.any():
+                found[i] = np.stack([xs[inside], ys[inside]], axis=1)
+        return found
+
+    tiles = _tiles(img.shape, tileSize)
+    if workers is None:
+        tileBytes = TILE_BYTES_PER_PIXEL * (min(tileSize, height) + 2 * pad) * (min(tileSize, width) + 2 * pad)
+        workers = max(1, min(os.cpu_count() or 1, len(tiles), TILE_MEMORY_BUDGET // tileBytes))
+    with Instrumentation.stage("refineHulls", hulls=len(hulls), tiles=len(tiles), workers=workers):
+        points = [[] for _ in hulls]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for found in pool.map(tileEdges, tiles):
+                for i, pts in found.items():
+                    points[i].append(pts)
+
+        # the box the edge blur grows every edge pixel by, with the kernel anchored at its center like cv2.blur
+        lo = -(edgeKernel // 2)
+        hi = edgeKernel - 1 + lo
+        corners = np.array([(lo[0], lo[1]), (hi[0], lo[1]), (hi[0], hi[1]), (lo[0], hi[1])])
+        refined = []
+        for hull, pts in zip(hulls, points):
+            if not pts:
+                refined.append(np.asarray(hull, dtype=np.int32).reshape(-1, 2))
+                continue
+            edgeHull = cv2.convexHull(np.concatenate(pts).astype(np.int32)).reshape(-1, 2)
+            grown = (edgeHull[:, None, :] + corners[None, :, :]).reshape(-1, 2)
+            grown = np.clip(grown, 0, (width - 1, height - 1)).astype(np.int32)
+            refined.append(cv2.convexHull(grown).reshape(-1, 2))
+    return refined
+
+
+def detectLargeHulls(img, maxPixels=REFERENCE_PIXELS, refine=True, tileSize=4096, workers=None, areaThreshold=0.05,
+                     **params):
+    """
+    Finds the obstacle hulls of a large image on a shrunk copy of it, then refines them to full resolution.
+
+    Parameters:
+    img: numpy.ndarray
+    This is the image, which may be memory mapped, see openRaw().
+
+    maxPixels: int
+    This is the largest number of pixels the detection runs on. Images no larger run through prepImage and
+    makeConvexHulls as they are.
+
+    refine: bool
+    If False the hulls of the shrunk image are only scaled up, accurate to about the shrink factor in pixels.
+
+    tileSize, workers:
+    These are the size of the tiles the full resolution image is read in and the number of threads they are run
+    on, see refineHulls().
+
+    areaThreshold: float
+    This is the largest fraction of the image a hull may cover, see makeConvexHulls.
+
+    params:
+    These are the prepImage parameters blur, edgeBlur, cannyLow and cannyHigh.
+
+    Returns:
+    list[numpy.ndarray]
+    These are the hulls as (n,2) arrays of full resolution (x,y) coordinates, like makeConvexHulls returns.
+    """
+    factor = pyramidFactor(img.shape, maxPixels)
+    small = downsample(img, factor)
+    contours, hierarchy = imgConv.prepImage(small, **params)
+    hulls = imgConv.makeConvexHulls(contours, hierarchy, small, areaThreshold=areaThreshold)
+    if factor == 1:
+        return hulls
+    # a pixel of the shrunk image covers a factor x factor block, whose center is where its coordinates go
+    hulls = [np.round(hull * factor + (factor - 1) / 2).astype(np.int32) for hull in hulls]
+    if not refine:
+        return hulls
+    return refineHulls(img, hulls, factor, tileSize=tileSize, workers=workers, **params)
+
+
+def detectHulls(img, maxPixels=REFERENCE_PIXELS, tileSize=4096, workers=None, **params):
+    """
+    Like ConvexHullObstacles.detectHulls, runs the detection and the hull cleanup with the given parameters, any
+    not given being taken from DETECTION_PARAMS, but detects the hulls with detectLargeHulls().
+
+    Returns:
+    list[numpy.ndarray], the cleaned up hulls.
+    """
+    import HullCleanup
+    params = dict(imgConv.DETECTION_PARAMS, **params)
+    tolerance = params.pop("simplifyTolerance")
+    minArea = params.pop("minHullArea")
+    hulls = detectLargeHulls(img, maxPixels, tileSize=tileSize, workers=workers, **params)
+    return HullCleanup.cleanHulls(hulls, tolerance, minArea)
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Detects the obstacle hulls of a large floor plan image and prints how many were found.")
+    parser.add_argument("image", help="image file, or raw pixel file with --shape")
+    parser.add_argument("--shape", type=int, nargs="+", metavar="N", help="height, width (and channels) of a raw image file")
+    parser.add_argument("--max-pixels", type=int, default=REFERENCE_PIXELS, help="pixels of the shrunk image the detection runs on")
+    parser.add_argument("--tile-size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, help="threads the tiles are run on, by default the number of CPUs")
+    args = parser.parse_args(argv)
+
+    begin = time.perf_counter()
+    img = openRaw(args.image, args.shape) if args.shape else imgConv.getImage(args.image)
+    hulls = detectHulls(img, args.max_pixels, args.tile_size, args.workers)
+    print("%d hulls on a %dx%d image, shrunk %dx, in %.2fs" % (len(hulls), img.shape[1], img.shape[0],
+          pyramidFactor(img.shape, args.max_pixels), time.perf_counter() - begin))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+This file holds the on disk cache of built navigation meshes. Running the obstacle detection and the constrained
+Delaunay triangulation on the same classroom image always gives the same result, so the hulls and the NavMesh
+arrays are saved the first time and read back on later runs, skipping OpenCV and the CDT entirely.
+
+Each entry is a folder of uncompressed .npy files, which NumPy can memory map, named by a key made from a hash of
+the decoded pixels of the image and the detection parameters. When the cache grows past its size limit the least recently used
+entries are deleted. The distance table of a mesh, when one is precomputed, is added to its entry as two more
+files.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import ConvexHullObstacles as imgConv
+from DistanceTable import DistanceTable
+from NavMesh import NavMesh
+
+DEFAULT_CACHE_DIR = ".navmesh_cache"
+
+
+class MeshCache:
+    """
+    Size bounded, least recently used cache of navigation meshes on disk.
+
+    Parameters:
+    directory: str
+    This is the folder the entries are stored in. It is created if it doesn't exist.
+
+    maxBytes: int
+    This is the total size the entries may take up before the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, maxBytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(image, params):
+        """
+        Makes the cache key of an image and its detection parameters. The decoded pixels are hashed, with their
+        shape and dtype, so an image gets the same key whether it is passed by path or as the array read from it.
+        Reading the image is still much cheaper than the detection and triangulation a hit skips.
+
+        Parameters:
+        image: str or numpy.ndarray
+        This is either the path of the image file, which is read with ConvexHullObstacles.getImage(), or the
+        already loaded image array.
+
+        params: dict
+        These are the obstacle detection parameters, see ConvexHullObstacles.DETECTION_PARAMS.
+
+        Returns:
+        str: the hex digest identifying the entry.
+        """
+        digest = hashlib.sha256()
+        if isinstance(image, (str, os.PathLike)):
+            image = imgConv.getImage(os.fspath(image))
+        image = np.ascontiguousarray(image)
+        digest.update(str((image.shape, image.dtype.str)).encode())
+        digest.update(image.data)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entryPath(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key, mmap=True):
+        """
+        Reads an entry back from the cache.
+
+        Parameters:
+        key: str
+        This is the key of the entry, from key().
+
+        mmap: bool
+        If True the arrays are memory mapped instead of read into memory.
+
+        Returns:
+        dict or None
+        This is None if there is no entry for the key, otherwise a dict with the "shape" (height, width) of the
+        image, the obstacle "hulls" as (n,2) arrays, the "navMesh" and its "distanceTable", None if the entry has
+        none.
+        """
+        path = self._entryPath(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r" if mmap else None)
+                      for name in os.listdir(path) if name.endswith(".npy") and not name.startswith(".")}
+            hullCoords, hullOffsets = arrays.pop("hullCoords"), arrays.pop("hullOffsets")
+            shape = tuple(int(v) for v in arrays.pop("shape"))
+            navMesh = NavMesh.fromArrays(arrays)
+            distanceTable = None
+            if all(name in arrays for name in DistanceTable.ARRAY_NAMES):
+                distanceTable = DistanceTable.fromArrays(navMesh, arrays)
+        except (OSError, KeyError, ValueError):
+            # a partly written or damaged entry is treated as a miss and rebuilt
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        os.utime(path) # marks the entry as recently used
+        bounds = hullOffsets.tolist()
+        hulls = [np.array(hullCoords[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return {"shape": shape, "hulls": hulls, "navMesh": navMesh, "distanceTable": distanceTable}
+
+    def store(self, key, shape, hulls, navMesh):
+        """
+        Saves the hulls and navigation mesh of an image into the cache, then evicts old entries if the cache is
+        over its size limit.
+
+        Parameters:
+        key: str
+        This is the key of the entry, from key().
+
+        shape: tuple[int,int]
+        This is the (height, width) of the image.
+
+        hulls: list[numpy.ndarray]
+        These are the obstacle hulls of the image.
+
+        navMesh: NavMesh
+        This is the navigation mesh built from the hulls.
+        """
+        arrays = navMesh.toArrays()
+        lengths = [len(hull) for hull in hulls]
+        arrays["hullOffsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        arrays["hullCoords"] = (np.concatenate([np.asarray(hull).reshape(-1, 2) for hull in hulls]) if hulls
+                                else np.zeros((0, 2), dtype=np.int32))
+        arrays["shape"] = np.asarray(shape[:2], dtype=np.int64)
+
+        # the entry is written in a temporary folder and renamed into place, so readers never see half of it
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(arr))
+            path = self._entryPath(key)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+
+    def storeDistances(self, key, distanceTable):
+        """
+        Adds the distance table of a mesh to its entry, which must already be in the cache.
+
+        Parameters:
+        key: str
+        This is the key of the entry, from key().
+
+        distanceTable: DistanceTable
+        This is the table precomputed on the navigation mesh of the entry.
+        """
+        path = self._entryPath(key)
+        if not os.path.isdir(path):
+            return
+        # each file is written under a temporary name and renamed into place, so readers see it whole or not at all
+        for name, arr in distanceTable.toArrays().items():
+            tmp = os.path.join(path, ".tmp-" + name + ".npy")
+            np.save(tmp, np.ascontiguousarray(arr))
+            os.replace(tmp, os.path.join(path, name + ".npy"))
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        Lists the entries in the cache.
+
+        Returns:
+        list[tuple[str,float,int]]
+        This is a list of (key, last used time, size in bytes), least recently used first.
+        """
+        found = []
+        for key in os.listdir(self.directory):
+            path = self._entryPath(key)
+            if key.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            found.append((key, os.stat(path).st_mtime, size))
+        found.sort(key=lambda entry: entry[1])
+        return found
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used entries until the cache fits in maxBytes.
+
+        Parameters:
+        keep: str, optional
+        This is the key of an entry that is never deleted, such as the one just stored.
+        """
+        entries = self.entries()
+        total = sum(size for _, _, size in entries)
+        for key, _, size in entries:
+            if total <= self.maxBytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entryPath(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """
+        Deletes every entry of the cache.
+        """
+        for key, _, _ in self.entries():
+            shutil.rmtree(self._entryPath(key), ignore_errors=True)
@@ -0,0 +1,479 @@
+"""
+This file turns a planned path into the commands the robot drives: for each segment between two waypoints, turn in
+place by a signed angle to face along it, then drive its length. The robot is a differential drive (the EV3 with a
+wheel on each side), so it can turn on the spot and any path of straight segments can be followed this way.
+
+All the segments of a path are converted in one vectorized pass. The heading of each segment is the atan2 of its
+direction, and the turn is the difference between consecutive headings wrapped into [-180,180), so its sign tells
+which way to turn and the robot never turns more than half way round. Angles are in degrees in image coordinates,
+where y points down: a heading of 0 points along +x and a positive turn is clockwise on the image, a right turn for
+a robot seen from above.
+
+Commands are streamed through an asyncio queue: the path is fed in chunks, or leg by leg as the planner finds them,
+and the robot starts on the first segment while later ones are still being converted or planned.
+
+    robot = MotionCommands.SimulatedRobot(driveSpeed=20, turnSpeed=90)
+    stats = asyncio.run(MotionCommands.followPath(path, robot, scale=MotionCommands.environmentScale(env)))
+    print(stats.asDict())
+
+SimulatedRobot stands in for the EV3 to measure the latency and throughput of the pipeline without the hardware,
+and EV3Robot drives the real one through ev3dev2, which is only imported when it is made.
+"""
+
+import asyncio
+import math
+import time
+
+import numpy as np
+
+# the classroom the robot was measured in: graph_classroom.png, 396 pixels wide and 607 tall, shows a room of 23'3"
+# by 35'2", given here as (width,height) in cm
+CLASSROOM_IMAGE = "sample_classrooms/graph_classroom.png"
+CLASSROOM_SIZE = (23.25 * 30.48, 35.1666666 * 30.48)
+
+WHEEL_DIAMETER = 5.6 # cm, the EV3 wheels
+
+
+def pixelScale(imageSize, roomSize):
+    """
+    Works out the size of a pixel of a classroom image on the floor, averaged over its two axes.
+
+    Parameters:
+    imageSize: tuple[int,int]
+    This is the (width,height) of the image in pixels.
+
+    roomSize: tuple[float,float]
+    This is the (width,length) of the room the image shows, in the unit the robot drives in such as cm.
+
+    Returns:
+    float
+    This is the length of one pixel in that unit.
+    """
+    return (roomSize[0] / imageSize[0] + roomSize[1] / imageSize[1]) / 2
+
+
+def environmentScale(env, roomSize=CLASSROOM_SIZE):
+    """
+    Works out the size of a pixel of an Environment on the floor, from the size of its image.
+
+    Parameters:
+    env: Environment
+    This is the classroom the path is planned in.
+
+    roomSize: tuple[float,float]
+    This is the (width,height) of the room its image shows, the measured classroom by default.
+
+    Returns:
+    float, see pixelScale().
+    """
+    return pixelScale((env.width, env.height), roomSize)
+
+
+def wrapAngle(degrees):
+    """
+    Wraps angles in degrees into [-180,180).
+    """
+    return (np.asarray(degrees, dtype=float) + 180.0) % 360.0 - 180.0
+
+
+def pathCommands(path, scale=1.0, heading=None):
+    """
+    Converts a path into the turn and drive commands that follow it.
+
+    Parameters:
+    path: list[tuple[float,float]] or numpy.ndarray
+    These are the (x,y) waypoints of the path in pixels. Repeated waypoints are skipped, since a segment of length
+    0 has no heading.
+
+    scale: float
+    This is the length of one pixel in the unit the robot drives in, see pixelScale().
+
+    heading: float, optional
+    This is the heading the robot faces at the first waypoint. If not given it already faces along the first
+    segment, so the first turn is 0.
+
+    Returns:
+    tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+    These are the heading of each segment, its length times the scale, and the signed turn made before driving it.
+    """
+    pts = np.asarray(path, dtype=float).reshape(-1, 2)
+    seg = np.diff(pts, axis=0)
+    lengths = np.hypot(seg[:, 0], seg[:, 1])
+    moving = lengths > 0
+    seg, lengths = seg[moving], lengths[moving]
+    headings = np.degrees(np.arctan2(seg[:, 1], seg[:, 0]))
+    if len(headings) == 0:
+        return headings, lengths, headings.copy()
+    before = np.concatenate([[headings[0] if heading is None else heading], headings[:-1]])
+    return headings, lengths * scale, wrapAngle(headings - before)
+
+
+class Command:
+    """
+    One segment of a path: turn in place by turn degrees to face heading, then drive distance straight ahead.
+
+    Attributes:
+    index: int
+    This is the position of the command in the path, counting from 0.
+
+    heading, turn, distance: float
+    These are from pathCommands().
+    """
+
+    def __init__(self, index, heading, turn, distance):
+        self.index = index
+        self.heading = heading
+        self.turn = turn
+        self.distance = distance
+
+    def __repr__(self):
+        return "Command(%d, heading=%.1f, turn=%.1f, distance=%.1f)" % (self.index, self.heading, self.turn,
+                                                                        self.distance)
+
+
+class CommandStream:
+    """
+    Converts a path that arrives in chunks of waypoints into commands. The last waypoint and heading of each chunk
+    are kept, so the segment joining two chunks and the turn onto it come out as if the path had been converted in
+    one go.
+
+    Parameters:
+    scale: float
+    This is the length of one pixel in the unit the robot drives in.
+
+    heading: float, optional
+    This is the heading the robot faces at the start, see pathCommands().
+    """
+
+    def __init__(self, scale=1.0, heading=None):
+        self.scale = scale
+        self.heading = heading
+        self.last = None
+        self.count = 0
+
+    def feed(self, waypoints):
+        """
+        Returns the list of Commands of the segments ending at the given waypoints.
+        """
+        pts = np.asarray(waypoints, dtype=float).reshape(-1, 2)
+        if self.last is not None:
+            pts = np.concatenate([self.last[None], pts])
+        if len(pts) == 0:
+            return []
+        self.last = pts[-1]
+        headings, distances, turns = pathCommands(pts, self.scale, self.heading)
+        if len(headings):
+            self.heading = float(headings[-1])
+        commands = [Command(self.count + i, h, t, d) for i, (h, t, d)
+                    in enumerate(zip(headings.tolist(), turns.tolist(), distances.tolist()))]
+        self.count += len(commands)
+        return commands
+
+
+class SimulatedRobot:
+    """
+    A robot that only keeps track of where it would be, taking as long as the real one to carry out each command,
+    for testing the command pipeline without the EV3.
+
+    Parameters:
+    driveSpeed: float
+    This is the driving speed, in distance units per second.
+
+    turnSpeed: float
+    This is the turning speed, in degrees per second.
+
+    timeScale: float
+    This is the factor the durations of the motions are multiplied by, 1 for real time and 0 to carry out commands
+    without waiting at all.
+
+    position: tuple[float,float]
+    This is where the robot starts, in the unit it drives in.
+
+    heading: float
+    This is the heading it starts with, in degrees.
+
+    Attributes:
+    log: list[tuple[str,float,float,float]]
+    This is the ("turn" or "drive", amount, start time, end time) of each motion so far, in time.perf_counter()
+    seconds.
+    """
+
+    def __init__(self, driveSpeed=20.0, turnSpeed=90.0, timeScale=1.0, position=(0.0, 0.0), heading=0.0):
+        self.driveSpeed = driveSpeed
+        self.turnSpeed = turnSpeed
+        self.timeScale = timeScale
+        self.position = tuple(map(float, position))
+        self.heading = float(heading)
+        self.log = []
+
+    async def turn(self, degrees):
+        """Turns in place by a signed angle in degrees, positive clockwise on the image."""
+        started = time.perf_counter()
+        await asyncio.sleep(abs(degrees) / self.turnSpeed * self.timeScale)
+        self.heading = float(wrapAngle(self.heading + degrees))
+        self.log.append(("turn", degrees, started, time.perf_counter()))
+
+    async def drive(self, distance):
+        """Drives straight ahead."""
+        started = time.perf_counter()
+        await asyncio.sleep(abs(distance) / self.driveSpeed * self.timeScale)
+        angle = math.radians(self.heading)
+        self.position = (self.position[0] + distance * math.cos(angle), self.position[1] + distance * math.sin(angle))
+        self.log.append(("drive", distance, started, time.perf_counter()))
+
+
+class EV3Robot:
+    """
+    The EV3 robot, driven through the MoveTank of ev3dev2. Its calls block until the motors stop, so they are run
+    on a worker thread and the event loop goes on converting commands meanwhile.
+
+    Parameters:
+    leftPort, rightPort: str
+    These are the output ports of the left and right motors.
+
+    wheelDiameter: float
+    This is the diameter of the wheels, in cm.
+
+    axleTrack: float
+    This is the distance between the two wheels, in cm. Turning in place by an angle rolls each wheel that
+    fraction of the circle through both of them.
+
+    driveSpeed, turnSpeed: float
+    These are the motor speeds when driving and turning, in percent.
+
+    heading: float
+    This is the heading the robot is put down facing, in degrees on the classroom image. It is kept up to date
+    by turn(), since the motors don't know it.
+    """
+
+    def __init__(self, leftPort="outB", rightPort="outC", wheelDiameter=WHEEL_DIAMETER, axleTrack=12.0,
+                 driveSpeed=50, turnSpeed=15, heading=0.0):
+        from ev3dev2.motor import MoveTank, SpeedPercent
+
+        self._speed = SpeedPercent
+        self.tank = MoveTank(leftPort, rightPort)
+        self.wheelCircum = math.pi * wheelDiameter
+        self.axleTrack = axleTrack
+        self.driveSpeed = driveSpeed
+        self.turnSpeed = turnSpeed
+        self.heading = float(heading)
+
+    async def turn(self, degrees):
+        """Turns in place by a signed angle in degrees, positive clockwise seen from above."""
+        rotations = math.pi * self.axleTrack * abs(degrees) / 360 / self.wheelCircum
+        speed = self.turnSpeed if degrees > 0 else -self.turnSpeed # a right turn drives the left wheel forward
+        await asyncio.to_thread(self.tank.on_for_rotations, self._speed(speed), self._speed(-speed), rotations)
+        self.heading = float(wrapAngle(self.heading + degrees))
+
+    async def drive(self, distance):
+        """Drives straight ahead, distance in cm."""
+        speed = self._speed(self.driveSpeed)
+        await asyncio.to_thread(self.tank.on_for_rotations, speed, speed, distance / self.wheelCircum)
+
+
+class MotionStats:
+    """
+    The timings of one followPath() call, in seconds from when it started.
+
+    Attributes:
+    firstCommand: float
+    This is the latency until the robot started on the first command, None if there was none.
+
+    finished: float
+    This is when the robot finished the last command.
+
+    commands, distance, turned: int, float, float
+    These are the number of commands carried out, the total distance driven and the total angle turned.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.firstCommand = None
+        self.finished = 0.0
+        self.commands = 0
+        self.distance = 0.0
+        self.turned = 0.0
+
+    def asDict(self):
+        """Returns the timings with the throughput in commands per second."""
+        return {"firstCommand": self.firstCommand, "finished": self.finished, "commands": self.commands,
+                "distance": self.distance, "turned": self.turned,
+                "commandsPerSecond": self.commands / self.finished if self.finished > 0 else None}
+
+
+async def driveCommands(queue, robot, stats=None):
+    """
+    Carries out the commands of a queue on a robot, one after the other, until it gets None.
+
+    Parameters:
+    queue: asyncio.Queue
+    This is the queue of Commands.
+
+    robot: SimulatedRobot or EV3Robot
+    This is anything with async turn(degrees) and drive(distance) methods.
+
+    stats: MotionStats, optional
+    This is the timing object the commands are counted into.
+    """
+    stats = stats if stats is not None else MotionStats()
+    while True:
+        command = await queue.get()
+        if command is None:
+            break
+        if stats.firstCommand is None:
+            stats.firstCommand = time.perf_counter() - stats.started
+        if command.turn:
+            await robot.turn(command.turn)
+        await robot.drive(command.distance)
+        stats.commands += 1
+        stats.distance += command.distance
+        stats.turned += abs(command.turn)
+    stats.finished = time.perf_counter() - stats.started
+    return stats
+
+
+async def _chunks(source, chunkSize):
+    # the waypoint chunks of any of the sources followPath() takes
+    if hasattr(source, "__aiter__"):
+        async for chunk in source:
+            yield chunk
+        return
+    if isinstance(source, np.ndarray) or (isinstance(source, (list, tuple)) and source and np.ndim(source[0]) == 1):
+        pts = np.asarray(source, dtype=float).reshape(-1, 2)
+        for i in range(0, len(pts), chunkSize):
+            yield pts[i:i + chunkSize]
+        return
+    # other iterables, such as a generator planning leg after leg, are advanced on a worker thread so the robot
+    # keeps driving while the next chunk is computed
+    it = iter(source)
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, it, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+async def followPath(source, robot, scale=1.0, heading=None, chunkSize=8, maxQueued=64):
+    """
+    Streams the commands of a path to a robot, which starts on the first one as soon as it is converted.
+
+    Parameters:
+    source: list[tuple[float,float]], numpy.ndarray, or an iterable or async iterable of waypoint chunks
+    This is the path in pixels. A whole path is converted chunkSize waypoints at a time, and chunks are converted
+    as they come, such as the legs of legPaths().
+
+    robot: SimulatedRobot or EV3Robot
+    This is the robot that drives the path.
+
+    scale: float
+    This is the length of one pixel in the unit the robot drives in, see pixelScale().
+
+    heading: float, optional
+    This is the heading the robot faces at the start, the robot's own heading attribute if not given, so the
+    first command turns it onto the first segment.
+
+    chunkSize: int
+    This is the number of waypoints of a whole path converted at a time.
+
+    maxQueued: int
+    This is the number of commands converted ahead of the robot before the conversion waits for it.
+
+    Returns:
+    MotionStats
+    """
+    queue = asyncio.Queue(maxsize=maxQueued)
+    stream = CommandStream(scale, heading if heading is not None else robot.heading)
+    stats = MotionStats()
+
+    async def produce():
+        try:
+            async for chunk in _chunks(source, chunkSize):
+                for command in stream.feed(chunk):
+                    await queue.put(command)
+                await asyncio.sleep(0) # lets the robot start on the chunk before the next one is converted
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        await driveCommands(queue, robot, stats)
+    except BaseException:
+        producer.cancel()
+        raise
+    await producer # raises what the conversion raised, after the robot finished the commands before it
+    return stats
+
+
+def legPaths(planner, stops, radius=0.0):
+    """
+    Plans a route through several stops leg by leg, for followPath(), which drives each leg while the next one is
+    planned.
+
+    Parameters:
+    planner: Planner
+    This is the planner of the classroom.
+
+    stops: list[tuple[float,float]]
+    These are the (x,y) points visited in order, starting with the start point.
+
+    radius: float
+    This is the radius of the robot, see Planner.plan_smooth().
+
+    Returns:
+    generator of list[tuple[float,float]], the smoothed path of each leg.
+    """
+    for start, goal in zip(stops[:-1], stops[1:]):
+        yield planner.plan_smooth(start, goal, radius)[0]
+
+
+def main(stops=None, imagePath=CLASSROOM_IMAGE, roomSize=CLASSROOM_SIZE, scale=None, driveSpeed=20.0, turnSpeed=90.0,
+         timeScale=0.0):
+    """
+    Plans a route through a classroom image and drives it with a SimulatedRobot, printing each motion and the
+    timings of the pipeline.
+
+    Parameters:
+    stops: list[tuple[float,float]], optional
+    These are the points visited in order, from the top left to the bottom right corner of the image if not given.
+
+    imagePath: str
+    This is the classroom image, the measured classroom by default.
+
+    roomSize: tuple[float,float]
+    This is the (width,height) in cm of the room the image shows.
+
+    scale: float, optional
+    This is the length of a pixel in cm, worked out from the image size and roomSize if not given.
+    """
+    from Planner import Environment, Planner
+
+    env = Environment(imagePath)
+    if stops is None:
+        stops = [(0, 0), (env.image.shape[1], env.image.shape[0])]
+    if scale is None:
+        scale = environmentScale(env, roomSize)
+    robot = SimulatedRobot(driveSpeed, turnSpeed, timeScale)
+    stats = asyncio.run(followPath(legPaths(Planner(env), stops), robot, scale))
+    for kind, amount, started, ended in robot.log:
+        print("%-5s %8.1f" % (kind, amount))
+    print("ended at (%.1f, %.1f) facing %.1f" % (robot.position + (robot.heading,)))
+    print(stats.asDict())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plans a route through a classroom image and drives it with a simulated robot.")
+    parser.add_argument("stops", nargs="*", type=float, help="x y pairs of the points visited in order, from the top left to the bottom right corner if none are given")
+    parser.add_argument("--image", default=CLASSROOM_IMAGE, help="classroom image, the measured classroom by default")
+    parser.add_argument("--room-size", nargs=2, type=float, default=CLASSROOM_SIZE, metavar=("WIDTH", "HEIGHT"), help="size in cm of the room the image shows, the measured classroom's by default")
+    parser.add_argument("--scale", type=float, help="length of a pixel in cm, worked out from the image and room size if not given")
+    parser.add_argument("--drive-speed", type=float, default=20.0, help="driving speed in cm per second")
+    parser.add_argument("--turn-speed", type=float, default=90.0, help="turning speed in degrees per second")
+    parser.add_argument("--time-scale", type=float, default=0.0, help="factor the simulated motions are slowed down by, 1 for real time, 0 for none")
+    args = parser.parse_args()
+    if len(args.stops) % 2:
+        parser.error("stops must be x y pairs")
+    stops = list(zip(args.stops[::2], args.stops[1::2])) or None
+    main(stops, args.image, tuple(args.room_size), args.scale, args.drive_speed, args.turn_speed, args.time_scale)
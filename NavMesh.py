@@ -0,0 +1,391 @@
+"""
+This file holds the compact, array backed navigation mesh of a classroom environment. Instead of keeping the
+constrained Delaunay triangulation as Shapely polygons and the centroid graph as a networkx dict of dicts, the
+mesh stores:
+
+- vertices: a float64 (v,2) array of the triangulation vertices
+- triangles: an int32 (n,3) array of vertex indices for each triangle
+- centroids: a float64 (n,2) array of the triangle centroids
+- indptr, indices, weights: the centroid graph in CSR form, the neighbors of triangle i are
+  indices[indptr[i]:indptr[i+1]] and the distances to them are weights[indptr[i]:indptr[i+1]]
+- edgeClearance: a float64 (m,) array of the clearance of the portal of each edge, the radius of the largest
+  robot that fits through it
+
+Every step is done with vectorized NumPy operations over all triangles at once.
+"""
+
+import math
+
+import networkx as nx
+import numpy as np
+import shapely
+
+import Instrumentation
+from ObstacleIndex import ObstacleIndex
+
+
+def triangleCoords(triangles):
+    """
+    Extracts the vertex coordinates of every triangle in a triangulation at once.
+
+    Parameters:
+    triangles: shapely.geomtry.GeomtryCollection
+    A collection of triangular polygons producted by a constrained Delunay Triangulation.
+
+    Returns:
+    numpy.ndarray
+    This is a (n,3,2) array of the (x,y) coordinates of the three exterior vertices of each triangle.
+    """
+    rings = shapely.get_exterior_ring(shapely.get_parts(triangles))
+    coords = shapely.get_coordinates(rings)
+    return coords.reshape(-1, 4, 2)[:, :3, :]
+
+
+def sharedEdges(triIdx):
+    """
+    Finds the pairs of triangles sharing an edge. Every edge is turned into an integer key from its two sorted
+    vertex indices, and the keys are sorted so the two triangles on either side of an edge end up next to each other.
+    Triangles that only touch at a vertex are not paired.
+
+    Parameters:
+    triIdx: numpy.ndarray
+    This is an (n,3) integer array of the vertex indices of each triangle.
+
+    Returns:
+    tuple[numpy.ndarray, numpy.ndarray]
+    This is an (m,2) array of the (i,j) triangle index pairs with i < j, and an (m,2) array of the vertex indices
+    of the edge (the portal) shared by each pair.
+    """
+    triIdx = np.asarray(triIdx, dtype=np.int64).reshape(-1, 3)
+    edges = triIdx[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2)
+    edges.sort(axis=1)
+    owners = np.repeat(np.arange(len(triIdx)), 3)
+    keys = edges[:, 0] * (int(triIdx.max(initial=0)) + 1) + edges[:, 1]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    same = np.flatnonzero(keys[1:] == keys[:-1])
+    first = owners[order[same]]
+    second = owners[order[same + 1]]
+    pairs = np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1)
+    portals = edges[order[same]]
+    return pairs, portals
+
+
+def triangleNeighbors(triangles):
+    """
+    Finds the triangle across each edge of every triangle, where edge k of triangle t goes from vertex
+    triangles[t,k] to vertex triangles[t,(k+1)%3].
+
+    Returns:
+    numpy.ndarray
+    This is an (n,3) int array of the neighbor across each edge, -1 for edges on an obstacle or wall.
+    """
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    edges = np.sort(triangles[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1)
+    keys = edges[:, 0] * (int(triangles.max(initial=0)) + 1) + edges[:, 1]
+    order = np.argsort(keys, kind="stable")
+    same = np.flatnonzero(keys[order][1:] == keys[order][:-1])
+    first, second = order[same], order[same + 1]
+    neighbors = np.full(3 * len(triangles), -1, dtype=np.int64)
+    neighbors[first] = second // 3
+    neighbors[second] = first // 3
+    return neighbors.reshape(-1, 3)
+
+
+class _WidthSearch:
+    # the width of the passage through a triangle around one of its corners, following Demyen and Buro,
+    # "Efficient Triangulation-Based Pathfinding" (2006): the shortest of the two edges at the corner C, or the
+    # distance from C to the obstacle edges and vertices across the opposite edge, found by walking over the
+    # unconstrained edges that are closer to C than the width found so far
+
+    def __init__(self, vertices, triangles, neighbors):
+        self.pts = vertices.tolist()
+        self.tris = triangles.tolist()
+        self.nbrs = neighbors.tolist()
+
+    @staticmethod
+    def _segmentDistance(c, a, b):
+        abx, aby = b[0] - a[0], b[1] - a[1]
+        t = ((c[0] - a[0]) * abx + (c[1] - a[1]) * aby) / (abx * abx + aby * aby)
+        t = min(1.0, max(0.0, t))
+        return math.hypot(a[0] + t * abx - c[0], a[1] + t * aby - c[1])
+
+    def width(self, t, ci):
+        pts, tri = self.pts, self.tris[t]
+        c, a, b = pts[tri[ci]], pts[tri[(ci + 1) % 3]], pts[tri[(ci + 2) % 3]]
+        d = min(math.hypot(a[0] - c[0], a[1] - c[1]), math.hypot(b[0] - c[0], b[1] - c[1]))
+        # with an obtuse angle at A or B the closest point of the opposite edge to C is one of its ends
+        if ((c[0] - a[0]) * (b[0] - a[0]) + (c[1] - a[1]) * (b[1] - a[1]) <= 0 or
+                (c[0] - b[0]) * (a[0] - b[0]) + (c[1] - b[1]) * (a[1] - b[1]) <= 0):
+            return d
+        k = (ci + 1) % 3
+        if self.nbrs[t][k] < 0:
+            return min(d, self._segmentDistance(c, a, b))
+        return self._search(c, t, k, d, 0)
+
+    def _search(self, c, t, k, d, depth):
+        tri = self.tris[t]
+        ia, ib = tri[k], tri[(k + 1) % 3]
+        u = self.nbrs[t][k]
+        if depth > 64:
+            return d
+        utri = self.tris[u]
+        iv = [i for i in utri if i != ia and i != ib][0]
+        a, b, v = self.pts[ia], self.pts[ib], self.pts[iv]
+        # the far vertex only narrows the passage if it lies between the perpendiculars at the ends of the edge
+        abx, aby = b[0] - a[0], b[1] - a[1]
+        s = ((v[0] - a[0]) * abx + (v[1] - a[1]) * aby) / (abx * abx + aby * aby)
+        if 0 <= s <= 1:
+            d = min(d, math.hypot(v[0] - c[0], v[1] - c[1]))
+        for j in range(3):
+            ea, eb = utri[j], utri[(j + 1) % 3]
+            if (ea == ia or ea == ib) and (eb == ia or eb == ib):
+                continue # the edge just crossed
+            dist = self._segmentDistance(c, self.pts[ea], self.pts[eb])
+            if dist >= d:
+                continue
+            if self.nbrs[u][j] < 0:
+                d = dist
+            else:
+                d = self._search(c, u, j, d, depth + 1)
+        return d
+
+
+def portalClearance(vertices, triangles, pairs, portals, edges=None):
+    """
+    Computes the clearance of edges of the centroid graph: the radius of the largest round robot that can go
+    across the portal of the edge and on through each of its two triangles to another of their neighbors. It is
+    half the narrower of the portal and, for each triangle, the widest passage from the portal to one of the
+    triangle's other edges, see _WidthSearch. A triangle with no other neighbor only limits the robot by the
+    portal, since a path can only end in it.
+
+    The width of a passage depends on the edge the robot goes on to, which a single number per edge can't hold,
+    so a passage that is narrow towards one neighbor and wide towards the other counts as wide. The narrow one is
+    still caught on the portal or the triangles after it.
+
+    Parameters:
+    vertices: numpy.ndarray
+    This is the (v,2) array of the triangulation vertices.
+
+    triangles: numpy.ndarray
+    This is the (n,3) array of vertex indices of each triangle.
+
+    pairs, portals: numpy.ndarray
+    These are the (m,2) arrays of the triangle pair and the portal vertices of each edge.
+
+    edges: numpy.ndarray, optional
+    These are the indices of the edges to compute the clearance of, all of them if not given.
+
+    Returns:
+    numpy.ndarray, the clearance of each of the edges.
+    """
+    if edges is None:
+        edges = np.arange(len(pairs))
+    clearance = np.zeros(len(edges))
+    if len(edges) == 0:
+        return clearance
+    triangles = np.asarray(triangles)
+    neighbors = triangleNeighbors(triangles)
+    search = _WidthSearch(np.asarray(vertices), triangles, neighbors)
+    widths = {}
+
+    def passage(t, ci):
+        if (t, ci) not in widths:
+            widths[t, ci] = search.width(t, ci)
+        return widths[t, ci]
+
+    for n, e in enumerate(np.asarray(edges).tolist()):
+        p, q = portals[e].tolist()
+        u, v = vertices[p], vertices[q]
+        best = float(np.hypot(*(v - u)))
+        for t in pairs[e].tolist():
+            tri = search.tris[t]
+            # k is the portal edge of t, the passages into its other edges turn around the ends of the portal
+            k = [j for j in range(3) if {tri[j], tri[(j + 1) % 3]} == {p, q}][0]
+            exits = []
+            if search.nbrs[t][(k + 1) % 3] >= 0:
+                exits.append(passage(t, (k + 1) % 3))
+            if search.nbrs[t][(k + 2) % 3] >= 0:
+                exits.append(passage(t, k))
+            if exits:
+                best = min(best, max(exits))
+        clearance[n] = best / 2
+    return clearance
+
+
+class NavMesh:
+    """
+    Array backed navigation mesh made from the CDT of a classroom environment and its centroid graph.
+
+    Parameters:
+    vertices: numpy.ndarray
+    This is the (v,2) array of the triangulation vertices.
+
+    triangles: numpy.ndarray
+    This is the (n,3) array of vertex indices of each triangle.
+
+    pairs: numpy.ndarray
+    This is the (m,2) array of the triangle index pairs connected in the centroid graph.
+
+    portals: numpy.ndarray
+    This is the (m,2) array of vertex indices of the edge shared by each pair.
+
+    edgeClearance: numpy.ndarray, optional
+    This is the (m,) array of the clearance of each portal, from portalClearance(). It is infinite if not given.
+    """
+
+    def __init__(self, vertices, triangles, pairs, portals, edgeClearance=None):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        self.triangles = np.asarray(triangles, dtype=np.int32).reshape(-1, 3)
+        self.centroids = self.vertices[self.triangles].mean(axis=1)
+        self.pairs = np.asarray(pairs, dtype=np.int32).reshape(-1, 2)
+        self.portals = np.asarray(portals, dtype=np.int32).reshape(-1, 2)
+        self.edgeClearance = (np.full(len(self.pairs), np.inf) if edgeClearance is None
+                              else np.asarray(edgeClearance, dtype=np.float64).reshape(-1))
+        self._buildCSR()
+
+    @classmethod
+    def fromTriangles(cls, triangles, hullPts=None, obstacleIndex=None):
+        """
+        Builds the navigation mesh from a Shapely triangulation. Triangles sharing an edge are connected if the
+        segment between their centroids does not cross an obstacle boundary.
+
+        Parameters:
+        triangles: shapely.geomtry.GeomtryCollection
+        This is a collectino of triangles from the contrained Delaunay triangulation of the free space in class.
+
+        hullPts: list[list[tuple[float,float]]], optional
+        This is a list of obstacles hulls, in which each hull is represented a as a list of (x,y) coordinate tuples.
+
+        obstacleIndex: ObstacleIndex, optional
+        This is a prebuilt obstacle index for the hulls, used instead of building one from hullPts.
+
+        Returns:
+        NavMesh
+        """
+        with Instrumentation.stage("centroidGraph") as st:
+            coords = triangleCoords(triangles)
+            vertices, inverse = np.unique(coords.reshape(-1, 2), axis=0, return_inverse=True)
+            triIdx = inverse.reshape(-1, 3)
+            pairs, portals = sharedEdges(triIdx)
+
+            if obstacleIndex is None:
+                obstacleIndex = ObstacleIndex(hullPts if hullPts is not None else [])
+            centroids = coords.mean(axis=1)
+            blocked = obstacleIndex.segmentsIntersect(centroids[pairs[:, 0]], centroids[pairs[:, 1]])
+            portals = portals[~blocked]
+            pairs = pairs[~blocked]
+            mesh = cls(vertices, triIdx, pairs, portals, portalClearance(vertices, triIdx, pairs, portals))
+            st.count(triangles=len(mesh), edges=mesh.numEdges, blockedEdges=lambda: int(blocked.sum()))
+        return mesh
+
+    # names of the arrays that fully describe a mesh, as saved by toArrays and read back by fromArrays
+    ARRAY_NAMES = ("vertices", "triangles", "centroids", "pairs", "portals", "edgeWeights", "edgeClearance",
+                   "indptr", "indices", "edgeIds", "weights")
+
+    def toArrays(self):
+        """
+        Returns every array of the mesh in a dict keyed by ARRAY_NAMES, for saving the mesh to disk.
+        """
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    @classmethod
+    def fromArrays(cls, arrays):
+        """
+        Makes a mesh back from the arrays of toArrays without recomputing anything, so arrays memory mapped from
+        disk stay memory mapped.
+
+        Parameters:
+        arrays: dict[str, numpy.ndarray]
+        This is a mapping holding every array named in ARRAY_NAMES.
+
+        Returns:
+        NavMesh
+        """
+        mesh = cls.__new__(cls)
+        for name in cls.ARRAY_NAMES:
+            setattr(mesh, name, arrays[name])
+        mesh._adjLists = None
+        mesh._byClearance = {}
+        return mesh
+
+    def _buildCSR(self):
+        n = len(self.triangles)
+        diff = self.centroids[self.pairs[:, 1]] - self.centroids[self.pairs[:, 0]]
+        self.edgeWeights = np.hypot(diff[:, 0], diff[:, 1])
+
+        rows = np.concatenate([self.pairs[:, 0], self.pairs[:, 1]])
+        cols = np.concatenate([self.pairs[:, 1], self.pairs[:, 0]])
+        edgeIds = np.concatenate([np.arange(len(self.pairs))] * 2)
+        order = np.lexsort((cols, rows))
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.indptr[1:])
+        self.indices = cols[order].astype(np.int32)
+        self.edgeIds = edgeIds[order].astype(np.int32)
+        self.weights = self.edgeWeights[self.edgeIds]
+        self._adjLists = None
+        self._byClearance = {}
+
+    def __len__(self):
+        return len(self.triangles)
+
+    @property
+    def numEdges(self):
+        return len(self.pairs)
+
+    def neighbors(self, i):
+        """
+        Returns the neighbor triangle indices of triangle i and the distances to their centroids.
+        """
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.indices[lo:hi], self.weights[lo:hi]
+
+    def adjacencyLists(self):
+        """
+        Returns the centroid graph as a list, indexed by triangle, of lists of (neighbor, weight) pairs. This is
+        built from the CSR arrays on first use and kept, since plain Python lists are much faster to walk in the
+        searches than slices of NumPy arrays.
+        """
+        if self._adjLists is None:
+            nbrs = self.indices.tolist()
+            wts = self.weights.tolist()
+            bounds = self.indptr.tolist()
+            self._adjLists = [list(zip(nbrs[lo:hi], wts[lo:hi])) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return self._adjLists
+
+    def withClearance(self, radius):
+        """
+        Returns the mesh with only the edges whose portal clearance is at least radius, so the searches on it only
+        find paths a round robot of that radius fits through. The restricted meshes are kept per radius, and they
+        share the triangles and centroids of this one.
+        """
+        if radius <= 0:
+            return self
+        if radius not in self._byClearance:
+            if len(self._byClearance) >= 8:
+                self._byClearance.pop(next(iter(self._byClearance)))
+            keep = self.edgeClearance >= radius
+            mesh = NavMesh.__new__(NavMesh)
+            mesh.vertices, mesh.triangles, mesh.centroids = self.vertices, self.triangles, self.centroids
+            mesh.pairs, mesh.portals, mesh.edgeClearance = self.pairs[keep], self.portals[keep], self.edgeClearance[keep]
+            mesh._buildCSR()
+            self._byClearance[radius] = mesh
+        return self._byClearance[radius]
+
+    def triangleCoords(self):
+        """
+        Returns the (n,3,2) array of the vertex coordinates of every triangle.
+        """
+        return self.vertices[self.triangles]
+
+    def to_networkx(self):
+        """
+        Exports the centroid graph as a networkx.Graph, with the centroid coordinates stored as the 'pos' of each
+        node, and the Euclidean distances between centroids and the portal clearances as the 'weight' and
+        'clearance' of each edge.
+        """
+        graph = nx.Graph()
+        graph.add_nodes_from((i, {"pos": (x, y)}) for i, (x, y) in enumerate(self.centroids.tolist()))
+        graph.add_edges_from((i, j, {"weight": w, "clearance": c}) for (i, j), w, c in zip(
+            self.pairs.tolist(), self.edgeWeights.tolist(), self.edgeClearance.tolist()))
+        return graph
@@ -0,0 +1,150 @@
+"""
+This file holds the obstacle collision index used by the path planner. The obstacle hull boundaries are built
+once per environment, prepared, and stored in a Shapely STRtree so that whole batches of centroid segments can
+be checked against every hull in a single vectorized query.
+
+Code documentation used for the spatial index from: https://shapely.readthedocs.io/en/2.1.2/strtree.html
+"""
+
+import numpy as np
+import shapely
+
+
+def geometryArray(geometries):
+    """
+    Puts Shapely geometries into a one dimensional object array, for the vectorized shapely functions.
+
+    Parameters:
+    geometries: iterable of shapely.Geometry
+    These are the geometries, such as [shapely.Polygon(hull) for hull in hulls].
+
+    Returns:
+    numpy.ndarray
+    This is an object array with one geometry per element, of length 0 if there are none.
+    """
+    geometries = list(geometries)
+    array = np.empty(len(geometries), dtype=object)
+    for i, geometry in enumerate(geometries):
+        array[i] = geometry
+    return array
+
+
+class ObstacleIndex:
+    """
+    Spatial index over the boundaries of the obstacle hulls of one classroom environment.
+
+    Parameters:
+    hullPts: list[list[tuple[float,float]]]
+    This is the list of obstacle polygons, where each is represented as a list of (x,y) coordinate tuples.
+    """
+
+    def __init__(self, hullPts):
+        self.hullPts = hullPts
+        self._build(geometryArray(shapely.Polygon(hull) for hull in hullPts))
+
+    def _build(self, polygons):
+        self.polygons = polygons
+        self.boundaries = shapely.boundary(polygons)
+        shapely.prepare(self.boundaries)
+        self.tree = shapely.STRtree(self.boundaries)
+
+    def replaced(self, index, hull):
+        """
+        Makes the index of the hulls with one hull added, removed or replaced, reusing the polygons of the other
+        hulls instead of building them again.
+
+        Parameters:
+        index: int or None
+        This is the index of the hull to remove or replace, None to add hull at the end.
+
+        hull: list[tuple[float,float]] or None
+        This is the new hull, None to remove the hull at index.
+
+        Returns:
+        ObstacleIndex
+        """
+        hullPts = list(self.hullPts)
+        polygons = list(self.polygons)
+        if index is None:
+            hullPts.append(hull)
+            polygons.append(shapely.Polygon(hull))
+        elif hull is None:
+            del hullPts[index], polygons[index]
+        else:
+            hullPts[index] = hull
+            polygons[index] = shapely.Polygon(hull)
+        updated = ObstacleIndex.__new__(ObstacleIndex)
+        updated.hullPts = hullPts
+        updated._build(geometryArray(polygons))
+        return updated
+
+    def __len__(self):
+        return len(self.boundaries)
+
+    def segmentsIntersect(self, starts, ends):
+        """
+        Checks a whole array of line segments against the obstacle boundaries in one query.
+
+        Parameters:
+        starts: numpy.ndarray
+        This is an (n,2) array of the (x,y) start points of the segments.
+
+        ends: numpy.ndarray
+        This is an (n,2) array of the (x,y) end points of the segments.
+
+        Returns:
+        numpy.ndarray
+        This is a boolean array of length n, where True indicates the segment intersected an obstacle boundary.
+        """
+        starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+        hits = np.zeros(len(starts), dtype=bool)
+        if len(starts) == 0 or len(self.boundaries) == 0:
+            return hits
+        segments = shapely.linestrings(np.stack([starts, ends], axis=1))
+        segIdx, _ = self.tree.query(segments, predicate="intersects")
+        hits[segIdx] = True
+        return hits
+
+    def lineIntersects(self, line):
+        """
+        Checks whether a single line intersects the boundary of any obstacle polygon.
+
+        Parameters:
+        line: shapely.geomtry.LineString
+        This is the line that will be checked to see if intersection occured.
+
+        Returns:
+        boolean, where True indicates the line intersected a obstacle boundary, otherwise it returns False.
+        """
+        return len(self.tree.query(line, predicate="intersects")) > 0
+
+    def polygonsIntersecting(self, geom):
+        """
+        Finds the obstacles whose polygon intersects a geometry, for example to check that a new obstacle does not
+        overlap the existing ones.
+
+        Parameters:
+        geom: shapely.Geometry
+        This is the geometry checked against the obstacles.
+
+        Returns:
+        numpy.ndarray
+        This is an int array of the indices of the hulls intersecting geom, or touching it.
+        """
+        candidates = self.tree.query(geom)
+        return candidates[shapely.intersects(self.polygons[candidates], geom)]
+
+    def pathIntersects(self, pathCoords):
+        """
+        Checks whether any segment of a path intersects the boundary of an obstacle polygon.
+
+        Parameters:
+        pathCoords: list[tuple[float,float]]
+        This is the ordered list of (x,y) waypoints of the path.
+
+        Returns:
+        boolean, where True indicates some segment of the path intersected a obstacle boundary.
+        """
+        pts = np.asarray(pathCoords, dtype=float).reshape(-1, 2)
+        return bool(self.segmentsIntersect(pts[:-1], pts[1:]).any())
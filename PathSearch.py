@@ -0,0 +1,312 @@
+"""
+This file holds the shortest path searches used on the centroid graph. Since every node of the centroid graph is a
+triangle centroid with exact planar coordinates, the straight line distance to the goal is an admissible (and
+consistent) heuristic, which lets A* expand far fewer nodes than the plain Dijkstra search.
+
+The searches run either on a networkx centroid graph (node attribute 'pos', edge attribute 'weight') or directly
+on the CSR adjacency of a NavMesh, and they count the work they do in a SearchStats object.
+
+- astar: A* search, or Dijkstra's algorithm when no heuristic is given
+- bidirectional: bidirectional Dijkstra, or bidirectional A* with average potentials when a heuristic is given
+- distances: Dijkstra's algorithm from one node to many, giving the path lengths without the paths
+"""
+
+import heapq
+import math
+from itertools import count
+
+import networkx as nx
+
+from NavMesh import NavMesh
+
+
+class SearchStats:
+    """
+    Counters for the work done by the searches, accumulated over every search it is passed to.
+    """
+
+    def __init__(self):
+        self.searches = 0
+        self.nodesExpanded = 0
+        self.edgesRelaxed = 0
+
+    def reset(self):
+        self.__init__()
+
+    def asDict(self):
+        return {"searches": self.searches, "nodesExpanded": self.nodesExpanded, "edgesRelaxed": self.edgesRelaxed}
+
+    def __repr__(self):
+        return "SearchStats(" + ", ".join(k + "=" + str(v) for k, v in self.asDict().items()) + ")"
+
+
+def adjacency(graph):
+    """
+    Returns the adjacency of a centroid graph as a list, indexed by node, of lists of (neighbor, weight) pairs.
+
+    Parameters:
+    graph: networkx.Graph or NavMesh
+    This is the centroid graph, either exported to networkx or as the array backed NavMesh.
+
+    Returns:
+    list[list[tuple[int,float]]] for a NavMesh (built once and kept on the mesh), or a mapping with the same
+    layout for a networkx graph.
+    """
+    if isinstance(graph, NavMesh):
+        return graph.adjacencyLists()
+    return {u: [(v, d.get("weight", 1)) for v, d in nbrs.items()] for u, nbrs in graph.adj.items()}
+
+
+def positions(graph):
+    """
+    Returns the (x,y) coordinate of every node of a centroid graph, indexed by node.
+    """
+    if isinstance(graph, NavMesh):
+        return graph.centroids.tolist()
+    return {u: d["pos"] for u, d in graph.nodes(data=True)}
+
+
+def euclidean(graph):
+    """
+    Makes the straight line distance heuristic for a centroid graph.
+
+    Parameters:
+    graph: networkx.Graph or NavMesh
+    This is the centroid graph whose node coordinates are used.
+
+    Returns:
+    function(u, v) -> float, which is the Euclidean distance between the centroids of nodes u and v.
+    """
+    pos = positions(graph)
+
+    def heuristic(u, v):
+        (x1, y1), (x2, y2) = pos[u], pos[v]
+        return math.hypot(x2 - x1, y2 - y1)
+    return heuristic
+
+
+def _walkBack(pred, node):
+    path = [node]
+    while pred[path[-1]] is not None:
+        path.append(pred[path[-1]])
+    path.reverse()
+    return path
+
+
+def astar(graph, source, target, heuristic=None, stats=None, adj=None):
+    """
+    Finds the shortest path between two nodes with A* search. Without a heuristic this is Dijkstra's algorithm
+    stopping as soon as the target is expanded.
+
+    Parameters:
+    graph: networkx.Graph or NavMesh
+    This is the centroid graph to search.
+
+    source, target: int
+    These are the start and goal node indices.
+
+    heuristic: function(u, v) -> float, optional
+    This is an admissible estimate of the distance from u to v, for example euclidean(graph).
+
+    stats: SearchStats, optional
+    This is the counter object the expanded nodes and relaxed edges are added to.
+
+    adj: optional
+    This is the adjacency of the graph from adjacency(graph), passed in to avoid rebuilding it for networkx graphs.
+
+    Returns:
+    tuple[list[int], float]
+    This is the list of nodes on the shortest path and its length.
+    Raises networkx.NetworkXNoPath if the target can't be reached.
+    """
+    if adj is None:
+        adj = adjacency(graph)
+    h = heuristic if heuristic is not None else (lambda u, v: 0.0)
+    if stats is not None:
+        stats.searches += 1
+
+    tie = count()
+    dist = {source: 0.0}
+    pred = {source: None}
+    closed = set()
+    heap = [(h(source, target), next(tie), source)]
+    expanded = relaxed = 0
+    while heap:
+        _, _, u = heapq.heappop(heap)
+        if u in closed:
+            continue
+        closed.add(u)
+        expanded += 1
+        if u == target:
+            if stats is not None:
+                stats.nodesExpanded += expanded
+                stats.edgesRelaxed += relaxed
+            return _walkBack(pred, target), dist[target]
+        du = dist[u]
+        for v, w in adj[u]:
+            relaxed += 1
+            dv = du + w
+            if v not in closed and dv < dist.get(v, math.inf):
+                dist[v] = dv
+                pred[v] = u
+                heapq.heappush(heap, (dv + h(v, target), next(tie), v))
+
+    if stats is not None:
+        stats.nodesExpanded += expanded
+        stats.edgesRelaxed += relaxed
+    raise nx.NetworkXNoPath("node " + str(target) + " not reachable from " + str(source))
+
+
+def distances(graph, source, targets=None, stats=None, adj=None, pred=None):
+    """
+    Finds the shortest path lengths from one node to many with Dijkstra's algorithm, stopping once every target
+    is expanded.
+
+    Parameters:
+    graph: networkx.Graph or NavMesh
+    This is the centroid graph to search.
+
+    source: int
+    This is the start node index.
+
+    targets: iterable of int, optional
+    These are the nodes whose distance is needed. The whole component of the source is searched if not given.
+
+    stats: SearchStats, optional
+    This is the counter object the expanded nodes and relaxed edges are added to.
+
+    adj: optional
+    This is the adjacency of the graph from adjacency(graph), passed in to avoid rebuilding it for networkx graphs.
+
+    pred: dict, optional
+    This is filled with the predecessor of every expanded node on its shortest path, None for the source, so the
+    paths to the targets can be walked back from it.
+
+    Returns:
+    dict[int, float]
+    This maps every expanded node to its distance from the source. Targets that can't be reached are missing.
+    """
+    if adj is None:
+        adj = adjacency(graph)
+    if stats is not None:
+        stats.searches += 1
+    remaining = set(targets) if targets is not None else None
+
+    dist = {source: 0.0}
+    parent = {source: None}
+    done = {}
+    heap = [(0.0, source)]
+    expanded = relaxed = 0
+    while heap:
+        du, u = heapq.heappop(heap)
+        if u in done:
+            continue
+        done[u] = du
+        if pred is not None:
+            pred[u] = parent[u]
+        expanded += 1
+        if remaining is not None:
+            remaining.discard(u)
+            if not remaining:
+                break
+        for v, w in adj[u]:
+            relaxed += 1
+            dv = du + w
+            if v not in done and dv < dist.get(v, math.inf):
+                dist[v] = dv
+                parent[v] = u
+                heapq.heappush(heap, (dv, v))
+
+    if stats is not None:
+        stats.nodesExpanded += expanded
+        stats.edgesRelaxed += relaxed
+    return done
+
+
+def bidirectional(graph, source, target, heuristic=None, stats=None, adj=None):
+    """
+    Finds the shortest path between two nodes by searching forward from the source and backward from the target
+    at the same time. Without a heuristic this is bidirectional Dijkstra. With a heuristic it is bidirectional A*
+    using the average potential p(v) = (h(v,target) - h(v,source))/2, which keeps both searches consistent so the
+    usual stopping rule (the two queue tops add up to at least the best path found so far) still holds.
+
+    Parameters:
+    graph: networkx.Graph or NavMesh
+    This is the centroid graph to search. It is undirected, so the backward search uses the same adjacency.
+
+    source, target: int
+    These are the start and goal node indices.
+
+    heuristic: function(u, v) -> float, optional
+    This is an admissible and consistent estimate of the distance from u to v, for example euclidean(graph).
+
+    stats: SearchStats, optional
+    This is the counter object the expanded nodes and relaxed edges are added to.
+
+    adj: optional
+    This is the adjacency of the graph from adjacency(graph), passed in to avoid rebuilding it for networkx graphs.
+
+    Returns:
+    tuple[list[int], float]
+    This is the list of nodes on the shortest path and its length.
+    Raises networkx.NetworkXNoPath if the target can't be reached.
+    """
+    if adj is None:
+        adj = adjacency(graph)
+    if heuristic is None:
+        potential = lambda v: 0.0
+    else:
+        potential = lambda v: (heuristic(v, target) - heuristic(v, source)) / 2
+    if stats is not None:
+        stats.searches += 1
+    if source == target:
+        if stats is not None:
+            stats.nodesExpanded += 1
+        return [source], 0.0
+
+    tie = count()
+    # index 0 is the forward search from source, index 1 the backward search from target, the backward potential
+    # is the negated forward one
+    sign = (1, -1)
+    dist = ({source: 0.0}, {target: 0.0})
+    pred = ({source: None}, {target: None})
+    closed = (set(), set())
+    heaps = ([(potential(source), next(tie), source)], [(-potential(target), next(tie), target)])
+    best, meet = math.inf, None
+    expanded = relaxed = 0
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, _, u = heapq.heappop(heaps[side])
+        if u in closed[side]:
+            continue
+        closed[side].add(u)
+        expanded += 1
+        du = dist[side][u]
+        for v, w in adj[u]:
+            relaxed += 1
+            dv = du + w
+            if v not in closed[side] and dv < dist[side].get(v, math.inf):
+                dist[side][v] = dv
+                pred[side][v] = u
+                heapq.heappush(heaps[side], (dv + sign[side] * potential(v), next(tie), v))
+            other = dist[1 - side].get(v)
+            if other is not None and dv + other < best:
+                best, meet = dv + other, v
+                if side == 0:
+                    meetPred = (u, v)
+                else:
+                    meetPred = (v, u)
+
+    if stats is not None:
+        stats.nodesExpanded += expanded
+        stats.edgesRelaxed += relaxed
+    if meet is None:
+        raise nx.NetworkXNoPath("node " + str(target) + " not reachable from " + str(source))
+
+    # meetPred is the (forward, backward) edge through which the best path was found
+    forward = _walkBack(pred[0], meetPred[0])
+    backward = _walkBack(pred[1], meetPred[1])
+    backward.reverse()
+    return forward + backward, best
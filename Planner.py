@@ -0,0 +1,611 @@
+"""
+This file holds the library interface of the path planner. An Environment wraps one classroom image and builds
+every stage of the pipeline (obstacle hulls, classroom polygon, constrained Delaunay triangulation, the array
+backed navigation mesh and the networkx centroid graph) lazily the first time it is needed, and keeps the result
+for later use. A Planner answers shortest path queries against an Environment.
+
+Nothing is read, triangulated or drawn when this module is imported.
+"""
+
+import math
+from functools import cached_property
+
+import networkx as nx
+import numpy as np
+import shapely
+
+import ConvexHullObstacles as imgConv
+import Funnel
+import IncrementalMesh
+import Instrumentation
+import PathSearch
+from DistanceTable import DistanceTable
+from NavMesh import NavMesh
+from ObstacleIndex import ObstacleIndex
+from PointLocator import PointLocator
+
+# the number of chords per quarter circle of the round corners of the obstacles grown by Environment.inflated, the
+# Shapely default
+INFLATE_QUAD_SEGS = 8
+
+
+class Environment:
+    """
+    A classroom environment whose pipeline stages are computed on first use.
+
+    Parameters:
+    imagePath: str
+    This is the path of the classroom image. It is only read when the image or the hulls are first needed.
+
+    image: numpy.ndarray, optional
+    This is an already loaded classroom image, used instead of reading imagePath.
+
+    hulls: list[list[tuple[float,float]]], optional
+    These are already known obstacle hulls, used instead of running the hull detection on the image.
+
+    shape: tuple[int,int], optional
+    This is the (height, width) of the classroom, needed when hulls are given without an image.
+
+    params: dict, optional
+    These are obstacle detection parameters overriding ConvexHullObstacles.DETECTION_PARAMS.
+
+    cache: MeshCache, optional
+    This is an on disk cache of built meshes, keyed by the pixels of the image. On a hit the hulls and the NavMesh
+    are read from it and neither the obstacle detection nor the triangulation is run, on a miss they are stored
+    into it once built. It is not used when the hulls are given directly.
+    """
+
+    def __init__(self, imagePath=imgConv.DEFAULT_IMAGE_PATH, image=None, hulls=None, shape=None, params=None,
+                 cache=None):
+        self.imagePath = imagePath
+        self.params = dict(imgConv.DETECTION_PARAMS, **(params or {}))
+        self.cache = cache if hulls is None else None
+        if image is not None:
+            self.image = image
+        if hulls is not None:
+            self.hulls = hulls
+        self._shape = shape
+        self._inflated = {}
+
+    @cached_property
+    def image(self):
+        return imgConv.getImage(self.imagePath)
+
+    @cached_property
+    def cacheKey(self):
+        # the key hashes the pixels, so the image read here is kept for the detection on a miss
+        return self.cache.key(self.image, self.params)
+
+    @cached_property
+    def _cacheEntry(self):
+        # the cache entry of this environment, None if there is no cache or the entry isn't there yet
+        if self.cache is None:
+            return None
+        return self.cache.load(self.cacheKey)
+
+    @property
+    def shape(self):
+        """The (height, width) of the classroom in pixels."""
+        if self._shape is not None:
+            return tuple(self._shape[:2])
+        return self.image.shape[:2]
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    @cached_property
+    def hulls(self):
+        if self._cacheEntry is not None:
+            return self._cacheEntry["hulls"]
+        return imgConv.detectHulls(self.image, **self.params)
+
+    @cached_property
+    def polygon(self):
+        return shapely.Polygon([(0, 0), (0, self.height), (self.width, self.height), (self.width, 0)], holes=self.hulls)
+
+    @cached_property
+    def triangles(self):
+        if "navMesh" in self.__dict__ or self._cacheEntry is not None:
+            # the mesh already holds the triangulation, so it is rebuilt from the arrays instead of recomputed
+            return shapely.GeometryCollection(list(shapely.polygons(self.navMesh.triangleCoords())))
+        with Instrumentation.stage("cdt", holes=len(self.hulls)) as st:
+            triangles = shapely.constrained_delaunay_triangles(self.polygon).normalize() # the triangulation!
+            st.count(triangles=len(triangles.geoms))
+        return triangles
+
+    @cached_property
+    def obstacleIndex(self):
+        return ObstacleIndex(self.hulls)
+
+    @cached_property
+    def navMesh(self):
+        if self._cacheEntry is not None:
+            return self._cacheEntry["navMesh"]
+        navMesh = NavMesh.fromTriangles(self.triangles, obstacleIndex=self.obstacleIndex)
+        if self.cache is not None:
+            self.cache.store(self.cacheKey, self.shape, self.hulls, navMesh)
+        return navMesh
+
+    @cached_property
+    def pointLocator(self):
+        return PointLocator(self.navMesh)
+
+    @cached_property
+    def centroids(self):
+        return [tuple(cent) for cent in self.navMesh.centroids.tolist()]
+
+    @cached_property
+    def graph(self):
+        return self.navMesh.to_networkx()
+
+    @cached_property
+    def distanceTable(self):
+        # the table is only built by precompute_distances(), or read from a cache entry that has one
+        if self._cacheEntry is not None:
+            return self._cacheEntry["distanceTable"]
+        return None
+
+    def precompute_distances(self, landmarks=16, destinations=None, allPairsLimit=1000):
+        """
+        Builds the distance table of the navigation mesh, see DistanceTable.py, which the Planner then uses for
+        route cost lookups and the "alt" search. It is saved into the cache next to the mesh, and dropped when an
+        obstacle changes.
+
+        Parameters:
+        landmarks: int
+        This is the number of landmarks of a room with more than allPairsLimit triangles.
+
+        destinations: numpy.ndarray, optional
+        This is a (k,2) array of (x,y) points, such as the places robots are sent to, whose triangles get a row of
+        their own so the distance to them is a lookup.
+
+        allPairsLimit: int
+        This is the largest number of triangles for which every triangle gets a row.
+
+        Returns:
+        DistanceTable
+        """
+        seeds = () if destinations is None else self.pointLocator.snap(np.asarray(destinations, dtype=float))
+        table = DistanceTable.build(self.navMesh, landmarks, seeds, allPairsLimit)
+        self.distanceTable = table
+        if self.cache is not None:
+            self.cache.storeDistances(self.cacheKey, table)
+        return table
+
+    def inflated(self, radius):
+        """
+        Makes the environment of the configuration space of a round robot: every obstacle grown by the radius and
+        the walls moved in by it, so the robot's center can go anywhere in its free space. Planning in it keeps the
+        whole robot clear of obstacles along every edge, not only at the portals. The inflated environments of the
+        last few radii are kept, until an obstacle of this environment changes.
+
+        Parameters:
+        radius: float
+        This is the robot radius in pixels.
+
+        Returns:
+        Environment
+        """
+        if radius in self._inflated:
+            return self._inflated[radius]
+        room = shapely.box(0, 0, self.width, self.height).buffer(-radius, join_style="mitre")
+        # the round corners of the grown obstacles are cut into chords, whose middles are closer to the corner than
+        # their ends. GEOS cuts a corner turning by an angle a into round(a / step) chords, where the step is a
+        # quarter circle over INFLATE_QUAD_SEGS, so a chord spans up to 1.5 steps. Growing by the radius over the
+        # cosine of half that angle puts every chord at least the radius away
+        chordAngle = 1.5 * (math.pi / 2) / INFLATE_QUAD_SEGS
+        grown = shapely.union_all(shapely.buffer(self.obstacleIndex.polygons, radius / math.cos(chordAngle / 2),
+                                                 quad_segs=INFLATE_QUAD_SEGS))
+        free = shapely.get_parts(room.difference(grown))
+        free = free[shapely.get_type_id(free) == 3]
+        # obstacles grown into a wall become notches of the outer ring, so the rings of the free space are the
+        # obstacles of the inflated environment
+        rings = [np.asarray(ring.coords[:-1]) for part in free for ring in [part.exterior, *part.interiors]]
+        env = Environment(hulls=rings, shape=self.shape)
+        env.polygon = shapely.MultiPolygon(list(free)) if len(free) != 1 else free[0]
+
+        if len(self._inflated) >= 4:
+            self._inflated.pop(next(iter(self._inflated)))
+        self._inflated[radius] = env
+        return env
+
+    def add_obstacle(self, hull):
+        """
+        Puts a new obstacle into the classroom, triangulating again only the region around it.
+
+        Parameters:
+        hull: list[tuple[float,float]]
+        This is the hull of the obstacle as a list of (x,y) coordinate tuples. It must lie inside the classroom
+        and not touch any other obstacle.
+
+        Returns:
+        int: which is the index of the new hull in self.hulls.
+        """
+        self._replaceObstacle(None, hull)
+        return len(self.hulls) - 1
+
+    def remove_obstacle(self, index):
+        """
+        Takes an obstacle out of the classroom, triangulating again only the region around it. The hulls after it
+        move down one index.
+
+        Parameters:
+        index: int
+        This is the index of the hull in self.hulls.
+
+        Returns:
+        The hull that was removed.
+        """
+        hull = self.hulls[index]
+        self._replaceObstacle(index, None)
+        return hull
+
+    def move_obstacle(self, index, dx, dy):
+        """
+        Moves an obstacle by an offset, triangulating again only the region around its old and new position. The
+        hull keeps its index.
+
+        Parameters:
+        index: int
+        This is the index of the hull in self.hulls.
+
+        dx, dy: float
+        This is the offset the hull is moved by, in pixels.
+
+        Returns:
+        numpy.ndarray: the moved hull as an (n,2) array.
+        """
+        hull = np.asarray(self.hulls[index], dtype=float).reshape(-1, 2) + (dx, dy)
+        self._replaceObstacle(index, hull)
+        return hull
+
+    def replace_obstacle(self, index, hull):
+        """
+        Puts a new hull in place of an obstacle, for example the same obstacle detected with a slightly different
+        outline, triangulating again only the region around the old and new hull. The hull keeps its index.
+
+        Parameters:
+        index: int
+        This is the index of the hull in self.hulls.
+
+        hull: list[tuple[float,float]]
+        This is the new hull as a list of (x,y) coordinate tuples.
+        """
+        self._replaceObstacle(index, hull)
+
+    def _replaceObstacle(self, index, newHull):
+        # puts newHull in place of the hull at index, a None index adds a hull and a None newHull removes one
+        oldHull = self.hulls[index] if index is not None else None
+        if newHull is not None:
+            newHull = np.asarray(newHull, dtype=float).reshape(-1, 2)
+            poly = shapely.Polygon(newHull)
+            room = shapely.box(0, 0, self.width, self.height)
+            others = [i for i in self.obstacleIndex.polygonsIntersecting(poly).tolist() if i != index]
+            if not poly.is_valid or poly.area == 0 or not room.contains(poly) or others:
+                raise ValueError("the obstacle must be a valid polygon inside the classroom not touching another one")
+
+        with Instrumentation.stage("updateObstacle") as st:
+            obstacleIndex = self.obstacleIndex.replaced(index, newHull)
+            locator = self.pointLocator
+            patch = IncrementalMesh.replaceObstacle(self.navMesh, locator, obstacleIndex, oldHull, newHull)
+            if patch is not None:
+                st.count(retriangulated=patch.retriangulated, triangles=len(patch.changed))
+
+        # the environment no longer matches its image, so it is kept out of the cache from now on
+        self.cache = None
+        self._inflated = {}
+        for name in ("polygon", "triangles", "obstacleIndex", "navMesh", "pointLocator", "centroids"):
+            self.__dict__.pop(name, None)
+        self.hulls = obstacleIndex.hullPts
+        self.obstacleIndex = obstacleIndex
+        self.distanceTable = None
+        if patch is None:
+            # the region around the hull couldn't be triangulated on its own, so everything is rebuilt lazily
+            self.__dict__.pop("graph", None)
+            return
+        self.navMesh = patch.navMesh
+        self.pointLocator = locator.patched(patch.navMesh, patch.changed)
+        if "graph" in self.__dict__:
+            self._patchGraph(patch)
+
+    def _patchGraph(self, patch):
+        # brings the networkx centroid graph in line with a patched mesh by touching only the changed nodes
+        graph = self.graph
+        mesh = patch.navMesh
+        graph.remove_nodes_from(patch.removed.tolist())
+        changed = patch.changed.tolist()
+        graph.remove_edges_from([edge for node in changed if node in graph for edge in graph.edges(node)])
+        graph.add_nodes_from((i, {"pos": tuple(mesh.centroids[i].tolist())}) for i in changed)
+        touching = np.isin(mesh.pairs, patch.changed).any(axis=1)
+        graph.add_edges_from((i, j, {"weight": w, "clearance": c}) for (i, j), w, c in zip(
+            mesh.pairs[touching].tolist(), mesh.edgeWeights[touching].tolist(), mesh.edgeClearance[touching].tolist()))
+        for (i, j), c in zip(mesh.pairs[patch.recleared].tolist(), mesh.edgeClearance[patch.recleared].tolist()):
+            graph.edges[i, j]["clearance"] = c
+
+
+class Planner:
+    """
+    Computes shortest paths through the centroid graph of an Environment.
+
+    Parameters:
+    environment: Environment, optional
+    This is the classroom environment to plan in. The default classroom image is used if it is not given.
+
+    method: str
+    This is the search used by plan(), one of SEARCH_METHODS. "dijkstra" is the original networkx dijkstra_path
+    call, the others run on the NavMesh adjacency from PathSearch and count their work in self.stats. "alt" is A*
+    with the landmark heuristic of the environment's distance table, which is precomputed on first use if the
+    environment has none.
+    """
+
+    SEARCH_METHODS = ("dijkstra", "astar", "bidirectional", "bidirectional_astar", "alt")
+
+    def __init__(self, environment=None, method="astar"):
+        if method not in self.SEARCH_METHODS:
+            raise ValueError("unknown search method: " + str(method))
+        self.environment = environment if environment is not None else Environment()
+        self.method = method
+        self.stats = PathSearch.SearchStats()
+        self._heuristic = None
+        self._inflatedPlanner = None # plans in the inflated environment of the last radius plan_smooth was given
+
+    def add_obstacle(self, hull):
+        """
+        Adds an obstacle to the environment, see Environment.add_obstacle.
+        """
+        return self.environment.add_obstacle(hull)
+
+    def remove_obstacle(self, index):
+        """
+        Removes an obstacle from the environment, see Environment.remove_obstacle.
+        """
+        return self.environment.remove_obstacle(index)
+
+    def move_obstacle(self, index, dx, dy):
+        """
+        Moves an obstacle of the environment, see Environment.move_obstacle.
+        """
+        return self.environment.move_obstacle(index, dx, dy)
+
+    def replace_obstacle(self, index, hull):
+        """
+        Replaces an obstacle of the environment, see Environment.replace_obstacle.
+        """
+        self.environment.replace_obstacle(index, hull)
+
+    def searchNodes(self, startCent, endCent, radius=0.0):
+        """
+        Runs the configured search between two centroid graph nodes.
+
+        Parameters:
+        radius: float
+        This is the radius of the robot, only the edges whose portal clearance is at least this are used.
+
+        Returns:
+        list[int]
+        This is the list of node indices on the shortest path.
+        """
+        if self.method == "dijkstra":
+            weight = 'weight'
+            if radius > 0:
+                # networkx hides the edges for which the weight function returns None
+                weight = lambda u, v, d: d["weight"] if d["clearance"] >= radius else None
+            with Instrumentation.stage("search", method=self.method):
+                return nx.dijkstra_path(self.environment.graph, startCent, endCent, weight = weight)
+        mesh = self.environment.navMesh.withClearance(radius)
+        heuristic = None
+        if self.method == "alt":
+            # the landmark bounds of the full mesh are still lower bounds on the meshes restricted to a clearance
+            table = self.environment.distanceTable
+            if table is None:
+                table = self.environment.precompute_distances()
+            if self._heuristic is None or self._heuristic[0] is not table:
+                self._heuristic = (table, table.heuristic())
+            heuristic = self._heuristic[1]
+        elif self.method.endswith("astar"):
+            # the heuristic holds the centroid coordinates as lists, so it is only rebuilt when the mesh changes,
+            # the meshes restricted to a clearance share the centroids of the full one
+            if self._heuristic is None or self._heuristic[0] is not mesh.centroids:
+                self._heuristic = (mesh.centroids, PathSearch.euclidean(mesh))
+            heuristic = self._heuristic[1]
+        search = PathSearch.bidirectional if self.method.startswith("bidirectional") else PathSearch.astar
+        with Instrumentation.stage("search", method=self.method) as st:
+            expandedBefore = self.stats.nodesExpanded
+            shortestPath, _ = search(mesh, startCent, endCent, heuristic, self.stats)
+            st.count(nodesExpanded=self.stats.nodesExpanded - expandedBefore, pathNodes=len(shortestPath))
+        return shortestPath
+
+    def snap(self, point):
+        """
+        Finds the centroid graph node a point is planned from.
+
+        Parameters:
+        point: tuple[float,float]
+        The (x,y) coordinate of the point.
+
+        Returns:
+        int: which is the index of the triangle containing the point, or of the nearest triangle if the point is
+        inside an obstacle or outside the classroom.
+        """
+        return int(self.snapMany([point])[0])
+
+    def snapMany(self, points):
+        """
+        Finds the centroid graph nodes of many points in one vectorized call.
+
+        Parameters:
+        points: numpy.ndarray
+        This is an (n,2) array of (x,y) points.
+
+        Returns:
+        numpy.ndarray
+        This is an int array of length n with the node index of each point.
+        """
+        return self.environment.pointLocator.snap(points)
+
+    def plan(self, start, goal, radius=0.0):
+        """
+        Computes the shortest path between two points avoiding obstacle polygons, searching the centroid graph
+        from the triangle containing the start to the triangle containing the goal.
+
+        Parameters:
+        start: tuple[float,float]
+        The (x,y) coordinate of the start point.
+
+        goal: tuple[float,float]
+        The (x,y) coordinate of the goal point.
+
+        radius: float
+        This is the radius of the robot. The path only crosses portals whose clearance is at least the radius,
+        which is checked against the clearances stored on the mesh without building anything again.
+
+        Returns:
+        list[tuple[float,float]]
+        This is the ordered list of centroid coordinates from the shortest path of the two points.
+        """
+        env = self.environment
+        startCent = self.snap(start)
+        endCent = self.snap(goal)
+        shortestPath = self.searchNodes(startCent, endCent, radius)
+        return [env.centroids[n] for n in shortestPath]
+
+    def plan_smooth(self, start, goal, radius=0.0):
+        """
+        Computes the shortest path between two points like plan(), then pulls it taut through the triangle
+        corridor with the funnel algorithm, see Funnel.py.
+
+        Parameters:
+        start: tuple[float,float]
+        The (x,y) coordinate of the start point.
+
+        goal: tuple[float,float]
+        The (x,y) coordinate of the goal point.
+
+        radius: float
+        This is the radius of the robot. With a radius the path is planned and smoothed in the inflated environment
+        (see Environment.inflated), where the robot's center is a point, so every segment of it keeps the radius
+        from the obstacles and walls, provided the start and goal do.
+
+        Returns:
+        tuple[list[tuple[float,float]], list[tuple[float,float]]]
+        This is the smoothed path from start to goal, with a waypoint only where it bends around an obstacle,
+        and the centroid path it was smoothed from.
+        """
+        if radius > 0:
+            inflated = self.environment.inflated(radius)
+            planner = self._inflatedPlanner
+            if planner is None or planner.environment is not inflated or planner.method != self.method:
+                self._inflatedPlanner = Planner(inflated, self.method)
+                self._inflatedPlanner.stats = self.stats
+            return self._inflatedPlanner.plan_smooth(start, goal)
+
+        env = self.environment
+        startCent = self.snap(start)
+        endCent = self.snap(goal)
+        shortestPath = self.searchNodes(startCent, endCent)
+        with Instrumentation.stage("funnel", corridor=len(shortestPath)) as st:
+            smoothed = Funnel.smoothPath(env.navMesh, shortestPath, start, goal)
+            st.count(waypoints=len(smoothed))
+        return smoothed, [env.centroids[n] for n in shortestPath]
+
+    def plan_costs(self, start, goals, radius=0.0):
+        """
+        Computes the length of the shortest path from one point to many, without the paths, for example to find
+        the nearest of many destinations. With a distance table on the environment (see
+        Environment.precompute_distances) these are lookups whenever the start or every goal has a row, otherwise
+        a single search from the start is shared by all the goals.
+
+        Parameters:
+        start: tuple[float,float]
+        The (x,y) coordinate of the start point.
+
+        goals: numpy.ndarray
+        This is an (n,2) array of (x,y) goal points.
+
+        radius: float
+        This is the radius of the robot, see plan(). The distance table only holds the distances of the full
+        mesh, so with a radius the costs always come from a search.
+
+        Returns:
+        numpy.ndarray
+        This is the float array of the lengths of the centroid paths plan() would return to each goal, inf where
+        a goal can't be reached.
+        """
+        env = self.environment
+        goals = np.asarray(goals, dtype=float).reshape(-1, 2)
+        startCent = self.snap(start)
+        endCents = self.snapMany(goals)
+        table = env.distanceTable
+        with Instrumentation.stage("costs", goals=len(goals)):
+            if table is not None and radius <= 0:
+                return table.costs(startCent, endCents, self.stats)
+            dist = PathSearch.distances(env.navMesh.withClearance(radius), startCent, endCents.tolist(), self.stats)
+            return np.array([dist.get(n, np.inf) for n in endCents.tolist()])
+
+    def plan_many(self, pairs, radius=0.0):
+        """
+        Computes the shortest paths for many start and goal points in one call. All the points are snapped to
+        the mesh in one vectorized call, then queries are grouped by the centroid they start from, and a single
+        Dijkstra shortest path tree is grown from each distinct start centroid and shared by every query starting
+        there. The tree stops growing once every goal of its queries is reached.
+
+        Parameters:
+        pairs: list[tuple[tuple[float,float],tuple[float,float]]]
+        This is the list of (start, goal) point pairs.
+
+        radius: float
+        This is the radius of the robot, see plan().
+
+        Returns:
+        list[list[tuple[float,float]]]
+        This is the list of paths, in the same order as pairs, each being the ordered list of centroid coordinates.
+        The paths are as long as the ones plan() finds, though between paths of equal length the two may pick
+        different ones. Raises networkx.NetworkXNoPath if some goal can't be reached from its start.
+        """
+        env = self.environment
+        if len(pairs) == 0:
+            return []
+        ends = np.asarray(pairs, dtype=float).reshape(-1, 2, 2)
+        snapped = list(zip(self.snapMany(ends[:, 0]).tolist(), self.snapMany(ends[:, 1]).tolist()))
+        goals = {}
+        for startCent, endCent in snapped:
+            goals.setdefault(startCent, set()).add(endCent)
+
+        trees = {}
+        if self.method == "dijkstra":
+            # the networkx graph is searched, leaving out the edges too narrow for the robot like plan() does
+            adj = {u: [(v, d["weight"]) for v, d in nbrs.items() if radius <= 0 or d["clearance"] >= radius]
+                   for u, nbrs in env.graph.adj.items()}
+            with Instrumentation.stage("search", method=self.method, trees=len(goals)):
+                for startCent, targets in goals.items():
+                    pred = {}
+                    PathSearch.distances(env.graph, startCent, targets, self.stats, adj=adj, pred=pred)
+                    trees[startCent] = pred
+        else:
+            # the trees are grown on the CSR adjacency of the mesh, like the other search methods of plan()
+            mesh = env.navMesh.withClearance(radius)
+            adj = mesh.adjacencyLists()
+            with Instrumentation.stage("search", method="dijkstra_tree", trees=len(goals)) as st:
+                expandedBefore = self.stats.nodesExpanded
+                for startCent, targets in goals.items():
+                    pred = {}
+                    PathSearch.distances(mesh, startCent, targets, self.stats, adj=adj, pred=pred)
+                    trees[startCent] = pred
+                st.count(nodesExpanded=self.stats.nodesExpanded - expandedBefore)
+
+        paths = []
+        for startCent, endCent in snapped:
+            pred = trees[startCent]
+            if endCent not in pred:
+                raise nx.NetworkXNoPath("node " + str(endCent) + " not reachable from " + str(startCent))
+            shortestPath = [endCent]
+            while pred[shortestPath[-1]] is not None:
+                shortestPath.append(pred[shortestPath[-1]])
+            shortestPath.reverse()
+            paths.append([env.centroids[n] for n in shortestPath])
+        return paths
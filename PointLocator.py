@@ -0,0 +1,98 @@
+"""
+This file holds the point location index used to snap start and goal points onto the navigation mesh. Instead of
+picking the closest centroid, which can belong to a triangle on the other side of an obstacle, a point is snapped
+to the CDT triangle that contains it. The triangles are kept in a Shapely STRtree, and points that are not in any
+triangle (inside an obstacle or outside the classroom) fall back to the nearest triangle of the mesh.
+
+The fallback asks the same STRtree for the nearest triangle rather than keeping a KD-tree of the triangle
+centroids or vertices: the distance that matters is the one to the triangle itself, and a long thin triangle along
+an obstacle edge can be the nearest one while its centroid and corners are far away. query_nearest measures the
+true point to polygon distance, needs no second index to keep up to date when the mesh is patched, and no SciPy.
+
+Every query takes a NumPy array of points, so thousands of points are located in one vectorized call.
+"""
+
+import numpy as np
+import shapely
+
+
+class PointLocator:
+    """
+    Spatial index over the triangles of a NavMesh.
+
+    Parameters:
+    navMesh: NavMesh
+    This is the navigation mesh whose triangles the points are located in.
+    """
+
+    def __init__(self, navMesh, polygons=None):
+        self.navMesh = navMesh
+        self.polygons = shapely.polygons(navMesh.triangleCoords()) if polygons is None else polygons
+        self.tree = shapely.STRtree(self.polygons)
+
+    def patched(self, navMesh, changed):
+        """
+        Makes the locator of a mesh updated by IncrementalMesh.replaceObstacle, building polygons only for the
+        triangles that changed.
+
+        Parameters:
+        navMesh: NavMesh
+        This is the updated mesh.
+
+        changed: numpy.ndarray
+        These are the indices of the triangles of navMesh that are new or were moved.
+
+        Returns:
+        PointLocator
+        """
+        polygons = np.empty(len(navMesh), dtype=object)
+        n = min(len(navMesh), len(self.polygons))
+        polygons[:n] = self.polygons[:n]
+        polygons[changed] = shapely.polygons(navMesh.vertices[navMesh.triangles[changed]])
+        return PointLocator(navMesh, polygons)
+
+    def locate(self, points):
+        """
+        Finds the triangle containing each point. A point on an edge shared by two triangles gets the lower index.
+
+        Parameters:
+        points: numpy.ndarray
+        This is an (n,2) array of (x,y) points.
+
+        Returns:
+        numpy.ndarray
+        This is an int array of length n with the index of the triangle containing each point, or -1 if the point
+        is not in any triangle.
+        """
+        pts = shapely.points(np.asarray(points, dtype=float).reshape(-1, 2))
+        found = np.full(len(pts), -1, dtype=np.intp)
+        if len(pts) == 0 or len(self.polygons) == 0:
+            return found
+        ptIdx, triIdx = self.tree.query(pts, predicate="intersects")
+        # sorted by point and then triangle, the first hit of each point has its lowest triangle index
+        order = np.lexsort((triIdx, ptIdx))
+        ptIdx, triIdx = ptIdx[order], triIdx[order]
+        points, first = np.unique(ptIdx, return_index=True)
+        found[points] = triIdx[first]
+        return found
+
+    def snap(self, points):
+        """
+        Finds the triangle each point should be planned from: the triangle containing it, or the nearest triangle
+        for points inside an obstacle or outside the classroom.
+
+        Parameters:
+        points: numpy.ndarray
+        This is an (n,2) array of (x,y) points.
+
+        Returns:
+        numpy.ndarray
+        This is an int array of length n with a triangle index for each point.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        found = self.locate(points)
+        missing = np.flatnonzero(found < 0)
+        if len(missing) and len(self.polygons):
+            ptIdx, triIdx = self.tree.query_nearest(shapely.points(points[missing]), all_matches=False)
+            found[missing[ptIdx]] = triIdx
+        return found
@@ -0,0 +1,199 @@
+"""
+This file draws the path_progression figures of a planned classroom: the classroom polygon, its triangulation, the
+triangle centroids, the centroid graph and the shortest path. Each figure adds one layer on top of the ones before,
+like the steps of the pipeline.
+
+Every layer is a single batched call, whatever the size of the room: all the triangles go in one PolyCollection,
+all the graph edges in one LineCollection and all the centroids in one scatter, or with the OpenCV backend in one
+cv2.polylines call each, drawn straight onto the classroom image. Only the stages asked for are saved, and since
+saving the PNGs is the slow part, renderAsync() does it on a background thread while the planner goes on.
+
+Nothing is drawn unless asked for:
+
+    Rendering.renderStages(env, path, stages=["constrained_delaunay_triangulation", "shortest_path_graph"])
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import Instrumentation
+
+# the figures in the order their layers are drawn, named like the files in path_progression
+STAGES = ("classroom_setup", "constrained_delaunay_triangulation", "centroids_CDT", "centroid_graph",
+          "shortest_path_graph")
+
+BACKENDS = ("matplotlib", "opencv")
+
+_executor = None
+
+
+class Scene:
+    """
+    The arrays a set of figures is drawn from, copied out of an Environment so the figures can be drawn while the
+    environment goes on changing.
+
+    Parameters:
+    env: Environment
+    This is the planned classroom.
+
+    path: list[tuple[float,float]], optional
+    This is the path drawn in the shortest_path_graph figure, for example from Planner.plan().
+    """
+
+    def __init__(self, env, path=None):
+        mesh = env.navMesh
+        self.shape = tuple(env.shape)
+        self.hulls = [np.asarray(hull, dtype=float).reshape(-1, 2) for hull in env.hulls]
+        self.triangles = mesh.triangleCoords()
+        self.centroids = np.asarray(mesh.centroids)
+        self.edges = self.centroids[mesh.pairs]
+        self.path = np.asarray(path, dtype=float).reshape(-1, 2) if path is not None else np.zeros((0, 2))
+        self.image = env.image if "image" in env.__dict__ else None
+
+
+def _checkStages(stages):
+    stages = STAGES if stages is None else tuple(stages)
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise ValueError("unknown render stages: " + ", ".join(unknown))
+    return stages
+
+
+def _renderMatplotlib(scene, stages, outDir, dpi):
+    # the figure is made without pyplot, so nothing global is touched and it can be drawn on any thread
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection, PolyCollection
+    from matplotlib.figure import Figure
+    from matplotlib.patches import PathPatch
+    from matplotlib.path import Path
+
+    from CDTPath import makePathFriendly
+
+    height, width = scene.shape
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    axes = fig.gca()
+    axes.set_xlim(0, width)
+    axes.set_ylim(0, height)
+    last = max(STAGES.index(stage) for stage in stages)
+    saved = []
+    for stage in STAGES[:last + 1]:
+        if stage == "classroom_setup":
+            ext = [(0, 0), (0, height), (width, height), (width, 0)]
+            points, actions = makePathFriendly(ext, [hull.tolist() for hull in scene.hulls])
+            axes.add_patch(PathPatch(Path(points, actions)))
+        elif stage == "constrained_delaunay_triangulation":
+            axes.add_collection(PolyCollection(scene.triangles, facecolors="C0", edgecolors="black", linewidths=1))
+        elif stage == "centroids_CDT":
+            axes.scatter(scene.centroids[:, 0], scene.centroids[:, 1], color="pink", s=10)
+        elif stage == "centroid_graph":
+            axes.add_collection(LineCollection(scene.edges, colors="lightgray"))
+        elif stage == "shortest_path_graph":
+            axes.plot(scene.path[:, 0], scene.path[:, 1], color="red")
+            axes.scatter(scene.path[:, 0], scene.path[:, 1], color="red", s=10)
+        axes.set_xlim(0, width)
+        axes.set_ylim(0, height)
+        if stage in stages:
+            with Instrumentation.stage("render", figure=stage, backend="matplotlib"):
+                fig.savefig(os.path.join(outDir, stage + ".png"), dpi=dpi)
+            saved.append(os.path.join(outDir, stage + ".png"))
+    return saved
+
+
+def _renderOpencv(scene, stages, outDir):
+    import cv2
+
+    height, width = scene.shape
+    canvas = scene.image.copy() if scene.image is not None else np.full((height, width, 3), 255, dtype=np.uint8)
+    if canvas.ndim == 2:
+        canvas = cv2.cvtColor(canvas, cv2.COLOR_GRAY2BGR)
+
+    def lines(segments):
+        # every polyline of the layer in one call, rounded to whole pixels
+        return [np.round(seg).astype(np.int32) for seg in segments]
+
+    last = max(STAGES.index(stage) for stage in stages)
+    saved = []
+    for stage in STAGES[:last + 1]:
+        if stage == "classroom_setup":
+            cv2.fillPoly(canvas, lines(scene.hulls), (90, 90, 90))
+        elif stage == "constrained_delaunay_triangulation":
+            cv2.polylines(canvas, lines(scene.triangles), True, (180, 119, 31), 1, cv2.LINE_AA)
+        elif stage == "centroids_CDT":
+            # the centroids are stamped as 3x3 dots with array indexing instead of a circle call each
+            pts = np.round(scene.centroids).astype(np.intp)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    ys = np.clip(pts[:, 1] + dy, 0, height - 1)
+                    xs = np.clip(pts[:, 0] + dx, 0, width - 1)
+                    canvas[ys, xs] = (203, 192, 255)
+        elif stage == "centroid_graph":
+            cv2.polylines(canvas, lines(scene.edges), False, (211, 211, 211), 1, cv2.LINE_AA)
+        elif stage == "shortest_path_graph" and len(scene.path):
+            cv2.polylines(canvas, lines([scene.path]), False, (0, 0, 255), 2, cv2.LINE_AA)
+        if stage in stages:
+            with Instrumentation.stage("render", figure=stage, backend="opencv"):
+                cv2.imwrite(os.path.join(outDir, stage + ".png"), canvas)
+            saved.append(os.path.join(outDir, stage + ".png"))
+    return saved
+
+
+def renderStages(env, path=None, stages=None, outDir="path_progression", backend="matplotlib", dpi=100):
+    """
+    Draws the path_progression figures of a classroom and saves them as PNG files.
+
+    Parameters:
+    env: Environment or Scene
+    This is the planned classroom.
+
+    path: list[tuple[float,float]], optional
+    This is the path drawn in the shortest_path_graph figure. It is ignored when env is a Scene.
+
+    stages: iterable of str, optional
+    These are the figures to save, from STAGES, all of them if not given. The layers of the figures before them
+    are still drawn, since each figure builds on the ones before, but not saved.
+
+    outDir: str
+    This is the folder the PNG files are saved into, named after their stage. It is created if it doesn't exist.
+
+    backend: str
+    This is "matplotlib", for plots with axes like the original figures, or "opencv", which draws onto the
+    classroom image itself (or a white canvas when the environment has no image) and is much faster on big rooms.
+
+    dpi: int
+    This is the resolution of the matplotlib figures.
+
+    Returns:
+    list[str]
+    These are the paths of the saved files.
+    """
+    stages = _checkStages(stages)
+    if backend not in BACKENDS:
+        raise ValueError("unknown render backend: " + str(backend))
+    if not stages:
+        return []
+    scene = env if isinstance(env, Scene) else Scene(env, path)
+    os.makedirs(outDir, exist_ok=True)
+    if backend == "opencv":
+        return _renderOpencv(scene, stages, outDir)
+    return _renderMatplotlib(scene, stages, outDir, dpi)
+
+
+def renderAsync(env, path=None, stages=None, outDir="path_progression", backend="matplotlib", dpi=100):
+    """
+    Like renderStages(), but draws and saves the figures on a background thread. The arrays are copied out of the
+    environment right away, so it can be changed or planned on while the figures are drawn.
+
+    Returns:
+    concurrent.futures.Future
+    This resolves to the list of saved file paths, or raises what renderStages() raised.
+    """
+    global _executor
+    stages = _checkStages(stages)
+    scene = Scene(env, path)
+    if _executor is None:
+        # one thread, so the figures are saved in the order they were asked for
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+    return _executor.submit(renderStages, scene, None, stages, outDir, backend, dpi)
@@ -0,0 +1,279 @@
+"""
+This file holds the streaming mode of the planner, which runs the obstacle detection on a sequence of camera frames
+(a video file, a folder of images or any iterable of image arrays) and re-plans the path as the obstacles move.
+
+Most frames of a classroom camera show the same layout as the one before, so work is skipped in two steps:
+
+- FrameDiff compares a small grayscale thumbnail of each frame with the last frame the hulls were detected on, and
+  frames where no thumbnail pixel changed by more than a threshold reuse the hulls without running prepImage or
+  makeConvexHulls. Shrinking the frame averages the camera noise away, while an obstacle that moved still changes
+  the few thumbnail pixels it covers.
+- The hulls detected on the other frames are matched with the previous ones, and if none of them moved by more
+  than a tolerance the layout counts as unchanged, so the triangulation and the path are reused as well.
+
+When only a few hulls moved they are updated in place with Environment.replace_obstacle, which triangulates
+again just the region around each of them.
+
+    for index, path, replanned in Streaming.streamPaths("hallway.mp4", start=(0, 0), goal=(800, 600)):
+        ...
+"""
+
+import os
+import time
+
+import networkx as nx
+import numpy as np
+import shapely
+
+import ConvexHullObstacles as imgConv
+import Instrumentation
+from ObstacleIndex import geometryArray
+from Planner import Environment, Planner
+
+
+def readFrames(source):
+    """
+    Reads the frames of a video file or a folder of images one at a time.
+
+    Parameters:
+    source: str or iterable
+    This is the path of a video file, the path of a folder whose images are read in name order, or an iterable
+    of already loaded image arrays which is passed through.
+
+    Returns:
+    generator of numpy.ndarray, the BGR frames.
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        yield from source
+        return
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(imgConv.IMAGE_EXTENSIONS):
+                yield imgConv.getImage(os.path.join(source, name))
+        return
+
+    import cv2
+    capture = cv2.VideoCapture(os.fspath(source))
+    if not capture.isOpened():
+        raise FileNotFoundError("could not open video: " + str(source))
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+class FrameDiff:
+    """
+    Cheap check of whether a frame differs from the last one the obstacles were detected on.
+
+    Parameters:
+    size: int
+    This is the width and height in pixels of the grayscale thumbnails the frames are compared on.
+
+    threshold: float
+    This is the difference in gray levels a thumbnail pixel must change by for the frame to count as changed.
+    """
+
+    def __init__(self, size=64, threshold=8.0):
+        self.size = size
+        self.threshold = threshold
+        self.reference = None
+
+    def thumbnail(self, frame):
+        import cv2
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def changed(self, frame):
+        """
+        Checks a frame against the reference frame. A changed frame becomes the new reference, so a slow drift
+        over many frames is still noticed once it adds up to the threshold.
+
+        Returns:
+        bool: True if the frame differs from the reference or there is no reference yet.
+        """
+        thumb = self.thumbnail(frame)
+        if self.reference is not None and self.reference.shape == thumb.shape:
+            if float(np.abs(thumb - self.reference).max()) <= self.threshold:
+                return False
+        self.reference = thumb
+        return True
+
+
+def matchHulls(oldHulls, newHulls):
+    """
+    Pairs every old hull with the new hull whose centroid is closest to its own.
+
+    Parameters:
+    oldHulls, newHulls: list[list[tuple[float,float]]]
+    These are the hulls of two frames.
+
+    Returns:
+    numpy.ndarray or None
+    This is an int array where entry i is the index of the new hull matched to old hull i, or None if the number
+    of hulls changed or two old hulls were matched to the same new one.
+    """
+    if len(oldHulls) != len(newHulls):
+        return None
+    if len(oldHulls) == 0:
+        return np.zeros(0, dtype=np.intp)
+    oldCents = np.array([np.asarray(hull, dtype=float).reshape(-1, 2).mean(axis=0) for hull in oldHulls])
+    newCents = np.array([np.asarray(hull, dtype=float).reshape(-1, 2).mean(axis=0) for hull in newHulls])
+    # a room holds at most a few hundred obstacles, so the full distance matrix is small
+    dists = np.linalg.norm(oldCents[:, None, :] - newCents[None, :, :], axis=2)
+    order = dists.argmin(axis=1)
+    if len(np.unique(order)) != len(order):
+        return None
+    return order
+
+
+def movedHulls(oldHulls, newHulls, order, tolerance):
+    """
+    Finds the old hulls that moved or changed shape by more than a tolerance, measured as the Hausdorff distance
+    to the new hull matched to them, so a hull whose vertices start at another point counts as unchanged.
+
+    Returns:
+    numpy.ndarray, the indices of the old hulls that moved.
+    """
+    if len(oldHulls) == 0:
+        return np.zeros(0, dtype=np.intp)
+    old = geometryArray(shapely.Polygon(hull) for hull in oldHulls)
+    new = geometryArray(shapely.Polygon(newHulls[i]) for i in order)
+    return np.flatnonzero(shapely.hausdorff_distance(old, new) > tolerance)
+
+
+def streamHulls(frames, params=None, diffThreshold=8.0, tolerance=2.0):
+    """
+    Detects the obstacle hulls of every frame of a stream, skipping the detection on frames that look like the
+    last one it ran on.
+
+    Parameters:
+    frames: str or iterable
+    This is a video file, a folder of images or an iterable of image arrays, see readFrames().
+
+    params: dict, optional
+    These are obstacle detection parameters overriding ConvexHullObstacles.DETECTION_PARAMS.
+
+    diffThreshold: float
+    This is the FrameDiff threshold below which the detection is skipped.
+
+    tolerance: float
+    This is the distance in pixels every hull may move by while the layout still counts as unchanged.
+
+    Returns:
+    generator of tuple[int, numpy.ndarray, list, bool]
+    This yields the index of each frame, the frame, its hulls and whether the layout changed since the last frame.
+    Frames with an unchanged layout get the very same hull list as the frame before.
+    """
+    params = params or {}
+    diff = FrameDiff(threshold=diffThreshold)
+    hulls = None
+    for index, frame in enumerate(readFrames(frames)):
+        with Instrumentation.stage("frame") as st:
+            changed = False
+            if diff.changed(frame):
+                detected = imgConv.detectHulls(frame, **params)
+                order = matchHulls(hulls, detected) if hulls is not None else None
+                if order is None or len(movedHulls(hulls, detected, order, tolerance)):
+                    hulls = detected
+                    changed = True
+                st.count(detected=1)
+            st.count(changed=int(changed))
+        yield index, frame, hulls, changed
+
+
+def updateEnvironment(env, hulls, shape, tolerance=2.0, maxLocalUpdates=8):
+    """
+    Brings an environment up to date with newly detected hulls. If the hulls can be matched with the ones of the
+    environment and at most maxLocalUpdates of them moved, they are replaced in place, otherwise a new environment
+    is made.
+
+    Returns:
+    Environment, which is env itself when it was updated in place.
+    """
+    if env is not None and tuple(env.shape) == tuple(shape[:2]):
+        order = matchHulls(env.hulls, hulls)
+        if order is not None:
+            moved = movedHulls(env.hulls, hulls, order, tolerance)
+            if len(moved) <= maxLocalUpdates:
+                try:
+                    for i in moved.tolist():
+                        env.replace_obstacle(i, hulls[order[i]])
+                    return env
+                except ValueError:
+                    pass # the hulls overlapped part way through the updates, so the environment is made again
+    return Environment(hulls=list(hulls), shape=shape[:2])
+
+
+def streamPaths(frames, start, goal, method="astar", params=None, diffThreshold=8.0, tolerance=2.0,
+                maxLocalUpdates=8):
+    """
+    Plans the path between two points on every frame of a stream, re-planning only when the obstacle layout
+    changed. See streamHulls() for frames, params, diffThreshold and tolerance.
+
+    Parameters:
+    start: tuple[float,float]
+    The (x,y) coordinate of the start point.
+
+    goal: tuple[float,float]
+    The (x,y) coordinate of the goal point.
+
+    method: str
+    This is the search method of the Planner, see Planner.SEARCH_METHODS.
+
+    maxLocalUpdates: int
+    This is the largest number of moved hulls updated in place before the environment is built again instead.
+
+    Returns:
+    generator of tuple[int, list[tuple[float,float]] or None, bool]
+    This yields the index of each frame, its path as a list of centroid coordinates (None if the goal can't be
+    reached) and whether the path was planned again on this frame.
+    """
+    env = None
+    planner = None
+    path = None
+    for index, frame, hulls, changed in streamHulls(frames, params, diffThreshold, tolerance):
+        if env is not None and not changed:
+            yield index, path, False
+            continue
+        updated = updateEnvironment(env, hulls, frame.shape, tolerance, maxLocalUpdates)
+        if updated is not env:
+            env = updated
+            planner = Planner(env, method)
+        try:
+            path = planner.plan(start, goal)
+        except nx.NetworkXNoPath:
+            path = None
+        yield index, path, True
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plans a path on every frame of a video or folder of classroom images, re-planning only when the obstacles move.")
+    parser.add_argument("source", help="video file or folder of images")
+    parser.add_argument("--start", type=float, nargs=2, default=(0, 0), metavar=("X", "Y"))
+    parser.add_argument("--goal", type=float, nargs=2, required=True, metavar=("X", "Y"))
+    parser.add_argument("--method", default="astar", choices=Planner.SEARCH_METHODS)
+    parser.add_argument("--diff-threshold", type=float, default=8.0, help="gray level change of the frame thumbnails below which a frame is skipped")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="distance in pixels a hull may move without re-planning")
+    args = parser.parse_args(argv)
+
+    frames = replanned = 0
+    begin = time.perf_counter()
+    for index, path, changed in streamPaths(args.source, tuple(args.start), tuple(args.goal), args.method,
+                                            diffThreshold=args.diff_threshold, tolerance=args.tolerance):
+        frames += 1
+        replanned += changed
+        if changed:
+            print("frame", index, "re-planned:", "no path" if path is None else str(len(path)) + " waypoints")
+    elapsed = time.perf_counter() - begin
+    print(frames, "frames,", replanned, "re-planned,", round(frames / elapsed, 1) if elapsed else 0, "frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Checks the hierarchical planner of Building.py on a small building of three rooms.
+"""
+
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Building import Building
+from Planner import Environment
+
+
+def box(x, y, w, h):
+    return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+
+
+@pytest.fixture
+def building():
+    building = Building()
+    building.add_room("A", Environment(hulls=[box(50, 20, 30, 60)], shape=(100, 200)))
+    building.add_room("hall", Environment(hulls=[box(100, 40, 100, 20)], shape=(100, 300)), origin=(200, 0))
+    building.add_room("C", Environment(hulls=[], shape=(100, 200)), origin=(500, 0))
+    building.add_doorway("A", "hall", (200, 50), width=20)
+    building.add_doorway("hall", "C", (500, 20), width=30)
+    building.add_doorway("hall", "C", (500, 90), width=8)
+    return building
+
+
+def test_route_goes_through_doorways(building):
+    legs, _ = building.route((10, 50), (690, 50))
+    assert [name for name, _, _ in legs] == ["A", "hall", "C"]
+    path = building.plan((10, 50), (690, 50))
+    assert path[0] == (10.0, 50.0) and path[-1] == (690.0, 50.0)
+    assert (200.0, 50.0) in path and (500.0, 20.0) in path
+
+
+def test_narrow_doorways_are_skipped(building):
+    legs, _ = building.route((10, 50), (690, 50), radius=5)
+    assert (500.0, 90.0) not in [b for _, _, b in legs]
+    with pytest.raises(nx.NetworkXNoPath):
+        building.route((10, 50), (690, 50), radius=20)
+
+
+def test_rebuild_keeps_other_rooms(building):
+    building.route((10, 50), (690, 50))
+    costs = dict(building._costs)
+    building.rebuild_room("C", Environment(hulls=[box(20, 1, 20, 98)], shape=(100, 200)))
+    building.route((10, 50), (690, 50))
+    assert building._costs["A"] is costs["A"] and building._costs["hall"] is costs["hall"]
+    assert building._costs["C"] is not costs["C"]
+
+
+def test_rejected_rebuild_leaves_the_old_room(building):
+    building.route((10, 50), (690, 50))
+    old, oldCosts = building.rooms["C"], building._costs["C"]
+    with pytest.raises(ValueError):
+        building.rebuild_room("C", Environment(hulls=[], shape=(50, 50)))
+    assert building.rooms["C"] is old
+    assert building._costs["C"] is oldCosts
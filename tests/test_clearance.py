@@ -0,0 +1,57 @@
+"""
+Checks the planning for a round robot of Planner.py: the portal clearances the search keeps to, and the inflated
+environment of Environment.inflated.
+"""
+
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Benchmark
+import Funnel
+from Planner import Environment, Planner
+
+
+@pytest.fixture(scope="module")
+def env():
+    _, hulls = Benchmark.randomRoom(400, seed=0)
+    return Environment(hulls=hulls, shape=(400, 400))
+
+
+@pytest.fixture(scope="module")
+def pairs(env):
+    rng = np.random.default_rng(1)
+    obstacles = shapely.union_all([shapely.Polygon(hull) for hull in env.hulls])
+    points = [tuple(p) for p in rng.random((200, 2)) * 400 if not obstacles.intersects(shapely.Point(p))]
+    return list(zip(points[::2], points[1::2]))
+
+
+@pytest.mark.parametrize("radius", [3.0, 6.0, 10.0])
+def test_plan_only_crosses_portals_wide_enough(env, pairs, radius):
+    mesh = env.navMesh
+    node = {tuple(c): i for i, c in enumerate(mesh.centroids.tolist())}
+    planner = Planner(env)
+    for start, goal in pairs:
+        try:
+            path = planner.plan(start, goal, radius)
+        except nx.NetworkXNoPath:
+            continue
+        nodes = [node[tuple(c)] for c in np.asarray(path).tolist()]
+        assert all(env.graph.edges[u, v]["clearance"] >= radius for u, v in zip(nodes[:-1], nodes[1:]))
+        left, right = Funnel.corridorPortals(mesh, nodes)
+        assert (np.hypot(*(right - left).T) >= 2 * radius).all()
+
+
+@pytest.mark.parametrize("radius", [3.0, 6.0, 10.0])
+def test_inflated_keeps_radius_from_obstacles(env, radius):
+    free = env.inflated(radius).polygon
+    obstacles = shapely.union_all([shapely.Polygon(hull) for hull in env.hulls])
+    walls = shapely.box(0, 0, 400, 400).exterior
+    assert free.distance(obstacles) >= radius - 1e-9
+    assert free.distance(walls) >= radius - 1e-9
@@ -0,0 +1,121 @@
+"""
+Checks the local obstacle updates of IncrementalMesh.py against a full rebuild of the same classroom.
+"""
+
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+import shapely
+import shapely.affinity
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import IncrementalMesh
+from Planner import Environment, Planner
+
+
+def box(x, y, w, h):
+    return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+
+
+def desk(x, y, w, h, rng):
+    # a box turned by a random angle, so no four vertices of the classroom lie on one circle and its constrained
+    # Delaunay triangulation is unique
+    poly = shapely.affinity.rotate(shapely.Polygon(box(x, y, w, h)), rng.uniform(-20, 20))
+    return np.asarray(poly.exterior.coords[:-1]).tolist()
+
+
+def pathLength(path):
+    pts = np.asarray(path, dtype=float)
+    return float(np.hypot(*np.diff(pts, axis=0).T).sum())
+
+
+def updates():
+    # a grid of desks, then a stream of updates applied locally, yielding the classroom after each one
+    rng = np.random.default_rng(0)
+    env = Environment(hulls=[desk(x + rng.uniform(0, 8), y + rng.uniform(0, 8), 30, 20, rng)
+                             for x in range(40, 560, 90) for y in range(40, 360, 70)], shape=(400, 600))
+    env.navMesh
+    for step in range(40):
+        index = int(rng.integers(len(env.hulls)))
+        try:
+            if step % 3 == 0:
+                env.add_obstacle(desk(*(rng.random(2) * (540, 340) + 20), 12, 12, rng))
+            elif step % 3 == 1:
+                env.remove_obstacle(index)
+            else:
+                env.move_obstacle(index, *rng.uniform(-4, 4, 2))
+        except ValueError:
+            continue # an obstacle dropped onto another one is refused
+        yield env
+
+
+@pytest.fixture
+def updated():
+    for env in updates():
+        pass
+    return env
+
+
+def triangleSet(env):
+    # the triangles by their corner coordinates, which don't depend on the indices of the triangles or vertices
+    mesh = env.navMesh
+    return {tuple(sorted(map(tuple, mesh.vertices[tri].tolist()))) for tri in mesh.triangles}
+
+
+def edgeSet(env):
+    # the centroid graph edges by their portal coordinates, with their weight and clearance
+    mesh = env.navMesh
+    return {(tuple(sorted(map(tuple, mesh.vertices[portal].tolist()))), round(w, 9), round(c, 9))
+            for portal, w, c in zip(mesh.portals, mesh.edgeWeights.tolist(), mesh.edgeClearance.tolist())}
+
+
+def freeArea(env):
+    return sum(shapely.Polygon(tri).area for tri in env.navMesh.triangleCoords())
+
+
+def test_area_matches_full_rebuild(updated):
+    rebuilt = Environment(hulls=updated.hulls, shape=updated.shape)
+    assert freeArea(updated) == pytest.approx(freeArea(rebuilt))
+    assert freeArea(updated) == pytest.approx(rebuilt.polygon.area)
+
+
+def assertSamePaths(updated, rebuilt, queries):
+    local, full = Planner(updated), Planner(rebuilt)
+    rng = np.random.default_rng(1)
+    obstacles = shapely.union_all([shapely.Polygon(hull) for hull in updated.hulls])
+    points = [tuple(p) for p in rng.random((2 * queries, 2)) * (600, 400)
+              if not obstacles.intersects(shapely.Point(p).buffer(1))]
+    for start, goal in zip(points[::2], points[1::2]):
+        try:
+            smoothed, centroidPath = full.plan_smooth(start, goal)
+        except nx.NetworkXNoPath:
+            with pytest.raises(nx.NetworkXNoPath):
+                local.plan_smooth(start, goal)
+            continue
+        localSmoothed, localCentroidPath = local.plan_smooth(start, goal)
+        assert pathLength(localCentroidPath) == pytest.approx(pathLength(centroidPath), rel=1e-9)
+        assert pathLength(localSmoothed) == pytest.approx(pathLength(smoothed), rel=1e-9)
+
+
+def test_every_update_matches_full_rebuild():
+    for env in updates():
+        rebuilt = Environment(hulls=env.hulls, shape=env.shape)
+        assert triangleSet(env) == triangleSet(rebuilt)
+        assert edgeSet(env) == edgeSet(rebuilt)
+        assertSamePaths(env, rebuilt, 20)
+
+
+def test_path_lengths_match_full_rebuild(updated):
+    assertSamePaths(updated, Environment(hulls=updated.hulls, shape=updated.shape), 200)
+
+
+def test_unused_vertices_are_compacted(updated):
+    mesh = updated.navMesh
+    used = np.zeros(len(mesh.vertices), dtype=bool)
+    used[mesh.triangles] = True
+    assert (~used).sum() <= IncrementalMesh.COMPACT_SLACK * len(mesh.vertices)
+    assert mesh.portals.max() < len(mesh.vertices)
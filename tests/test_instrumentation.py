@@ -0,0 +1,35 @@
+"""
+Checks the stage recording of Instrumentation.py when stages are open on several threads at once.
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Instrumentation
+
+
+def test_stages_of_other_threads_do_not_nest_into_the_main_thread():
+    recorder = Instrumentation.enable(profile=True, traceMemory=True)
+    entered, mainDone = threading.Event(), threading.Event()
+
+    def worker():
+        with Instrumentation.stage("render"):
+            entered.set()
+            mainDone.wait(5)
+
+    thread = threading.Thread(target=worker)
+    try:
+        with Instrumentation.stage("search"):
+            thread.start()
+            entered.wait(5)
+        # the outermost stage of the main thread is over, so its profiler is off again
+        assert sys.getprofile() is None
+        mainDone.set()
+        thread.join(5)
+    finally:
+        mainDone.set()
+        Instrumentation.disable()
+    assert [record["stage"] for record in recorder.records] == ["search", "render"]
@@ -0,0 +1,54 @@
+"""
+Checks every search method of Planner.py against the networkx Dijkstra search of the centroid graph.
+"""
+
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Planner import Environment, Planner
+
+
+def box(x, y, w, h):
+    return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+
+
+@pytest.fixture(scope="module")
+def env():
+    # desks of a few sizes, so the gaps between them have different clearances
+    return Environment(hulls=[box(x, y, 20 + x % 30, 15 + y % 20) for x in range(30, 560, 70)
+                              for y in range(30, 360, 55)], shape=(400, 600))
+
+
+@pytest.fixture(scope="module")
+def queries(env):
+    rng = np.random.default_rng(0)
+    nodes = rng.integers(len(env.navMesh), size=(60, 2))
+    return [(int(a), int(b)) for a, b in nodes]
+
+
+def nodePathLength(graph, nodes):
+    return sum(graph.edges[u, v]["weight"] for u, v in zip(nodes[:-1], nodes[1:]))
+
+
+@pytest.mark.parametrize("method", Planner.SEARCH_METHODS)
+@pytest.mark.parametrize("radius", [0.0, 15.0, 22.0])
+def test_search_matches_networkx_dijkstra(env, queries, method, radius):
+    planner = Planner(env, method=method)
+    weight = lambda u, v, d: d["weight"] if d["clearance"] >= radius else None
+    for startCent, endCent in queries:
+        try:
+            expected = nx.dijkstra_path_length(env.graph, startCent, endCent, weight=weight)
+        except nx.NetworkXNoPath:
+            with pytest.raises(nx.NetworkXNoPath):
+                planner.searchNodes(startCent, endCent, radius)
+            continue
+        nodes = planner.searchNodes(startCent, endCent, radius)
+        assert nodes[0] == startCent and nodes[-1] == endCent
+        assert all(env.graph.edges[u, v]["clearance"] >= radius for u, v in zip(nodes[:-1], nodes[1:]))
+        assert nodePathLength(env.graph, nodes) == pytest.approx(expected, rel=1e-9, abs=1e-9)
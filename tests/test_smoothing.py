@@ -0,0 +1,61 @@
+"""
+Checks the paths Planner.plan_smooth pulls taut with the funnel algorithm of Funnel.py.
+"""
+
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Benchmark
+from Planner import Environment, Planner
+
+
+@pytest.fixture(scope="module")
+def env():
+    _, hulls = Benchmark.randomRoom(400, seed=0)
+    return Environment(hulls=hulls, shape=(400, 400))
+
+
+def freePoints(env, clearance, count, seed):
+    # random points at least the clearance away from every obstacle and wall
+    rng = np.random.default_rng(seed)
+    blocked = shapely.union_all([shapely.Polygon(hull) for hull in env.hulls] + [shapely.box(0, 0, 400, 400).exterior])
+    points = [tuple(p) for p in rng.random((4 * count, 2)) * 400
+              if blocked.distance(shapely.Point(p)) > clearance]
+    return points[:count]
+
+
+def test_smoothed_path_stays_in_free_space(env):
+    planner = Planner(env)
+    points = freePoints(env, 0.0, 200, 1)
+    free = env.polygon.buffer(1e-6)
+    for start, goal in zip(points[::2], points[1::2]):
+        path, _ = planner.plan_smooth(start, goal)
+        assert path[0] == start and path[-1] == goal
+        assert free.covers(shapely.LineString(path))
+
+
+@pytest.mark.parametrize("radius", [3.0, 6.0, 10.0])
+def test_smoothed_path_keeps_radius_clearance(env, radius):
+    planner = Planner(env)
+    points = freePoints(env, radius, 200, 2)
+    obstacles = shapely.union_all([shapely.Polygon(hull) for hull in env.hulls])
+    walls = shapely.box(0, 0, 400, 400).exterior
+    planned = 0
+    for start, goal in zip(points[::2], points[1::2]):
+        try:
+            path, _ = planner.plan_smooth(start, goal, radius)
+        except nx.NetworkXNoPath:
+            continue
+        planned += 1
+        line = shapely.LineString(path)
+        assert path[0] == start and path[-1] == goal
+        assert line.distance(obstacles) >= radius - 1e-6
+        assert line.distance(walls) >= radius - 1e-6
+    assert planned > 0